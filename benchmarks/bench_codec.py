@@ -0,0 +1,157 @@
+"""
+JSON codec benchmark: `snlite.codec` against the stdlib calls it replaced.
+
+    python -m benchmarks.bench_codec --sessions 200 --messages 40 --out codec.json
+
+Cases follow the hot paths:
+
+- sse_token: one streamed `content` event (short token, CJK included)
+- ndjson_line: one Ollama stream line, parsed from bytes
+- snapshot_encode / snapshot_decode: one full session log record (see
+  `benchmarks.synth`), to and from bytes
+
+Each case reports the best-of-`repeat` time per operation (microseconds)
+for the old code and for the codec, and the speedup. The codec backend
+(orjson or stdlib json) is part of the report (format
+"snlite.bench.codec.v1"); run it with and without orjson installed to see
+what the optional dependency buys.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import sys
+import time
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.synth import SynthSpec, make_sessions
+from snlite import codec
+
+TOKENS = ("The", " session", " 日志", " is", " 压缩", " again", ".", "\n\n", " 检索", " ok")
+
+
+def _per_op_us(fn: Callable[[], Any], number: int, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, time.perf_counter() - t0)
+    return best / number * 1e6
+
+
+def _case(old: Callable[[], Any], new: Callable[[], Any], number: int, repeat: int) -> Dict[str, Any]:
+    old_us = _per_op_us(old, number, repeat)
+    new_us = _per_op_us(new, number, repeat)
+    return {
+        "stdlib_us": round(old_us, 3),
+        "codec_us": round(new_us, 3),
+        "speedup": round(old_us / new_us, 2) if new_us else None,
+    }
+
+
+def run(spec: SynthSpec, number: int, repeat: int) -> Dict[str, Any]:
+    sessions = make_sessions(spec)
+    lines = [codec.dump_line(sess) for sess in sessions]
+    ndjson = [
+        codec.dumpb({
+            "model": "qwen3:4b",
+            "created_at": "2025-01-01T00:00:00.000000Z",
+            "message": {"role": "assistant", "content": tok},
+            "done": False,
+        })
+        for tok in TOKENS
+    ]
+
+    def cycle(items: List[Any]) -> Callable[[], Any]:
+        state = {"i": 0}
+
+        def nxt() -> Any:
+            state["i"] = (state["i"] + 1) % len(items)
+            return items[state["i"]]
+
+        return nxt
+
+    tok, tok2 = cycle(list(TOKENS)), cycle(list(TOKENS))
+    nd, nd2 = cycle(ndjson), cycle(ndjson)
+    sess, sess2 = cycle(sessions), cycle(sessions)
+    line, line2 = cycle(lines), cycle(lines)
+    snapshot_number = max(1, number // 100)
+
+    cases = {
+        "sse_token": _case(
+            lambda: f"event: content\ndata: {json.dumps({'token': tok()}, ensure_ascii=False)}\n\n".encode("utf-8"),
+            lambda: codec.sse("content", {"token": tok2()}),
+            number,
+            repeat,
+        ),
+        "ndjson_line": _case(
+            lambda: json.loads(nd().decode("utf-8")),
+            lambda: codec.loads(nd2()),
+            number,
+            repeat,
+        ),
+        "snapshot_encode": _case(
+            lambda: (json.dumps(sess(), ensure_ascii=False) + "\n").encode("utf-8"),
+            lambda: codec.dump_line(sess2()),
+            snapshot_number,
+            repeat,
+        ),
+        "snapshot_decode": _case(
+            lambda: json.loads(line().decode("utf-8")),
+            lambda: codec.loads(line2()),
+            snapshot_number,
+            repeat,
+        ),
+    }
+    return {
+        "format": "snlite.bench.codec.v1",
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "backend": codec.BACKEND,
+        "params": {**asdict(spec), "number": number, "repeat": repeat},
+        "snapshot_bytes_avg": round(sum(len(x) for x in lines) / len(lines)) if lines else 0,
+        "cases": cases,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="SNLite JSON codec benchmark")
+    ap.add_argument("--sessions", type=int, default=50)
+    ap.add_argument("--messages", type=int, default=SynthSpec.messages)
+    ap.add_argument("--prompt-chars", type=int, default=SynthSpec.prompt_chars)
+    ap.add_argument("--reply-chars", type=int, default=SynthSpec.reply_chars)
+    ap.add_argument("--seed", type=int, default=SynthSpec.seed)
+    ap.add_argument("--number", type=int, default=20000, help="operations per timing run (snapshots: 1/100)")
+    ap.add_argument("--repeat", type=int, default=5)
+    ap.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = ap.parse_args(argv)
+
+    spec = SynthSpec(
+        sessions=args.sessions,
+        messages=args.messages,
+        prompt_chars=args.prompt_chars,
+        reply_chars=args.reply_chars,
+        seed=args.seed,
+    )
+    report = run(spec, number=max(1, args.number), repeat=max(1, args.repeat))
+    for name, case in report["cases"].items():
+        print(
+            f"{name:<16} stdlib {case['stdlib_us']:>10.2f} us  {report['backend']} {case['codec_us']:>10.2f} us"
+            f"  x{case['speedup']}",
+            file=sys.stderr,
+        )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,119 @@
+"""
+Memory footprint of in-memory messages: plain dicts vs. CompactMessage.
+
+    python -m benchmarks.bench_memory --sessions 500 --messages 40 --out mem.json
+
+Synthetic sessions (see `benchmarks.synth`) are round-tripped through JSON
+first, the way the store reads them, so neither side benefits from keys or
+values shared by the generator. Allocations are measured with tracemalloc;
+the report (format "snlite.bench.memory.v1") also has the time to pack all
+messages and to turn them back into dicts.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmarks.synth import SynthSpec, make_sessions
+from snlite.compact import pack_messages, unpack_messages
+
+
+def _encoded(spec: SynthSpec) -> List[str]:
+    """One JSON line per session, as in the log."""
+    return [json.dumps(sess, ensure_ascii=False) for sess in make_sessions(spec)]
+
+
+def _measure(build: Callable[[], Any]) -> Tuple[Any, int, float]:
+    """(result of `build`, bytes it still holds, seconds it took)."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        t0 = time.perf_counter()
+        result = build()
+        seconds = time.perf_counter() - t0
+        gc.collect()
+        held = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    return result, held, seconds
+
+
+def run(spec: SynthSpec) -> Dict[str, Any]:
+    lines = _encoded(spec)
+    count = spec.sessions * spec.messages
+
+    dicts, dict_bytes, parse_s = _measure(lambda: [json.loads(line)["messages"] for line in lines])
+    compact, compact_bytes, pack_s = _measure(
+        lambda: [pack_messages(json.loads(line)["messages"]) for line in lines]
+    )
+    t0 = time.perf_counter()
+    for messages in compact:
+        unpack_messages(messages)
+    unpack_s = time.perf_counter() - t0
+    del dicts, compact
+
+    return {
+        "format": "snlite.bench.memory.v1",
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": asdict(spec),
+        "messages": count,
+        "dict": {
+            "bytes": dict_bytes,
+            "bytes_per_message": round(dict_bytes / count, 1) if count else 0,
+            "parse_s": round(parse_s, 4),
+        },
+        "compact": {
+            "bytes": compact_bytes,
+            "bytes_per_message": round(compact_bytes / count, 1) if count else 0,
+            "parse_and_pack_s": round(pack_s, 4),
+            "unpack_s": round(unpack_s, 4),
+        },
+        "ratio": round(compact_bytes / dict_bytes, 3) if dict_bytes else None,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="SNLite in-memory message representation benchmark")
+    ap.add_argument("--sessions", type=int, default=SynthSpec.sessions)
+    ap.add_argument("--messages", type=int, default=SynthSpec.messages)
+    ap.add_argument("--prompt-chars", type=int, default=SynthSpec.prompt_chars)
+    ap.add_argument("--reply-chars", type=int, default=SynthSpec.reply_chars)
+    ap.add_argument("--seed", type=int, default=SynthSpec.seed)
+    ap.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = ap.parse_args(argv)
+
+    spec = SynthSpec(
+        sessions=args.sessions,
+        messages=args.messages,
+        prompt_chars=args.prompt_chars,
+        reply_chars=args.reply_chars,
+        seed=args.seed,
+    )
+    report = run(spec)
+    print(
+        f"dict {report['dict']['bytes_per_message']:>10.1f} B/msg"
+        f"  compact {report['compact']['bytes_per_message']:>10.1f} B/msg"
+        f"  ratio {report['ratio']}",
+        file=sys.stderr,
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
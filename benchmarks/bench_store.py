@@ -0,0 +1,231 @@
+"""
+Session store micro-benchmarks.
+
+    python -m benchmarks.bench_store --engine jsonl --engine sqlite \
+        --sessions 500 --messages 40 --out bench.json
+
+A synthetic data dir (see `benchmarks.synth`) is generated once per engine.
+Every operation then runs in its own child process on a fresh copy of that
+dir, so timings start from a cold store and the reported peak RSS belongs to
+that operation alone (store open included). The result is one JSON document
+(format "snlite.bench.store.v1") meant to be kept and diffed across releases.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict
+from multiprocessing import get_context
+from typing import Any, Callable, Dict, List, Optional
+
+from benchmarks.synth import SynthSpec, iter_snapshots, make_message_for_save
+from snlite.store import STORE_ENGINES, BaseSessionStore, open_store
+
+OPS = (
+    "list_sessions",
+    "get_session",
+    "save_session",
+    "delete_session",
+    "archive_session",
+    "compact",
+    "export_all",
+    "import_all",
+)
+
+# ops that rewrite or scan everything; fewer repetitions by default
+HEAVY_OPS = ("compact", "export_all", "import_all")
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Nearest-rank percentile of `samples` (not empty)."""
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def populate(data_dir: str, engine: str, spec: SynthSpec, fsync: str) -> Dict[str, Any]:
+    started = time.perf_counter()
+    store = open_store(data_dir, engine, fsync=fsync)
+    try:
+        result = store.import_all(iter_snapshots(spec), mode="append")
+        stats = store.stats()
+    finally:
+        store.close()
+    return {
+        "seconds": round(time.perf_counter() - started, 3),
+        "records": result["imported"],
+        "sessions": result["total"],
+        "file_bytes": stats.get("file_bytes", 0),
+    }
+
+
+def _timed(fn: Callable[[], Any], iterations: int) -> List[float]:
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return samples
+
+
+def run_op(op: str, data_dir: str, engine: str, spec: SynthSpec, iterations: int, fsync: str) -> Dict[str, Any]:
+    """Child-process entry: open the store in `data_dir`, time `op`, report."""
+    rng = random.Random(spec.seed + 1)
+    store: BaseSessionStore = open_store(data_dir, engine, fsync=fsync)
+    try:
+        ids = [row["id"] for row in store.list_sessions()]
+        rng.shuffle(ids)
+        victims = iter(ids)
+        samples: List[float] = []
+
+        if op == "list_sessions":
+            samples = _timed(store.list_sessions, iterations)
+        elif op == "get_session":
+            samples = _timed(lambda: store.get_session(rng.choice(ids)), iterations)
+        elif op == "save_session":
+            for _ in range(iterations):
+                sess = store.get_session(rng.choice(ids))
+                sess.messages.append(make_message_for_save(rng, spec))
+                samples.extend(_timed(lambda: store.save_session(sess), 1))
+        elif op == "delete_session":
+            samples = _timed(lambda: store.delete_session(next(victims)), min(iterations, len(ids)))
+        elif op == "archive_session":
+            samples = _timed(lambda: store.archive_session(next(victims)), min(iterations, len(ids)))
+        elif op == "compact":
+            samples = _timed(store.compact, iterations)
+        elif op == "export_all":
+            samples = _timed(store.export_all, iterations)
+        elif op == "import_all":
+            backup = store.export_all()["sessions"]
+            samples = _timed(lambda: store.import_all(backup, mode="append"), iterations)
+        else:
+            raise ValueError(f"unknown op: {op}")
+    finally:
+        store.close()
+
+    total_s = sum(samples) / 1000
+    return {
+        "engine": engine,
+        "op": op,
+        "iterations": len(samples),
+        "total_s": round(total_s, 6),
+        "ops_per_sec": round(len(samples) / total_s, 2) if total_s else None,
+        "p50_ms": round(percentile(samples, 50), 3) if samples else None,
+        "p99_ms": round(percentile(samples, 99), 3) if samples else None,
+        "min_ms": round(min(samples), 3) if samples else None,
+        "max_ms": round(max(samples), 3) if samples else None,
+        "peak_rss_bytes": peak_rss_bytes(),
+    }
+
+
+def run_isolated(op: str, template: str, engine: str, spec: SynthSpec, iterations: int, fsync: str) -> Dict[str, Any]:
+    work = tempfile.mkdtemp(prefix=f"snlite-bench-{op}-")
+    try:
+        data_dir = os.path.join(work, "data")
+        shutil.copytree(template, data_dir)
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            return pool.submit(run_op, op, data_dir, engine, spec, iterations, fsync).result()
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+def run_suite(
+    engines: List[str],
+    ops: List[str],
+    spec: SynthSpec,
+    iterations: int,
+    heavy_iterations: int,
+    fsync: str,
+    work_dir: Optional[str] = None,
+) -> Dict[str, Any]:
+    root = tempfile.mkdtemp(prefix="snlite-bench-", dir=work_dir)
+    populated: Dict[str, Any] = {}
+    results: List[Dict[str, Any]] = []
+    try:
+        for engine in engines:
+            template = os.path.join(root, engine)
+            os.makedirs(template)
+            populated[engine] = populate(template, engine, spec, fsync)
+            for op in ops:
+                n = heavy_iterations if op in HEAVY_OPS else iterations
+                row = run_isolated(op, template, engine, spec, n, fsync)
+                results.append(row)
+                print(
+                    f"{engine:>7} {op:<16} {row['ops_per_sec'] or 0:>12.2f} ops/s"
+                    f"  p50 {row['p50_ms'] or 0:>10.3f} ms  p99 {row['p99_ms'] or 0:>10.3f} ms"
+                    f"  rss {row['peak_rss_bytes'] / 1048576:>8.1f} MiB",
+                    file=sys.stderr,
+                )
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+    return {
+        "format": "snlite.bench.store.v1",
+        "created_at": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": {**asdict(spec), "iterations": iterations, "heavy_iterations": heavy_iterations, "fsync": fsync},
+        "populate": populated,
+        "results": results,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description="SNLite session store benchmarks")
+    ap.add_argument("--engine", action="append", choices=STORE_ENGINES, help="repeatable; default jsonl")
+    ap.add_argument("--op", action="append", choices=OPS, help="repeatable; default all")
+    ap.add_argument("--sessions", type=int, default=SynthSpec.sessions)
+    ap.add_argument("--messages", type=int, default=SynthSpec.messages)
+    ap.add_argument("--prompt-chars", type=int, default=SynthSpec.prompt_chars)
+    ap.add_argument("--reply-chars", type=int, default=SynthSpec.reply_chars)
+    ap.add_argument("--snapshots", type=int, default=SynthSpec.snapshots)
+    ap.add_argument("--seed", type=int, default=SynthSpec.seed)
+    ap.add_argument("--iterations", type=int, default=50)
+    ap.add_argument("--heavy-iterations", type=int, default=3, help="for " + ", ".join(HEAVY_OPS))
+    ap.add_argument("--fsync", default="none", help="store fsync policy (none | interval | always)")
+    ap.add_argument("--work-dir", help="where to create the temporary data dirs")
+    ap.add_argument("--out", help="write the JSON report here instead of stdout")
+    args = ap.parse_args(argv)
+
+    spec = SynthSpec(
+        sessions=args.sessions,
+        messages=args.messages,
+        prompt_chars=args.prompt_chars,
+        reply_chars=args.reply_chars,
+        snapshots=args.snapshots,
+        seed=args.seed,
+    )
+    report = run_suite(
+        engines=args.engine or ["jsonl"],
+        ops=args.op or list(OPS),
+        spec=spec,
+        iterations=max(1, args.iterations),
+        heavy_iterations=max(1, args.heavy_iterations),
+        fsync=args.fsync,
+        work_dir=args.work_dir,
+    )
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
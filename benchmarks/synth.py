@@ -0,0 +1,105 @@
+"""
+Synthetic session data for the store benchmarks.
+
+Sessions look like what the chat endpoints persist: alternating user /
+assistant turns, user turns carrying the regenerate meta (`prompt` with
+injected file excerpts, `system_text`, params), assistant turns carrying the
+finish meta. Output is deterministic for a given seed.
+"""
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Any, Dict, Iterator, List
+
+WORDS = (
+    "session store index snapshot delta append model token stream prompt context "
+    "window latency archive export import compact group title message assistant "
+    "user system reply file excerpt paragraph summary question answer local chat "
+    "模型 会话 归档 导出 检索 上下文 流式 压缩 分组 标题"
+).split()
+
+BASE_TS = 1_700_000_000.0
+
+
+@dataclass
+class SynthSpec:
+    sessions: int = 200
+    messages: int = 40
+    prompt_chars: int = 4000  # size of meta.prompt on user turns (file excerpts included)
+    reply_chars: int = 800
+    snapshots: int = 3  # full snapshots written per session; all but the last are dead records
+    groups: int = 5
+    seed: int = 1
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    out: List[str] = []
+    n = 0
+    while n < chars:
+        w = rng.choice(WORDS)
+        out.append(w)
+        n += len(w) + 1
+    return " ".join(out)[:chars]
+
+
+def make_message(rng: random.Random, index: int, spec: SynthSpec) -> Dict[str, Any]:
+    if index % 2 == 0:
+        question = _text(rng, rng.randint(40, 240))
+        return {
+            "role": "user",
+            "content": question,
+            "meta": {
+                "prompt": question + "\n\n[file excerpt]\n" + _text(rng, spec.prompt_chars),
+                "system_text": _text(rng, 200),
+                "params": {"temperature": 0.7, "top_p": 0.9, "num_ctx": 8192},
+                "think_mode": "auto",
+                "has_images": False,
+                "file_extract": [],
+            },
+        }
+    reply = _text(rng, rng.randint(spec.reply_chars // 2, spec.reply_chars * 3 // 2))
+    return {
+        "role": "assistant",
+        "content": reply,
+        "meta": {"finish_reason": "stop", "elapsed_ms": rng.randint(300, 20000), "output_chars": len(reply)},
+    }
+
+
+def make_sessions(spec: SynthSpec) -> List[Dict[str, Any]]:
+    """Final state of every session, as `import_all` rows."""
+    rng = random.Random(spec.seed)
+    out = []
+    for i in range(spec.sessions):
+        created = BASE_TS + i * 60
+        out.append({
+            "id": f"bench-{i:06d}",
+            "title": _text(rng, 24),
+            "group": f"group-{i % max(1, spec.groups)}",
+            "created_at": created,
+            "updated_at": created + spec.messages * 30,
+            "messages": [make_message(rng, j, spec) for j in range(spec.messages)],
+        })
+    return out
+
+
+def iter_snapshots(spec: SynthSpec) -> Iterator[Dict[str, Any]]:
+    """
+    Every session written `spec.snapshots` times as it grows, oldest first,
+    so an append-only log ends up with the dead records a long-lived data
+    dir accumulates.
+    """
+    sessions = make_sessions(spec)
+    rounds = max(1, spec.snapshots)
+    for k in range(1, rounds + 1):
+        for sess in sessions:
+            count = len(sess["messages"]) * k // rounds
+            yield {
+                **sess,
+                "updated_at": sess["created_at"] + count * 30 + k,
+                "messages": sess["messages"][:count],
+            }
+
+
+def make_message_for_save(rng: random.Random, spec: SynthSpec) -> Dict[str, Any]:
+    return make_message(rng, rng.randint(0, 1), spec)
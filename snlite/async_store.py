@@ -0,0 +1,334 @@
+from __future__ import annotations
+
+import asyncio
+import functools
+import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, List, Optional, Tuple, TypeVar
+
+from snlite.blobs import externalize_user_meta, resolve_images, resolve_prompt
+from snlite.search import SearchIndex
+from snlite.store import DEFAULT_GROUP, BaseSessionStore, Session, iter_ndjson
+
+T = TypeVar("T")
+
+
+class AsyncSessionStore:
+    """
+    Async facade over a session store for the FastAPI handlers.
+
+    - every store call runs on a bounded thread pool, so file/database I/O
+      never blocks the event loop (and token delivery of other streams)
+    - writes to one session are serialized by a per-session asyncio.Lock;
+      writes to different sessions proceed independently
+    - with a `search_index`, every write updates it in the same pool job
+      (inside the session lock, so index updates land in write order)
+    """
+    def __init__(
+        self,
+        store: BaseSessionStore,
+        max_workers: int = 4,
+        search_index: Optional[SearchIndex] = None,
+    ) -> None:
+        self.store = store
+        self.search_index = search_index
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="snlite-store")
+        self._locks: Dict[str, asyncio.Lock] = {}
+        self._lock_users: Dict[str, int] = {}
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    async def _run(self, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    @asynccontextmanager
+    async def session_lock(self, session_id: str) -> AsyncIterator[None]:
+        """Hold the write lock of one session; the lock is dropped when unused."""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        self._lock_users[session_id] = self._lock_users.get(session_id, 0) + 1
+        try:
+            async with lock:
+                yield
+        finally:
+            self._lock_users[session_id] -= 1
+            if self._lock_users[session_id] == 0:
+                self._lock_users.pop(session_id, None)
+                self._locks.pop(session_id, None)
+
+    @asynccontextmanager
+    async def sessions_lock(self, session_ids: Iterable[str]) -> AsyncIterator[None]:
+        """Hold the write locks of several sessions, taken in sorted order."""
+        async with AsyncExitStack() as stack:
+            for session_id in sorted(set(session_ids)):
+                await stack.enter_async_context(self.session_lock(session_id))
+            yield
+
+    async def _write(self, session_id: str, fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        async with self.session_lock(session_id):
+            return await self._run(fn, *args, **kwargs)
+
+    def _indexed(self, fn: Callable[..., T], update: Callable[[SearchIndex, T], None]) -> Callable[..., T]:
+        """`fn`, followed by `update(search_index, result)` when there is an index."""
+        index = self.search_index
+        if index is None:
+            return fn
+
+        def run(*args: Any, **kwargs: Any) -> T:
+            result = fn(*args, **kwargs)
+            update(index, result)
+            return result
+
+        return run
+
+    # ---- reads ----
+
+    async def list_sessions(self) -> List[Dict[str, Any]]:
+        return await self._run(self.store.list_sessions)
+
+    async def get_session(self, session_id: str) -> Optional[Session]:
+        return await self._run(self.store.get_session, session_id)
+
+    async def list_sessions_page(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        group: Optional[str] = None,
+        q: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        return await self._run(self.store.list_sessions_page, limit=limit, cursor=cursor, group=group, q=q)
+
+    async def get_session_window(
+        self,
+        session_id: str,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+        strip_meta: bool = False,
+    ) -> Optional[Tuple[Session, Dict[str, Any]]]:
+        return await self._run(
+            self.store.get_session_window, session_id, before=before, limit=limit, strip_meta=strip_meta
+        )
+
+    async def list_archives(self) -> List[Dict[str, Any]]:
+        return await self._run(self.store.list_archives)
+
+    async def get_archive(self, archive_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.store.get_archive, archive_id)
+
+    async def iter_archive(
+        self, archive_id: str, chunk_size: int = 64 * 1024
+    ) -> Optional[Tuple[Dict[str, Any], AsyncIterator[bytes]]]:
+        """
+        Archive metadata and an async iterator over its decompressed body,
+        read one chunk per pool job; None if the archive or its file is gone.
+        """
+        opened = await self._run(self.store.open_archive, archive_id)
+        if not opened:
+            return None
+        item, f = opened
+
+        async def chunks() -> AsyncIterator[bytes]:
+            try:
+                while True:
+                    chunk = await self._run(f.read, chunk_size)
+                    if not chunk:
+                        return
+                    yield chunk
+            finally:
+                f.close()
+
+        return item, chunks()
+
+    async def export_markdown(self, session_id: str) -> Optional[str]:
+        return await self._run(self.store.export_markdown, session_id)
+
+    async def export_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return await self._run(self.store.export_session, session_id)
+
+    async def export_all(self) -> Dict[str, Any]:
+        return await self._run(self.store.export_all)
+
+    async def iter_export_ndjson(self) -> AsyncIterator[str]:
+        """Stream `store.iter_export_ndjson`, one session fetch per pool job."""
+        it = self.store.iter_export_ndjson()
+        while True:
+            line = await self._run(next, it, None)
+            if line is None:
+                return
+            yield line
+
+    async def stats(self) -> Dict[str, Any]:
+        return await self._run(self.store.stats)
+
+    async def search(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        kind: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        if self.search_index is None:
+            raise RuntimeError("no search index configured")
+        return await self._run(self.search_index.search, query, limit=limit, offset=offset, kind=kind)
+
+    # ---- per-session writes ----
+
+    async def create_session(self, title: str = "New Chat", group: str = DEFAULT_GROUP) -> Session:
+        create = self._indexed(self.store.create_session, lambda index, sess: index.index_session(sess))
+        return await self._run(create, title=title, group=group)
+
+    async def save_session(self, session: Session, expected_version: Optional[int] = None) -> None:
+        save = self._indexed(self.store.save_session, lambda index, _: index.index_session(session))
+        return await self._write(session.id, save, session, expected_version=expected_version)
+
+    async def append_message(
+        self, session_id: str, message: Dict[str, Any], expected_version: Optional[int] = None
+    ) -> Optional[int]:
+        def update(index: SearchIndex, version: Optional[int]) -> None:
+            if version is not None:
+                index.session_appended(session_id, message)
+
+        append = self._indexed(self.store.append_message, update)
+        return await self._write(session_id, append, session_id, message, expected_version=expected_version)
+
+    async def pop_message(self, session_id: str, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        def update(index: SearchIndex, popped: Optional[Dict[str, Any]]) -> None:
+            if popped is not None:
+                index.session_popped(session_id, popped)
+
+        pop = self._indexed(self.store.pop_message, update)
+        return await self._write(session_id, pop, session_id, expected_version=expected_version)
+
+    def _index_result(self, index: SearchIndex, sess: Optional[Session]) -> None:
+        if sess is not None:
+            index.index_session(sess)
+
+    async def rename_session(
+        self, session_id: str, title: str, expected_version: Optional[int] = None
+    ) -> Optional[Session]:
+        rename = self._indexed(self.store.rename_session, self._index_result)
+        return await self._write(session_id, rename, session_id, title=title, expected_version=expected_version)
+
+    async def set_session_group(
+        self, session_id: str, group: str, expected_version: Optional[int] = None
+    ) -> Optional[Session]:
+        regroup = self._indexed(self.store.set_session_group, self._index_result)
+        return await self._write(session_id, regroup, session_id, group=group, expected_version=expected_version)
+
+    async def delete_session(self, session_id: str) -> bool:
+        return (await self.delete_sessions([session_id]))[session_id]
+
+    async def archive_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        return (await self.archive_sessions([session_id]))[session_id]
+
+    # ---- bulk ----
+
+    async def select_sessions(
+        self,
+        session_ids: Optional[List[str]] = None,
+        group: Optional[str] = None,
+        updated_before: Optional[float] = None,
+    ) -> List[str]:
+        return await self._run(
+            self.store.select_sessions, session_ids, group=group, updated_before=updated_before
+        )
+
+    async def delete_sessions(self, session_ids: List[str]) -> Dict[str, bool]:
+        def update(index: SearchIndex, done: Dict[str, bool]) -> None:
+            for sid, ok in done.items():
+                if ok:
+                    index.session_deleted(sid)
+
+        delete = self._indexed(self.store.delete_sessions, update)
+        async with self.sessions_lock(session_ids):
+            return await self._run(delete, session_ids)
+
+    async def archive_sessions(self, session_ids: List[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        def update(index: SearchIndex, done: Dict[str, Optional[Dict[str, Any]]]) -> None:
+            for archive in done.values():
+                if archive:
+                    index.session_archived(archive)
+
+        archive = self._indexed(self.store.archive_sessions, update)
+        async with self.sessions_lock(session_ids):
+            return await self._run(archive, session_ids)
+
+    async def set_sessions_group(self, session_ids: List[str], group: str) -> Dict[str, bool]:
+        def update(index: SearchIndex, done: Dict[str, bool]) -> None:
+            for sid, ok in done.items():
+                if ok:
+                    index.session_regrouped(sid)
+
+        regroup = self._indexed(self.store.set_sessions_group, update)
+        async with self.sessions_lock(session_ids):
+            return await self._run(regroup, session_ids, group=group)
+
+    # ---- store-wide ----
+
+    def _refresh_index(self, index: SearchIndex, _: Any) -> None:
+        index.refresh()
+
+    async def delete_archive(self, archive_id: str) -> bool:
+        def update(index: SearchIndex, ok: bool) -> None:
+            if ok:
+                index.archive_deleted(archive_id)
+
+        return await self._run(self._indexed(self.store.delete_archive, update), archive_id)
+
+    async def import_all(self, sessions: List[Dict[str, Any]], mode: str = "append") -> Dict[str, int]:
+        return await self._run(self._indexed(self.store.import_all, self._refresh_index), sessions, mode=mode)
+
+    async def import_ndjson(self, chunks: AsyncIterable[bytes], mode: str = "append") -> Dict[str, int]:
+        """
+        Import an NDJSON backup arriving as a byte stream (e.g. a request body).
+
+        The body is spooled to a temp file in the data dir first, so memory
+        stays bounded by the chunk size and a slow upload never holds the
+        store lock; the file is then fed line by line to `import_all`.
+        """
+        if mode not in ("append", "replace"):
+            raise ValueError("mode must be append or replace")
+        fd, path = tempfile.mkstemp(prefix="import-", suffix=".ndjson.tmp", dir=self.store.data_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    if chunk:
+                        await self._run(f.write, chunk)
+
+            def run_import() -> Dict[str, int]:
+                with open(path, "rb") as f:
+                    return self.store.import_all(iter_ndjson(f), mode=mode)
+
+            return await self._run(self._indexed(run_import, self._refresh_index))
+        finally:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    async def compact(self) -> Dict[str, int]:
+        return await self._run(self.store.compact)
+
+    async def enforce_archive_retention(self) -> Dict[str, Any]:
+        return await self._run(self._indexed(self.store.enforce_archive_retention, self._refresh_index))
+
+    async def collect_blobs(self) -> Dict[str, int]:
+        return await self._run(self.store.collect_blobs)
+
+    # ---- blobs (file I/O kept off the event loop, like the session calls) ----
+
+    async def externalize_user_meta(self, meta: Dict[str, Any], images_b64: List[str]) -> Dict[str, Any]:
+        if self.store.blobs is None:
+            return meta
+        return await self._run(externalize_user_meta, self.store.blobs, meta, images_b64)
+
+    async def resolve_prompt(self, meta: Dict[str, Any]) -> Optional[str]:
+        return await self._run(resolve_prompt, self.store.blobs, meta)
+
+    async def resolve_images(self, meta: Dict[str, Any]) -> Optional[List[str]]:
+        return await self._run(resolve_images, self.store.blobs, meta)
@@ -0,0 +1,253 @@
+from __future__ import annotations
+
+import base64
+import hashlib
+import os
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional
+
+# Prompts shorter than this stay inline in the message meta.
+BLOB_MIN_CHARS = 1024
+
+# Message meta keys that hold blob hashes (see `externalize_user_meta`).
+PROMPT_BLOB_KEY = "prompt_blob"
+IMAGES_KEY = "images"
+# Exports carry the images inline as base64 under this key (see `inline_user_meta`).
+IMAGES_B64_KEY = "images_b64"
+
+
+class BlobStore:
+    """
+    Content-addressed blob store: data/blobs/<sha[:2]>/<sha256 hex>.
+
+    - `put` is idempotent: identical content is stored once, whoever writes it
+      (threads or worker processes; files are created via rename)
+    - blobs are referenced from message meta by hash; `collect` takes the
+      reference counts of a mark pass over the live sessions and removes
+      blobs nobody references, except ones written (or re-put) within the
+      last `grace` seconds - a message may reference a blob only after `put`
+      returned, so recent blobs can still be on their way into the log
+
+    - the blobs of a deleted session are `release`d by the store's purge
+      pass, so they are gone within its `purge_after` like the session
+
+    The store's maintenance thread runs the collection every `gc_interval`
+    seconds (see `BaseSessionStore.collect_blobs`).
+    """
+    def __init__(self, root: str, grace: float = 3600.0, gc_interval: float = 3600.0) -> None:
+        self.root = root
+        self.grace = grace
+        self.gc_interval = gc_interval
+        os.makedirs(self.root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._gc: Dict[str, Any] = {
+            "runs": 0,
+            "last_run_at": None,
+            "referenced": 0,
+            "references": 0,
+            "removed_total": 0,
+            "reclaimed_bytes_total": 0,
+        }
+
+    def _path(self, digest: str) -> str:
+        return os.path.join(self.root, digest[:2], digest)
+
+    @staticmethod
+    def is_digest(value: Any) -> bool:
+        return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+    def put(self, data: bytes) -> str:
+        """Store `data` (if new) and return its SHA-256 hex digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        # under the lock: `collect` must not remove a blob between our
+        # exists/utime and the caller referencing it
+        with self._lock:
+            if os.path.exists(path):
+                try:
+                    os.utime(path)  # restart the grace period for the new reference
+                    return digest
+                except FileNotFoundError:
+                    pass  # removed by another process meanwhile; write it again
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        return digest
+
+    def get(self, digest: str) -> Optional[bytes]:
+        if not self.is_digest(digest):
+            return None
+        try:
+            with open(self._path(digest), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put_text(self, text: str) -> str:
+        return self.put(text.encode("utf-8"))
+
+    def get_text(self, digest: str) -> Optional[str]:
+        data = self.get(digest)
+        return None if data is None else data.decode("utf-8", errors="replace")
+
+    def _iter_blobs(self) -> Iterable[os.DirEntry]:
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.is_file() and self.is_digest(entry.name):
+                    yield entry
+
+    def collect(self, references: Counter) -> Dict[str, int]:
+        """Remove unreferenced blobs past the grace period; `references` maps digest -> count."""
+        now = time.time()
+        removed = reclaimed = kept = 0
+        with self._lock:
+            for entry in self._iter_blobs():
+                if references.get(entry.name):
+                    kept += 1
+                    continue
+                try:
+                    st = entry.stat()
+                    if now - st.st_mtime < self.grace:
+                        kept += 1
+                        continue
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                reclaimed += st.st_size
+            g = self._gc
+            g["runs"] += 1
+            g["last_run_at"] = now
+            g["referenced"] = len(references)
+            g["references"] = sum(references.values())
+            g["removed_total"] += removed
+            g["reclaimed_bytes_total"] += reclaimed
+        return {"kept": kept, "removed": removed, "reclaimed_bytes": reclaimed}
+
+    def release(self, released: Dict[str, float], references: Counter) -> Dict[str, int]:
+        """
+        Remove the blobs of deleted sessions without waiting for the grace
+        period: `released` maps digest -> time its session was deleted. A
+        blob still referenced, or put again after that time (a new message
+        on its way), is kept.
+        """
+        removed = reclaimed = kept = 0
+        with self._lock:
+            for digest, released_at in released.items():
+                if references.get(digest) or not self.is_digest(digest):
+                    kept += 1
+                    continue
+                path = self._path(digest)
+                try:
+                    st = os.stat(path)
+                    if st.st_mtime > released_at:
+                        kept += 1
+                        continue
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                removed += 1
+                reclaimed += st.st_size
+            self._gc["removed_total"] += removed
+            self._gc["reclaimed_bytes_total"] += reclaimed
+        return {"kept": kept, "removed": removed, "reclaimed_bytes": reclaimed}
+
+    def stats(self) -> Dict[str, Any]:
+        count = size = 0
+        for entry in self._iter_blobs():
+            count += 1
+            try:
+                size += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            return {
+                "blobs": count,
+                "bytes": size,
+                "grace_s": self.grace,
+                "gc_interval_s": self.gc_interval,
+                "gc": dict(self._gc),
+            }
+
+
+def externalize_user_meta(blobs: BlobStore, meta: Dict[str, Any], images_b64: List[str]) -> Dict[str, Any]:
+    """
+    Move the heavy parts of a user message's meta into `blobs`: a long
+    `prompt` becomes `prompt_blob`, and the images (base64 from the
+    request) are kept as `images` (list of hashes) so the turn can be
+    regenerated later. Raises ValueError (binascii.Error) for an image that
+    is not valid base64.
+    """
+    out = dict(meta)
+    prompt = out.get("prompt")
+    if isinstance(prompt, str) and len(prompt) >= BLOB_MIN_CHARS:
+        out[PROMPT_BLOB_KEY] = blobs.put_text(prompt)
+        del out["prompt"]
+    if images_b64:
+        out[IMAGES_KEY] = [blobs.put(base64.b64decode(b64, validate=True)) for b64 in images_b64]
+    return out
+
+
+def inline_user_meta(blobs: BlobStore, meta: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The reverse of `externalize_user_meta`, for exports: the prompt and the
+    images (base64, as `images_b64`) are put back into the meta. A part whose
+    blob is gone keeps its hash.
+    """
+    out = dict(meta)
+    if out.get(PROMPT_BLOB_KEY) and "prompt" not in out:
+        prompt = blobs.get_text(str(out[PROMPT_BLOB_KEY]))
+        if prompt is not None:
+            del out[PROMPT_BLOB_KEY]
+            out["prompt"] = prompt
+    images = resolve_images(blobs, out)
+    if images is not None:
+        del out[IMAGES_KEY]
+        out[IMAGES_B64_KEY] = images
+    return out
+
+
+def resolve_prompt(blobs: Optional[BlobStore], meta: Dict[str, Any]) -> Optional[str]:
+    """The stored prompt of a user turn, inline or from its blob (None if gone)."""
+    if meta.get("prompt"):
+        return str(meta["prompt"])
+    digest = meta.get(PROMPT_BLOB_KEY)
+    if blobs is None or not digest:
+        return None
+    return blobs.get_text(str(digest))
+
+
+def resolve_images(blobs: Optional[BlobStore], meta: Dict[str, Any]) -> Optional[List[str]]:
+    """The images of a user turn as base64, or None if any of them is not stored."""
+    digests = meta.get(IMAGES_KEY)
+    if blobs is None or not isinstance(digests, list) or not digests:
+        return None
+    out: List[str] = []
+    for digest in digests:
+        data = blobs.get(str(digest))
+        if data is None:
+            return None
+        out.append(base64.b64encode(data).decode("ascii"))
+    return out
+
+
+def message_blob_refs(message: Dict[str, Any]) -> List[str]:
+    meta = message.get("meta")
+    if not isinstance(meta, dict):
+        return []
+    refs = [meta[PROMPT_BLOB_KEY]] if meta.get(PROMPT_BLOB_KEY) else []
+    images = meta.get(IMAGES_KEY)
+    if isinstance(images, list):
+        refs.extend(images)
+    return [str(r) for r in refs]
+
+
+def messages_blob_refs(messages: Iterable[Dict[str, Any]]) -> List[str]:
+    """The blob hashes of all `messages`, one per reference."""
+    return [digest for m in messages for digest in message_blob_refs(m)]
@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+import dataclasses
+import json
+from typing import Any, Optional, Union
+
+try:
+    import orjson
+except ImportError:  # optional: pip install "snlite[fast]"
+    orjson = None  # type: ignore[assignment]
+
+# The JSON codec every hot path goes through: session log records, SQLite
+# bodies, sidecars, SSE events and provider NDJSON.
+#
+# - orjson when installed, stdlib json otherwise; both write the same compact
+#   form (no spaces, UTF-8 kept as is), so files and events do not depend on
+#   which one wrote them
+# - bytes in, bytes out: `dumpb` / `dump_line` feed binary files and the
+#   response stream directly, `loads` takes str or bytes
+# - dataclasses (Session, index entries) and objects with a `to_dict`
+#   (CompactMessage) are encoded without an `asdict` deep copy first
+# - whatever orjson rejects (integers beyond 64 bits, NaN on input) is
+#   retried with stdlib json, which accepts it
+# - full session records are parsed by stdlib json (`loads_snapshot`)
+BACKEND = "orjson" if orjson is not None else "json"
+
+JSONBytes = Union[str, bytes, bytearray]
+
+
+def _default(obj: Any) -> Any:
+    to_dict = getattr(obj, "to_dict", None)
+    if callable(to_dict):
+        return to_dict()
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {f.name: getattr(obj, f.name) for f in dataclasses.fields(obj)}
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+_std_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=_default)
+
+
+def _std_dumps(obj: Any) -> str:
+    return _std_encoder.encode(obj)
+
+
+if orjson is not None:
+    _OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def dumpb(obj: Any) -> bytes:
+        """`obj` as compact UTF-8 JSON."""
+        try:
+            return orjson.dumps(obj, default=_default, option=_OPTIONS)
+        except TypeError:  # orjson.JSONEncodeError
+            return _std_dumps(obj).encode("utf-8")
+
+    def dumps(obj: Any) -> str:
+        return dumpb(obj).decode("utf-8")
+
+    def loads(data: JSONBytes) -> Any:
+        """Parse JSON from str or bytes; raises ValueError if it is not JSON."""
+        try:
+            return orjson.loads(data)
+        except ValueError:  # orjson.JSONDecodeError
+            return json.loads(data)
+
+else:
+
+    def dumpb(obj: Any) -> bytes:
+        """`obj` as compact UTF-8 JSON."""
+        return _std_dumps(obj).encode("utf-8")
+
+    def dumps(obj: Any) -> str:
+        return _std_dumps(obj)
+
+    def loads(data: JSONBytes) -> Any:
+        """Parse JSON from str or bytes; raises ValueError if it is not JSON."""
+        return json.loads(data)
+
+
+def loads_snapshot(data: JSONBytes) -> Any:
+    """
+    Parse one full session record (log snapshot, backup line). Always stdlib
+    json: on these long, string-heavy records orjson measured no faster
+    (benchmarks.bench_codec, snapshot_decode 0.8-1.1x), so only their
+    encoding goes through orjson.
+    """
+    return json.loads(data)
+
+
+def dump_line(obj: Any) -> bytes:
+    """One NDJSON / JSONL line."""
+    return dumpb(obj) + b"\n"
+
+
+def sse(event: str, data: Any, event_id: Optional[int] = None) -> bytes:
+    """One server-sent event with a JSON payload (and an `id:` line if `event_id` is given)."""
+    head = b"" if event_id is None else b"id: %d\n" % event_id
+    return head + b"event: " + event.encode("utf-8") + b"\ndata: " + dumpb(data) + b"\n\n"
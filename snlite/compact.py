@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import sys
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from snlite import codec
+
+SHORT_STR = 32  # string values up to this length are interned (roles, finish reasons...)
+
+
+def _intern(value: Any) -> Any:
+    return sys.intern(value) if isinstance(value, str) and len(value) <= SHORT_STR else value
+
+
+def _tight(data: bytes) -> bytes:
+    """
+    A copy of `data` without spare capacity: orjson returns its output buffer
+    as is, up to several times larger than the JSON, which a message held
+    in memory would otherwise keep for its whole life.
+    """
+    return memoryview(data).tobytes()
+
+
+class CompactMessage(Mapping):
+    """
+    Memory-lean, read-only chat message for sessions held in memory in bulk.
+
+    - slotted: no per-instance __dict__
+    - the role (and other short strings) are interned, so the thousands of
+      "user"/"assistant" values share one object each
+    - `meta` (the largest part: prompt with file excerpts, system text) is
+      kept as its raw compact JSON bytes and parsed only when accessed
+    - keys other than role/content/meta are kept as a tuple of pairs
+
+    It reads like the dict it was built from (`m["role"]`, `m.get("meta")`),
+    and `to_dict` / `to_json` give back the stored shape at the boundary.
+    """
+    __slots__ = ("role", "content", "_meta", "_extra")
+
+    def __init__(
+        self,
+        role: str,
+        content: Any,
+        meta: Optional[bytes] = None,
+        extra: Tuple[Tuple[str, Any], ...] = (),
+    ) -> None:
+        self.role = sys.intern(role)
+        self.content = content
+        self._meta = meta
+        self._extra = extra
+
+    @classmethod
+    def from_dict(cls, message: Union[Dict[str, Any], "CompactMessage"]) -> "CompactMessage":
+        if isinstance(message, CompactMessage):
+            return message
+        meta = message.get("meta")
+        return cls(
+            role=str(message.get("role", "")),
+            content=message.get("content"),
+            meta=None if meta is None else _tight(codec.dumpb(meta)),
+            extra=tuple(
+                (sys.intern(k), _intern(v)) for k, v in message.items() if k not in ("role", "content", "meta")
+            ),
+        )
+
+    @property
+    def meta(self) -> Optional[Dict[str, Any]]:
+        """Parsed on every access; hold on to the result instead of re-reading it."""
+        return None if self._meta is None else codec.loads(self._meta)
+
+    def __getitem__(self, key: str) -> Any:
+        if key == "role":
+            return self.role
+        if key == "content":
+            return self.content
+        if key == "meta" and self._meta is not None:
+            return self.meta
+        for k, v in self._extra:
+            if k == key:
+                return v
+        raise KeyError(key)
+
+    def __iter__(self) -> Iterator[str]:
+        yield "role"
+        yield "content"
+        if self._meta is not None:
+            yield "meta"
+        for k, _ in self._extra:
+            yield k
+
+    def __len__(self) -> int:
+        return 2 + (self._meta is not None) + len(self._extra)
+
+    def __repr__(self) -> str:
+        return f"CompactMessage(role={self.role!r}, content={self.content!r:.40})"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return dict(self.items())
+
+    def to_json(self) -> str:
+        """The message as one JSON object; the raw meta bytes are spliced in unparsed."""
+        head = codec.dumps({"role": self.role, "content": self.content, **dict(self._extra)})
+        if self._meta is None:
+            return head
+        return f'{head[:-1]},"meta":{self._meta.decode("utf-8")}}}'
+
+
+def pack_messages(messages: Iterable[Union[Dict[str, Any], CompactMessage]]) -> List[CompactMessage]:
+    return [CompactMessage.from_dict(m) for m in messages if isinstance(m, (dict, CompactMessage))]
+
+
+def unpack_messages(messages: Iterable[Union[Dict[str, Any], CompactMessage]]) -> List[Dict[str, Any]]:
+    return [m.to_dict() if isinstance(m, CompactMessage) else m for m in messages]
+
+
+def message_json(message: Union[Dict[str, Any], CompactMessage]) -> str:
+    """JSON for a stored message in either representation."""
+    if isinstance(message, CompactMessage):
+        return message.to_json()
+    return codec.dumps(message)
@@ -134,10 +134,13 @@ ZH_CN_MESSAGES: Dict[str, str] = {
     "status.unknown": "未知",
     "status.inspecting": "检查中...",
     "status.init_error": "初始化错误：{message}",
+    "stage.sending": "发送中…",
     "stage.thinking": "思考中…",
     "stage.answering": "回答中…",
+    "stage.queued": "排队中（第 {position} 位）…",
     "session.ungrouped": "未分组",
     "session.new_chat": "新聊天",
+    "session.load_more": "加载更多…",
     "archive.none": "暂无归档",
     "archive.untitled": "未命名",
     "prompt.new_title": "新标题：",
@@ -294,10 +297,13 @@ EN_MESSAGES: Dict[str, str] = {
     "status.unknown": "unknown",
     "status.inspecting": "Inspecting...",
     "status.init_error": "Init error: {message}",
+    "stage.sending": "Sending…",
     "stage.thinking": "Thinking…",
     "stage.answering": "Answering…",
+    "stage.queued": "Queued (#{position})…",
     "session.ungrouped": "Ungrouped",
     "session.new_chat": "New Chat",
+    "session.load_more": "Load more…",
     "archive.none": "No archives yet",
     "archive.untitled": "Untitled",
     "prompt.new_title": "New title:",
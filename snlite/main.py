@@ -2,7 +2,6 @@ from __future__ import annotations
 
 import os
 import re
-import json
 import asyncio
 import base64
 from io import BytesIO
@@ -13,10 +12,16 @@ from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 import uvicorn
 
-from snlite.registry import AppRegistry
-from snlite.store import SessionStore, DEFAULT_GROUP
+from snlite.registry import AppRegistry, LoadedModel, ModelsBusy
+from snlite.async_store import AsyncSessionStore
+from snlite.blobs import BlobStore
+from snlite.scheduler import BACKGROUND, Scheduler
+from snlite.search import SearchIndex
+from snlite.sse import StreamBuffer, StreamHub, TokenCoalescer
+from snlite.store import DEFAULT_GROUP, ArchiveRetention, VersionConflict, open_store
 from snlite.plugin_manager import PluginRecord, load_provider_plugins
 from snlite.i18n import load_locales
+from snlite.providers.base import Provider
 from snlite.providers.ollama import OllamaProvider
 
 from docx import Document
@@ -24,21 +29,74 @@ from pypdf import PdfReader
 
 SNLITE_HOST = os.getenv("SNLITE_HOST", "127.0.0.1")
 SNLITE_PORT = int(os.getenv("SNLITE_PORT", "8000"))
+SNLITE_WORKERS = int(os.getenv("SNLITE_WORKERS", "1"))
 OLLAMA_BASE_URL = os.getenv("OLLAMA_BASE_URL", "http://127.0.0.1:11434")
 SNLITE_DATA_DIR = os.getenv("SNLITE_DATA_DIR", os.path.join(os.getcwd(), "data"))
+SNLITE_STORE_ENGINE = os.getenv("SNLITE_STORE_ENGINE", "jsonl")  # jsonl | sqlite
+SNLITE_COMPACT_MIN_BYTES = int(os.getenv("SNLITE_COMPACT_MIN_BYTES", str(1024 * 1024)))
+SNLITE_COMPACT_LIVE_RATIO = float(os.getenv("SNLITE_COMPACT_LIVE_RATIO", "0.5"))
+SNLITE_STORE_THREADS = int(os.getenv("SNLITE_STORE_THREADS", "4"))
+SNLITE_FSYNC = os.getenv("SNLITE_FSYNC", "interval")  # none | interval | always
+SNLITE_FSYNC_INTERVAL = float(os.getenv("SNLITE_FSYNC_INTERVAL", "1.0"))
+SNLITE_PURGE_AFTER = float(os.getenv("SNLITE_PURGE_AFTER", "60"))
+SNLITE_ARCHIVE_COMPRESSION = os.getenv("SNLITE_ARCHIVE_COMPRESSION", "gzip")  # gzip | none
+SNLITE_ARCHIVE_MAX_AGE_DAYS = float(os.getenv("SNLITE_ARCHIVE_MAX_AGE_DAYS", "0"))  # 0 = keep forever
+SNLITE_ARCHIVE_MAX_BYTES = int(os.getenv("SNLITE_ARCHIVE_MAX_BYTES", "0"))
+SNLITE_ARCHIVE_MAX_COUNT = int(os.getenv("SNLITE_ARCHIVE_MAX_COUNT", "0"))
+SNLITE_BLOB_GRACE = float(os.getenv("SNLITE_BLOB_GRACE", "3600"))
+SNLITE_BLOB_GC_INTERVAL = float(os.getenv("SNLITE_BLOB_GC_INTERVAL", "3600"))
+SNLITE_SSE_COALESCE_MS = float(os.getenv("SNLITE_SSE_COALESCE_MS", "0"))  # 0 = one event per token
+SNLITE_SSE_COALESCE_BYTES = int(os.getenv("SNLITE_SSE_COALESCE_BYTES", "4096"))
+SNLITE_SSE_RESUME_EVENTS = int(os.getenv("SNLITE_SSE_RESUME_EVENTS", "2048"))
+SNLITE_SSE_RESUME_GRACE = float(os.getenv("SNLITE_SSE_RESUME_GRACE", "60"))
+SNLITE_SSE_ABANDON_AFTER = float(os.getenv("SNLITE_SSE_ABANDON_AFTER", "15"))  # < 0 = never
+SNLITE_SCHED_PER_PROVIDER = int(os.getenv("SNLITE_SCHED_PER_PROVIDER", "2"))  # 0 = no limit
+SNLITE_SCHED_PER_MODEL = int(os.getenv("SNLITE_SCHED_PER_MODEL", "1"))  # 0 = no limit
+SNLITE_SCHED_QUEUE = int(os.getenv("SNLITE_SCHED_QUEUE", "32"))
+SNLITE_MAX_WARM_MODELS = int(os.getenv("SNLITE_MAX_WARM_MODELS", "4"))
 
 MAX_FILES = 3
 MAX_FILE_BYTES = 6 * 1024 * 1024
 MAX_EXTRACT_CHARS_PER_FILE = 8000
 MAX_TOTAL_EXTRACT_CHARS = 16000
 
+SESSIONS_PAGE_DEFAULT = 50
+SESSIONS_PAGE_MAX = 500
+SEARCH_PAGE_DEFAULT = 20
+SEARCH_PAGE_MAX = 100
+
+TITLE_QUEUE_TIMEOUT = 30.0  # auto-title falls back to the first words if no slot frees up by then
+
 app = FastAPI(title="SNLite", version="8.0.0")
 
 WEB_DIR = os.path.join(os.path.dirname(__file__), "web")
 app.mount("/static", StaticFiles(directory=WEB_DIR), name="static")
 
-registry = AppRegistry()
-store = SessionStore(SNLITE_DATA_DIR)
+registry = AppRegistry(max_models=SNLITE_MAX_WARM_MODELS)
+blobs = BlobStore(
+    os.path.join(SNLITE_DATA_DIR, "blobs"),
+    grace=SNLITE_BLOB_GRACE,
+    gc_interval=SNLITE_BLOB_GC_INTERVAL,
+)
+store = open_store(
+    SNLITE_DATA_DIR,
+    SNLITE_STORE_ENGINE,
+    compact_min_bytes=SNLITE_COMPACT_MIN_BYTES,
+    compact_live_ratio=SNLITE_COMPACT_LIVE_RATIO,
+    fsync=SNLITE_FSYNC,
+    fsync_interval=SNLITE_FSYNC_INTERVAL,
+    purge_after=SNLITE_PURGE_AFTER,
+    archive_compression=SNLITE_ARCHIVE_COMPRESSION,
+    archive_retention=ArchiveRetention(
+        max_age=SNLITE_ARCHIVE_MAX_AGE_DAYS * 86400,
+        max_bytes=SNLITE_ARCHIVE_MAX_BYTES,
+        max_count=SNLITE_ARCHIVE_MAX_COUNT,
+    ),
+    blobs=blobs,
+)
+search_index = SearchIndex(store, os.path.join(SNLITE_DATA_DIR, "search.index.json"))
+store.add_background_hook(search_index.maintain)
+astore = AsyncSessionStore(store, max_workers=SNLITE_STORE_THREADS, search_index=search_index)
 
 ollama_provider = OllamaProvider(base_url=OLLAMA_BASE_URL)
 PROVIDERS = {"ollama": ollama_provider}
@@ -53,6 +111,37 @@ PLUGIN_RECORDS.extend(_loaded_plugin_records)
 
 LOCALES, LOCALE_PLUGIN_RECORDS = load_locales()
 
+stream_hub = StreamHub(
+    capacity=SNLITE_SSE_RESUME_EVENTS,
+    grace=SNLITE_SSE_RESUME_GRACE,
+    abandon_after=SNLITE_SSE_ABANDON_AFTER if SNLITE_SSE_ABANDON_AFTER >= 0 else None,
+)
+scheduler = Scheduler(
+    per_provider=SNLITE_SCHED_PER_PROVIDER,
+    per_model=SNLITE_SCHED_PER_MODEL,
+    max_queue=SNLITE_SCHED_QUEUE,
+)
+_generations: "set[asyncio.Task]" = set()  # running generations (keeps the tasks referenced)
+
+
+@app.on_event("startup")
+async def start_store_maintenance() -> None:
+    store.start_background()
+
+
+@app.on_event("shutdown")
+async def stop_store_maintenance() -> None:
+    store.stop_background()
+    astore.close()
+    search_index.flush()
+    store.close()
+
+
+@app.exception_handler(VersionConflict)
+async def version_conflict(request: Request, exc: VersionConflict) -> JSONResponse:
+    """A conditional write lost a race: the client should reload the session."""
+    return JSONResponse(status_code=409, content={"detail": str(exc), "version": exc.current})
+
 
 @app.middleware("http")
 async def no_cache_static(request: Request, call_next):
@@ -136,6 +225,7 @@ async def list_i18n_locales() -> Dict[str, Any]:
 
 @app.post("/api/models/load")
 async def load_model(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Warm a model up and make it the default; models loaded before stay usable."""
     provider_name = payload.get("provider", "ollama")
     model_id = payload.get("model_id")
     params = payload.get("params") or {}
@@ -145,11 +235,15 @@ async def load_model(payload: Dict[str, Any]) -> Dict[str, Any]:
     provider = PROVIDERS.get(provider_name)
     if not provider:
         raise HTTPException(status_code=400, detail=f"Unknown provider: {provider_name}")
+    await _check_listed(provider, provider_name, model_id)
 
     await registry.set_loading()
     try:
         meta = await provider.load(model_id, **params)
         await registry.set_provider_and_model(provider, provider_name, model_id, meta=meta)
+    except ModelsBusy as e:
+        await registry.set_ready()
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         await registry.set_error(str(e))
         raise HTTPException(status_code=500, detail=str(e))
@@ -158,23 +252,46 @@ async def load_model(payload: Dict[str, Any]) -> Dict[str, Any]:
 
 
 @app.post("/api/models/unload")
-async def unload_model() -> Dict[str, Any]:
-    await registry.unload()
+async def unload_model(payload: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Drop the named model (default: the default model) from the warm set."""
+    payload = payload or {}
+    if payload.get("model_id"):
+        await registry.unload(payload.get("provider") or "ollama", str(payload["model_id"]))
+    else:
+        await registry.unload()
     return await registry.get_state()
 
 
 # Sessions
 @app.get("/api/sessions")
-async def sessions_list() -> List[Dict[str, Any]]:
-    items = store.list_sessions()
-    return [x for x in items if x.get("title") != "__deleted__"]
+async def sessions_list(
+    limit: Optional[int] = None,
+    cursor: Optional[str] = None,
+    group: Optional[str] = None,
+    q: Optional[str] = None,
+) -> Any:
+    """
+    Without `limit`/`cursor`: every session (legacy list). With them: one page
+    `{"items": [...], "next_cursor": ...}` ordered by updated_at, optionally
+    filtered by `group` and by `q` (a substring of the title or group).
+    """
+    if limit is None and cursor is None and group is None and not q:
+        items = await astore.list_sessions()
+        return [x for x in items if x.get("title") != "__deleted__"]
+
+    limit = max(1, min(int(limit or SESSIONS_PAGE_DEFAULT), SESSIONS_PAGE_MAX))
+    try:
+        page = await astore.list_sessions_page(limit=limit, cursor=cursor, group=group, q=q)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return page
 
 
 @app.post("/api/sessions")
 async def sessions_create(payload: Dict[str, Any]) -> Dict[str, Any]:
     title = payload.get("title") or "New Chat"
     group = payload.get("group") or DEFAULT_GROUP
-    sess = store.create_session(title=title, group=group)
+    sess = await astore.create_session(title=title, group=group)
     return {
         "id": sess.id,
         "title": sess.title,
@@ -185,26 +302,52 @@ async def sessions_create(payload: Dict[str, Any]) -> Dict[str, Any]:
 
 
 @app.get("/api/sessions/{session_id}")
-async def sessions_get(session_id: str) -> Dict[str, Any]:
-    sess = store.get_session(session_id)
+async def sessions_get(
+    session_id: str,
+    before: Optional[int] = None,
+    limit: Optional[int] = None,
+    strip_meta: bool = False,
+) -> Dict[str, Any]:
+    """
+    Full session, or with `before`/`limit` only messages [before - limit,
+    before) plus a `window` object; `strip_meta` drops heavy per-message meta
+    (the stored prompt) that the chat view does not need.
+    """
+    windowed = before is not None or limit is not None or strip_meta
+    if windowed:
+        found = await astore.get_session_window(session_id, before=before, limit=limit, strip_meta=strip_meta)
+        sess, window = found if found else (None, None)
+    else:
+        sess, window = await astore.get_session(session_id), None
     if not sess or sess.title == "__deleted__":
         raise HTTPException(status_code=404, detail="session not found")
-    return {
+    out = {
         "id": sess.id,
         "title": sess.title,
         "group": sess.group,
         "created_at": sess.created_at,
         "updated_at": sess.updated_at,
+        "version": sess.version,
         "messages": sess.messages,
     }
+    if window is not None:
+        out["window"] = window
+    # the model a turn without an explicit model would run on (None: the default)
+    bound = await _bound_model(sess.messages)
+    out["model"] = {"provider": bound[1].provider_name, "model_id": bound[1].model_id} if bound else None
+    return out
 
 
 @app.patch("/api/sessions/{session_id}")
 async def sessions_rename(session_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
     title = payload.get("title")
     group = payload.get("group")
+    # optional: the version the client edited; 409 if the session changed since
+    version = payload.get("version")
+    if version is not None and not isinstance(version, int):
+        raise HTTPException(status_code=400, detail="version must be an integer")
 
-    sess = store.get_session(session_id)
+    sess = await astore.get_session(session_id)
     if not sess or sess.title == "__deleted__":
         raise HTTPException(status_code=404, detail="session not found")
 
@@ -215,20 +358,28 @@ async def sessions_rename(session_id: str, payload: Dict[str, Any]) -> Dict[str,
         title = str(title).strip()
         if not title:
             raise HTTPException(status_code=400, detail="title is required")
-        sess = store.rename_session(session_id, title=title)
+        sess = await astore.rename_session(session_id, title=title, expected_version=version)
+        if sess and version is not None:
+            version = sess.version
 
-    if group is not None:
+    if group is not None and sess:
         group = str(group).strip()
-        sess = store.set_session_group(session_id, group=group)
+        sess = await astore.set_session_group(session_id, group=group, expected_version=version)
 
     if not sess or sess.title == "__deleted__":
         raise HTTPException(status_code=404, detail="session not found")
-    return {"id": sess.id, "title": sess.title, "group": sess.group, "updated_at": sess.updated_at}
+    return {
+        "id": sess.id,
+        "title": sess.title,
+        "group": sess.group,
+        "updated_at": sess.updated_at,
+        "version": sess.version,
+    }
 
 
 @app.delete("/api/sessions/{session_id}")
 async def sessions_delete(session_id: str) -> Dict[str, Any]:
-    archive_meta = store.archive_session(session_id)
+    archive_meta = await astore.archive_session(session_id)
     if not archive_meta:
         raise HTTPException(status_code=404, detail="session not found")
     return {"ok": True, "archived": archive_meta}
@@ -236,28 +387,98 @@ async def sessions_delete(session_id: str) -> Dict[str, Any]:
 
 @app.delete("/api/sessions/{session_id}/hard")
 async def sessions_delete_hard(session_id: str) -> Dict[str, Any]:
-    ok = store.delete_session(session_id)
+    ok = await astore.delete_session(session_id)
     if not ok:
         raise HTTPException(status_code=404, detail="session not found")
     return {"ok": True, "deleted": True}
 
 
+BULK_ACTIONS = ("archive", "delete", "set_group")
+
+
+@app.post("/api/sessions/bulk")
+async def sessions_bulk(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Apply one action to many sessions in a single store pass.
+
+    `{"action": "archive" | "delete" | "set_group", "ids": [...]}`, or instead
+    of `ids` a `"filter": {"group": ..., "updated_before": <unix ts>}`;
+    `set_group` also takes the target `"group"`. Every selected id gets an
+    outcome: archived / deleted / regrouped / not_found.
+    """
+    action = str(payload.get("action") or "").strip()
+    if action not in BULK_ACTIONS:
+        raise HTTPException(status_code=400, detail=f"action must be one of {', '.join(BULK_ACTIONS)}")
+    ids = payload.get("ids")
+    if ids is not None and not isinstance(ids, list):
+        raise HTTPException(status_code=400, detail="ids must be a list")
+    flt = payload.get("filter") or {}
+    if not isinstance(flt, dict):
+        raise HTTPException(status_code=400, detail="filter must be an object")
+    try:
+        updated_before = float(flt["updated_before"]) if flt.get("updated_before") is not None else None
+        selected = await astore.select_sessions(ids, group=flt.get("group"), updated_before=updated_before)
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    results: List[Dict[str, Any]] = []
+    if action == "archive":
+        archived = await astore.archive_sessions(selected)
+        for sid, meta in archived.items():
+            row: Dict[str, Any] = {"id": sid, "status": "archived" if meta else "not_found"}
+            if meta:
+                row["archive"] = meta
+            results.append(row)
+    else:
+        if action == "delete":
+            done, status = await astore.delete_sessions(selected), "deleted"
+        else:
+            done, status = await astore.set_sessions_group(selected, group=str(payload.get("group") or "")), "regrouped"
+        results = [{"id": sid, "status": status if ok else "not_found"} for sid, ok in done.items()]
+
+    counts: Dict[str, int] = {}
+    for row in results:
+        counts[row["status"]] = counts.get(row["status"], 0) + 1
+    return {"ok": True, "action": action, "counts": counts, "results": results}
+
+
 @app.get("/api/archives")
 async def archives_list() -> List[Dict[str, Any]]:
-    return store.list_archives()
+    return await astore.list_archives()
+
+
+@app.post("/api/archives/retention")
+async def archives_retention() -> Dict[str, Any]:
+    """Apply the archive retention policy now instead of waiting for the background run."""
+    stats = await astore.enforce_archive_retention()
+    return {"ok": True, **stats}
+
+
+@app.post("/api/blobs/collect")
+async def blobs_collect() -> Dict[str, Any]:
+    """Remove unreferenced blobs now instead of waiting for the background run."""
+    stats = await astore.collect_blobs()
+    return {"ok": True, **stats}
 
 
 @app.get("/api/archives/{archive_id}")
-async def archives_get(archive_id: str) -> Dict[str, Any]:
-    item = store.get_archive(archive_id)
-    if not item:
+async def archives_get(archive_id: str) -> Any:
+    """The archive text, streamed (and decompressed) chunk by chunk."""
+    found = await astore.iter_archive(archive_id)
+    if not found:
         raise HTTPException(status_code=404, detail="archive not found")
-    return item
+    item, chunks = found
+    filename = str(item.get("file_name") or "archive.txt").removesuffix(".gz")
+    return StreamingResponse(
+        chunks,
+        media_type="text/plain; charset=utf-8",
+        headers={"Content-Disposition": f'inline; filename="{filename}"'},
+    )
 
 
 @app.delete("/api/archives/{archive_id}")
 async def archives_delete(archive_id: str) -> Dict[str, Any]:
-    ok = store.delete_archive(archive_id)
+    ok = await astore.delete_archive(archive_id)
     if not ok:
         raise HTTPException(status_code=404, detail="archive not found")
     return {"ok": True, "deleted": True}
@@ -265,7 +486,7 @@ async def archives_delete(archive_id: str) -> Dict[str, Any]:
 
 @app.get("/api/sessions/{session_id}/export.md")
 async def sessions_export_md(session_id: str) -> Any:
-    md = store.export_markdown(session_id)
+    md = await astore.export_markdown(session_id)
     if md is None:
         raise HTTPException(status_code=404, detail="session not found")
     return PlainTextResponse(md, media_type="text/markdown; charset=utf-8")
@@ -273,22 +494,16 @@ async def sessions_export_md(session_id: str) -> Any:
 
 @app.get("/api/sessions/{session_id}/export.json")
 async def sessions_export_json(session_id: str) -> Any:
-    sess = store.get_session(session_id)
-    if not sess or sess.title == "__deleted__":
+    # prompts kept in blobs are inlined, so the file can be imported elsewhere
+    item = await astore.export_session(session_id)
+    if not item:
         raise HTTPException(status_code=404, detail="session not found")
-    return JSONResponse({
-        "id": sess.id,
-        "title": sess.title,
-        "group": sess.group,
-        "created_at": sess.created_at,
-        "updated_at": sess.updated_at,
-        "messages": sess.messages,
-    })
+    return JSONResponse(item)
 
 
 @app.get("/api/export/sessions.json")
 async def sessions_export_all_json() -> Any:
-    return JSONResponse(store.export_all())
+    return JSONResponse(await astore.export_all())
 
 
 @app.post("/api/sessions/import.json")
@@ -298,7 +513,25 @@ async def sessions_import_json(payload: Dict[str, Any]) -> Any:
     if not isinstance(sessions, list):
         raise HTTPException(status_code=400, detail="sessions must be a list")
     try:
-        stats = store.import_all(sessions, mode=mode)
+        stats = await astore.import_all(sessions, mode=mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, **stats}
+
+
+@app.get("/api/export/sessions.ndjson")
+async def sessions_export_all_ndjson() -> Any:
+    return StreamingResponse(
+        (line.encode("utf-8") async for line in astore.iter_export_ndjson()),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="snlite_backup.ndjson"'},
+    )
+
+
+@app.post("/api/sessions/import.ndjson")
+async def sessions_import_ndjson(request: Request, mode: str = "append") -> Any:
+    try:
+        stats = await astore.import_ndjson(request.stream(), mode=mode.strip())
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     return {"ok": True, **stats}
@@ -306,10 +539,36 @@ async def sessions_import_json(payload: Dict[str, Any]) -> Any:
 
 @app.post("/api/sessions/compact")
 async def sessions_compact() -> Any:
-    stats = store.compact()
+    stats = await astore.compact()
     return {"ok": True, **stats}
 
 
+@app.get("/api/store/stats")
+async def store_stats() -> Dict[str, Any]:
+    return {**await astore.stats(), "search": search_index.stats()}
+
+
+@app.get("/api/search")
+async def search(
+    q: str = "",
+    limit: Optional[int] = None,
+    offset: int = 0,
+    kind: Optional[str] = None,
+) -> Dict[str, Any]:
+    """
+    Full-text search over session messages and archives: hits ranked by
+    relevance, `{"query", "total", "items": [...], "next_offset"}`. Each
+    item has kind (session | archive), id, title, group, score and a
+    snippet; session hits also carry the index of the matching message.
+    """
+    if not q.strip():
+        raise HTTPException(status_code=400, detail="q is required")
+    if kind not in (None, "session", "archive"):
+        raise HTTPException(status_code=400, detail="kind must be session or archive")
+    limit = max(1, min(int(limit or SEARCH_PAGE_DEFAULT), SEARCH_PAGE_MAX))
+    return await astore.search(q, limit=limit, offset=max(0, offset), kind=kind)
+
+
 def _clean_title(s: str) -> str:
     s = s.strip()
     s = re.sub(r"\s+", " ", s)
@@ -329,7 +588,7 @@ def _fallback_title_from_first_user(first_user: str) -> str:
     return t
 
 
-async def _generate_title_with_model(provider: Any, model_id: str, first_user: str) -> Optional[str]:
+async def _generate_title_with_model(provider: Any, provider_name: str, model_id: str, first_user: str) -> Optional[str]:
     prompt = (
         "Generate a short, descriptive chat title based on the user's first message.\n"
         "Rules:\n"
@@ -341,11 +600,16 @@ async def _generate_title_with_model(provider: Any, model_id: str, first_user: s
     )
     messages = [{"role": "system", "content": "You are a title generator."}, {"role": "user", "content": prompt}]
     try:
-        text = await provider.chat(
-            model_id=model_id,
-            messages=messages,
-            params={"temperature": 0.2, "top_p": 0.9, "num_predict": 32, "repeat_penalty": 1.05},
-        )
+        # background lane: chat streams go first
+        await asyncio.wait_for(scheduler.acquire(provider_name, model_id, lane=BACKGROUND), TITLE_QUEUE_TIMEOUT)
+        try:
+            text = await provider.chat(
+                model_id=model_id,
+                messages=messages,
+                params={"temperature": 0.2, "top_p": 0.9, "num_predict": 32, "repeat_penalty": 1.05},
+            )
+        finally:
+            scheduler.release(provider_name, model_id)
         if not text:
             return None
         title = text.strip().splitlines()[0].strip()
@@ -362,7 +626,7 @@ async def _generate_title_with_model(provider: Any, model_id: str, first_user: s
 
 @app.post("/api/sessions/{session_id}/auto_title")
 async def sessions_auto_title(session_id: str) -> Dict[str, Any]:
-    sess = store.get_session(session_id)
+    sess = await astore.get_session(session_id)
     if not sess or sess.title == "__deleted__":
         raise HTTPException(status_code=404, detail="session not found")
 
@@ -377,19 +641,32 @@ async def sessions_auto_title(session_id: str) -> Dict[str, Any]:
     if not first_user:
         return {"ok": False, "error": "no user message found"}
 
-    loaded_state = await registry.get_state()
-    provider = await registry.get_provider()
-    loaded_model = await registry.get_loaded_model()
-
     title: Optional[str] = None
-    if loaded_state.get("loaded") and provider and loaded_model:
-        title = await _generate_title_with_model(provider, loaded_model.model_id, first_user)
+    try:
+        provider, loaded_model = await _session_or_default_model(sess.messages)
+    except HTTPException:
+        pass  # no model: title from the first words
+    else:
+        title = await _generate_title_with_model(provider, loaded_model.provider_name, loaded_model.model_id, first_user)
 
     if not title:
         title = _fallback_title_from_first_user(first_user)
 
     title = _clean_title(title)
-    sess2 = store.rename_session(session_id, title=title)
+    # Title generation takes a while; rename only if nobody renamed the
+    # session meanwhile (messages appended in between do not matter).
+    for _ in range(3):
+        try:
+            sess2 = await astore.rename_session(session_id, title=title, expected_version=sess.version)
+            break
+        except VersionConflict:
+            sess = await astore.get_session(session_id)
+            if not sess:
+                raise HTTPException(status_code=404, detail="session not found")
+            if not sess.title.startswith("New Chat"):
+                return {"ok": True, "skipped": True, "title": sess.title}
+    else:
+        sess2 = await astore.rename_session(session_id, title=title)
     if not sess2:
         raise HTTPException(status_code=500, detail="failed to rename")
 
@@ -405,6 +682,25 @@ async def chat_stop(payload: Dict[str, Any]) -> Dict[str, Any]:
     return {"ok": ok}
 
 
+@app.get("/api/chat/stats")
+async def chat_stats() -> Dict[str, Any]:
+    return {"scheduler": scheduler.stats(), "streams": stream_hub.stats()}
+
+
+@app.get("/api/chat/stream/{request_id}")
+async def chat_stream_resume(request_id: str, request: Request, last_event_id: Optional[str] = None) -> Any:
+    """Resume a generation's event stream after the `Last-Event-ID` (header or query)."""
+    raw = request.headers.get("last-event-id") or last_event_id
+    try:
+        last_id = int(raw) if raw not in (None, "") else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Last-Event-ID must be an integer")
+    buf = stream_hub.get(request_id)
+    if buf is None:
+        raise HTTPException(status_code=404, detail="Stream not found or expired")
+    return StreamingResponse(buf.follow(last_id), media_type="text/event-stream")
+
+
 def _build_messages(
     system_text: str,
     history: List[Dict[str, Any]],
@@ -598,6 +894,96 @@ async def files_inspect(payload: Dict[str, Any]) -> Any:
     return {"ok": True, "markers": markers, "meta": meta}
 
 
+def _session_model(messages: List[Dict[str, Any]]) -> Tuple[Optional[str], Optional[str]]:
+    """(provider, model_id) the session's last user turn was sent to, if recorded."""
+    for m in reversed(messages):
+        meta = m.get("meta") if m.get("role") == "user" else None
+        if isinstance(meta, dict) and meta.get("model_id"):
+            return meta.get("provider") or "ollama", str(meta["model_id"])
+    return None, None
+
+
+async def _resolve_model(provider_name: Optional[str], model_id: Optional[str]) -> Tuple[Provider, LoadedModel]:
+    """
+    The model a turn runs on: the one named, warmed up on first use without
+    changing the default; otherwise the default model.
+    """
+    if not model_id:
+        provider = await registry.get_provider()
+        loaded_model = await registry.get_loaded_model()
+        if not provider or not loaded_model:
+            raise HTTPException(status_code=400, detail="No model loaded. Load a model first.")
+        return provider, loaded_model
+
+    provider_name = provider_name or "ollama"
+    warm = await registry.get_model(provider_name, model_id)
+    if warm:
+        return warm
+    provider = PROVIDERS.get(provider_name)
+    if not provider:
+        raise HTTPException(status_code=400, detail=f"Unknown provider: {provider_name}")
+    await _check_listed(provider, provider_name, model_id)
+    try:
+        meta = await provider.load(model_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    try:
+        return provider, await registry.add_model(provider, provider_name, model_id, meta)
+    except ModelsBusy as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+async def _check_listed(provider: Provider, provider_name: str, model_id: str) -> None:
+    """400 unless the provider lists `model_id`: clients only warm up models that exist."""
+    try:
+        models = await provider.list_models()
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"{provider_name}: cannot list models: {e}")
+    if model_id not in {str(m.get("id")) for m in models}:
+        raise HTTPException(status_code=400, detail=f"Unknown model for {provider_name}: {model_id}")
+
+
+async def _bound_model(messages: List[Dict[str, Any]]) -> Optional[Tuple[Provider, LoadedModel]]:
+    """
+    The model the session's last turn ran on, if it is still warm. A model
+    unloaded since (or unknown after a restart) is not warmed up again.
+    """
+    provider_name, model_id = _session_model(messages)
+    if not model_id:
+        return None
+    return await registry.get_model(str(provider_name), model_id)
+
+
+async def _session_or_default_model(messages: List[Dict[str, Any]]) -> Tuple[Provider, LoadedModel]:
+    return await _bound_model(messages) or await _resolve_model(None, None)
+
+
+async def _admit(loaded_model: LoadedModel) -> None:
+    if not scheduler.admits(loaded_model.provider_name, loaded_model.model_id):
+        raise HTTPException(status_code=503, detail="Too many requests waiting for the model. Try again shortly.")
+
+
+def _done_payload(
+    *,
+    cancelled: bool,
+    finish_reason: str,
+    elapsed_ms: int,
+    output_chars: int,
+    error: Optional[str],
+    events: Dict[str, Any],
+) -> Dict[str, Any]:
+    """The `done` event that ends every chat stream."""
+    return {
+        "done": True,
+        "cancelled": cancelled,
+        "finish_reason": finish_reason,
+        "elapsed_ms": elapsed_ms,
+        "output_chars": output_chars,
+        "error": error,
+        "events": events,
+    }
+
+
 async def _stream_chat_common(
     *,
     session_id: str,
@@ -609,26 +995,20 @@ async def _stream_chat_common(
     think_mode: str,
     show_trace: bool,
     request_id: str,
+    reply_after: Tuple[int, int],
+    provider: Provider,
+    loaded_model: LoadedModel,
     request_meta: Optional[Dict[str, Any]] = None,
 ):
-    loaded_state = await registry.get_state()
-    provider = await registry.get_provider()
-    loaded_model = await registry.get_loaded_model()
-
-    if not loaded_state.get("loaded") or not provider or not loaded_model:
-        raise HTTPException(status_code=400, detail="No model loaded. Load a model first.")
-
-    cancel_flag = {"v": False}
-
-    async def poll_cancel() -> None:
-        while True:
-            cancel_flag["v"] = await registry.is_cancelled(request_id)
-            if cancel_flag["v"]:
-                return
-            await asyncio.sleep(0.05)
+    """
+    `reply_after`: (session version, message count) right after the turn's
+    user message; `provider` / `loaded_model`: from `_resolve_model`.
+    """
+    # set by /api/chat/stop or when every client is gone (see StreamBuffer)
+    cancel_event = await registry.stream_event(request_id) or asyncio.Event()
 
     def cancelled() -> bool:
-        return cancel_flag["v"]
+        return cancel_event.is_set()
 
     think_value = _resolve_think_value(loaded_model.model_id, think_mode)
     stream_params = dict(params)
@@ -637,50 +1017,110 @@ async def _stream_chat_common(
 
     messages = _build_messages(system_text=system_text, history=history, user_text=model_user_text, images_b64=images_b64)
 
-    async def event_gen():
+    async def pump(chunks: asyncio.Queue, buf: StreamBuffer) -> None:
+        """Wait for a scheduler slot, then read the provider into `chunks`; ends with None (or the exception raised)."""
+        def queued(position: int) -> None:
+            buf.publish("status", {'stage': 'queued', 'position': position})
+
+        try:
+            async with scheduler.slot(loaded_model.provider_name, loaded_model.model_id, on_position=queued):
+                buf.publish("status", {'stage': 'answering'})
+                stream = provider.stream_chat(
+                    model_id=loaded_model.model_id,
+                    messages=messages,
+                    params=stream_params,
+                    cancelled=cancelled,
+                )
+                try:
+                    async for chunk in stream:
+                        await chunks.put(chunk)
+                finally:
+                    aclose = getattr(stream, "aclose", None)
+                    if aclose is not None:
+                        await aclose()  # also when cancelled while waiting on `chunks`
+        except Exception as e:
+            await chunks.put(e)
+        await chunks.put(None)
+
+    async def generate(buf: StreamBuffer) -> None:
         assistant_accum = ""
-        poll_task = asyncio.create_task(poll_cancel())
+        cancel_task = asyncio.create_task(cancel_event.wait())
+        pump_task: Optional[asyncio.Task] = None
         saw_thinking = False
         saw_content = False
         stream_error: Optional[str] = None
         finish_reason = "interrupted"
         elapsed_ms = 0
+        loop = asyncio.get_event_loop()
+        coalescer = TokenCoalescer(SNLITE_SSE_COALESCE_MS / 1000, SNLITE_SSE_COALESCE_BYTES)
+        await registry.acquire_model(loaded_model)
 
         try:
-            yield f"event: meta\ndata: {json.dumps({'request_id': request_id}, ensure_ascii=False)}\n\n"
+            buf.publish("meta", {'request_id': request_id, 'provider': loaded_model.provider_name, 'model_id': loaded_model.model_id})
             if request_meta:
-                yield f"event: request_meta\ndata: {json.dumps(request_meta, ensure_ascii=False)}\n\n"
-            yield f"event: status\ndata: {json.dumps({'stage': 'answering'}, ensure_ascii=False)}\n\n"
-            started_at = asyncio.get_event_loop().time()
-
-            async for chunk in provider.stream_chat(
-                model_id=loaded_model.model_id,
-                messages=messages,
-                params=stream_params,
-                cancelled=cancelled,
-            ):
-                if cancelled():
+                buf.publish("request_meta", request_meta)
+            started_at = loop.time()
+
+            # the provider is read by a task so buffered tokens can be
+            # flushed on time even while no new chunk arrives
+            chunks: asyncio.Queue = asyncio.Queue(maxsize=256)
+            pump_task = asyncio.create_task(pump(chunks, buf))
+
+            def stop(task: asyncio.Task) -> None:
+                # cancelling the pump unwinds the provider's generator, which
+                # closes the upstream request at once (even mid prompt eval)
+                if task.cancelled():
+                    return
+                pump_task.cancel()
+                if not chunks.full():  # else the loop sees cancelled() on the next chunk
+                    chunks.put_nowait(None)
+
+            cancel_task.add_done_callback(stop)
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.get(), coalescer.due_in(loop.time()))
+                except asyncio.TimeoutError:
+                    for kind, text in coalescer.flush(loop.time()):
+                        buf.publish(kind, {'token': text})
+                    continue
+                if isinstance(chunk, Exception):
+                    raise chunk
+                if chunk is None or cancelled():
                     break
 
                 thinking = (chunk.get("thinking") or "")
                 content = (chunk.get("content") or "")
+                pending: List[Tuple[str, str]] = []
 
                 if thinking:
                     if not saw_thinking:
                         saw_thinking = True
-                        yield f"event: status\ndata: {json.dumps({'stage': 'thinking'}, ensure_ascii=False)}\n\n"
+                        buf.publish("status", {'stage': 'thinking'})
                     if show_trace:
-                        yield f"event: thinking\ndata: {json.dumps({'token': thinking}, ensure_ascii=False)}\n\n"
+                        pending += coalescer.add("thinking", thinking, loop.time())
 
                 if content:
                     if not saw_content:
                         saw_content = True
-                        yield f"event: status\ndata: {json.dumps({'stage': 'answering'}, ensure_ascii=False)}\n\n"
+                        pending += coalescer.flush(loop.time())
+                        for kind, text in pending:
+                            buf.publish(kind, {'token': text})
+                        pending = []
+                        if saw_thinking:
+                            buf.publish("status", {'stage': 'answering'})
                     assistant_accum += content
-                    yield f"event: content\ndata: {json.dumps({'token': content}, ensure_ascii=False)}\n\n"
+                    pending += coalescer.add("content", content, loop.time())
+
+                for kind, text in pending:
+                    buf.publish(kind, {'token': text})
+
+            for kind, text in coalescer.flush(loop.time()):
+                buf.publish(kind, {'token': text})
 
             elapsed_ms = int((asyncio.get_event_loop().time() - started_at) * 1000)
-            if cancelled():
+            if buf.abandoned:
+                finish_reason = "abandoned"
+            elif cancelled():
                 finish_reason = "cancelled"
             elif saw_content:
                 finish_reason = "completed"
@@ -691,28 +1131,99 @@ async def _stream_chat_common(
             stream_error = str(e)
             finish_reason = "failed"
             elapsed_ms = int((asyncio.get_event_loop().time() - started_at) * 1000) if 'started_at' in locals() else 0
-            yield f"event: error\ndata: {json.dumps({'error': str(e)}, ensure_ascii=False)}\n\n"
+            for kind, text in coalescer.flush(loop.time()):
+                buf.publish(kind, {'token': text})
+            buf.publish("error", {'error': str(e)})
         finally:
-            yield f"event: done\ndata: {json.dumps({'done': True, 'cancelled': cancelled(), 'finish_reason': finish_reason, 'elapsed_ms': elapsed_ms, 'output_chars': len(assistant_accum), 'error': stream_error}, ensure_ascii=False)}\n\n"
-            poll_task.cancel()
-
-            if assistant_accum.strip():
-                sess2 = store.get_session(session_id)
-                if sess2 and sess2.title != "__deleted__":
-                    sess2.messages.append({
+            buf.publish("done", _done_payload(
+                cancelled=cancelled(),
+                finish_reason=finish_reason,
+                elapsed_ms=elapsed_ms,
+                output_chars=len(assistant_accum),
+                error=stream_error,
+                events=coalescer.stats(),
+            ))
+            cancel_task.cancel()
+            if pump_task is not None:
+                pump_task.cancel()
+
+            try:
+                if assistant_accum.strip():
+                    await _append_reply(session_id, {
                         "role": "assistant",
                         "content": assistant_accum,
                         "meta": {
+                            "provider": loaded_model.provider_name,
+                            "model_id": loaded_model.model_id,
                             "finish_reason": finish_reason,
                             "elapsed_ms": elapsed_ms,
                             "output_chars": len(assistant_accum),
                         }
-                    })
-                    store.save_session(sess2)
-
-            await registry.pop_stream(request_id)
-
-    return StreamingResponse(event_gen(), media_type="text/event-stream")
+                    }, reply_after)
+            finally:
+                await registry.release_model(loaded_model)
+                await registry.pop_stream(request_id)
+                buf.finish()
+
+    # the generation runs on its own and publishes into a ring buffer; this
+    # response (and any resumed one, see /api/chat/stream/{request_id})
+    # only follows it, so a dropped connection does not end the generation
+    buf = stream_hub.open(request_id, on_abandoned=cancel_event.set)
+    task = asyncio.create_task(generate(buf))
+    _generations.add(task)
+    task.add_done_callback(_generations.discard)
+    return StreamingResponse(buf.follow(None), media_type="text/event-stream")
+
+
+async def _append_user_message(session_id: str, sess: Any, message: Dict[str, Any]) -> Tuple[Any, int]:
+    """
+    Append the user message onto the session as read (compare-and-append),
+    so the history sent to the model is exactly what precedes it. If the
+    session changed meanwhile, re-read it and try again; returns the session
+    (including the new message) and its new version.
+    """
+    for attempt in range(3):
+        try:
+            # the last attempt appends unconditionally onto the session just re-read
+            version = await astore.append_message(
+                session_id, message, expected_version=sess.version if attempt < 2 else None
+            )
+            break
+        except VersionConflict:
+            sess = await astore.get_session(session_id)
+            if not sess or sess.title == "__deleted__":
+                raise HTTPException(status_code=404, detail="session not found")
+    if version is None:
+        raise HTTPException(status_code=404, detail="session not found")
+    sess.messages.append(message)
+    return sess, version
+
+
+async def _append_reply(session_id: str, message: Dict[str, Any], reply_after: Tuple[int, int]) -> None:
+    """
+    Append an assistant reply right after its user message.
+
+    Compare-and-append against the version the user message left. Writes in
+    between that did not add or remove messages (rename, regroup) merge: the
+    append is retried on the new version. If messages were added meanwhile
+    (another stream on the same session), the reply is appended anyway and
+    `meta.reply_to` records the index of the user message it answers.
+    """
+    version, count = reply_after
+    for _ in range(3):
+        try:
+            await astore.append_message(session_id, message, expected_version=version)
+            return
+        except VersionConflict:
+            found = await astore.get_session_window(session_id, limit=0)
+            if not found:
+                return
+            sess, window = found
+            if window["total"] != count:
+                break
+            version = sess.version
+    message["meta"]["reply_to"] = count - 1
+    await astore.append_message(session_id, message)
 
 
 @app.post("/api/chat/stream")
@@ -738,19 +1249,26 @@ async def chat_stream(payload: Dict[str, Any]) -> Any:
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
 
-    sess = store.get_session(session_id)
+    sess = await astore.get_session(session_id)
     if not sess or sess.title == "__deleted__":
         raise HTTPException(status_code=404, detail="session not found")
 
     if not user_text and not images_b64 and not files:
         raise HTTPException(status_code=400, detail="user_text or images/files is required")
 
-    request_id = await registry.new_stream()
+    # the model named by the request, else the one this session used last (if
+    # still warm), else the default
+    if payload.get("model_id"):
+        provider, loaded_model = await _resolve_model(payload.get("provider"), str(payload["model_id"]))
+    else:
+        provider, loaded_model = await _session_or_default_model(sess.messages)
+    await _admit(loaded_model)
 
     injected_text, file_markers, file_meta = _parse_files(files)
     model_user_text = _make_model_user_text(user_text, injected_text, has_images=bool(images_b64))
 
-    # Persist user message (NO raw image b64, but DO store prompt text for regen)
+    # Persist user message; the prompt (if long) and the images go to the blob
+    # store and the message keeps their hashes, so the turn can be regenerated
     persisted_lines: List[str] = []
     if images_b64:
         marker = f"[Image] {image_name}".strip() if image_name else "[Image]"
@@ -760,19 +1278,29 @@ async def chat_stream(payload: Dict[str, Any]) -> Any:
     if user_text:
         persisted_lines.append(user_text)
 
-    sess.messages.append({
+    try:
+        meta = await astore.externalize_user_meta(
+            {
+                "prompt": model_user_text,
+                "system_text": system_text,
+                "params": params,
+                "think_mode": think_mode,
+                "has_images": bool(images_b64),
+                "file_extract": file_meta,
+                "provider": loaded_model.provider_name,
+                "model_id": loaded_model.model_id,
+            },
+            images_b64,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid base64 image data: {e}")
+    user_message = {
         "role": "user",
         "content": "\n".join(persisted_lines).strip(),
-        "meta": {
-            "prompt": model_user_text,
-            "system_text": system_text,
-            "params": params,
-            "think_mode": think_mode,
-            "has_images": bool(images_b64),
-            "file_extract": file_meta,
-        }
-    })
-    store.save_session(sess)
+        "meta": meta,
+    }
+    sess, version = await _append_user_message(session_id, sess, user_message)
+    request_id = await registry.new_stream()  # only now: the checks above may still raise
 
     # history excludes the persisted user message; model receives model_user_text (+ images)
     history = [{"role": m["role"], "content": m["content"]} for m in sess.messages[:-1] if "role" in m and "content" in m]
@@ -787,6 +1315,9 @@ async def chat_stream(payload: Dict[str, Any]) -> Any:
         think_mode=think_mode,
         show_trace=show_trace,
         request_id=request_id,
+        reply_after=(version, len(sess.messages)),
+        provider=provider,
+        loaded_model=loaded_model,
         request_meta={"file_extract": file_meta},
     )
 
@@ -803,7 +1334,7 @@ async def chat_regenerate_stream(payload: Dict[str, Any]) -> Any:
     if not session_id:
         raise HTTPException(status_code=400, detail="session_id is required")
 
-    sess = store.get_session(session_id)
+    sess = await astore.get_session(session_id)
     if not sess or sess.title == "__deleted__":
         raise HTTPException(status_code=404, detail="session not found")
 
@@ -822,10 +1353,13 @@ async def chat_regenerate_stream(payload: Dict[str, Any]) -> Any:
     user_msg = sess.messages[prev_idx]
     meta = user_msg.get("meta") or {}
 
+    images_b64: List[str] = []
     if meta.get("has_images"):
-        raise HTTPException(status_code=400, detail="Regenerate is not supported for image messages (image binary is not stored).")
+        images_b64 = await astore.resolve_images(meta) or []
+        if not images_b64:
+            raise HTTPException(status_code=400, detail="Cannot regenerate: the image of this message is not stored.")
 
-    model_user_text = (meta.get("prompt") or user_msg.get("content") or "").strip()
+    model_user_text = ((await astore.resolve_prompt(meta)) or user_msg.get("content") or "").strip()
     system_text = (meta.get("system_text") or "").strip()
     params = meta.get("params") or {}
     think_mode = meta.get("think_mode") or "auto"
@@ -833,9 +1367,18 @@ async def chat_regenerate_stream(payload: Dict[str, Any]) -> Any:
     if not model_user_text:
         raise HTTPException(status_code=400, detail="Cannot regenerate: missing prompt")
 
-    # Remove last assistant message
+    # the model named by the request, else the one the turn was sent to (if
+    # still warm), else the default
+    if payload.get("model_id"):
+        provider, loaded_model = await _resolve_model(payload.get("provider"), str(payload["model_id"]))
+    else:
+        provider, loaded_model = await _session_or_default_model([user_msg])
+    await _admit(loaded_model)
+
+    # Remove last assistant message - the one read above: 409 if the session changed since
     sess.messages.pop(last_idx)
-    store.save_session(sess)
+    if await astore.pop_message(session_id, expected_version=sess.version) is None:
+        raise HTTPException(status_code=404, detail="session not found")  # deleted meanwhile
 
     # history mode
     if retry_mode == "clean_context":
@@ -850,17 +1393,31 @@ async def chat_regenerate_stream(payload: Dict[str, Any]) -> Any:
         history=history,
         system_text=system_text,
         model_user_text=model_user_text,
-        images_b64=[],
+        images_b64=images_b64,
         params=params,
         think_mode=str(think_mode),
         show_trace=show_trace,
         request_id=request_id,
+        reply_after=(sess.version + 1, len(sess.messages)),
+        provider=provider,
+        loaded_model=loaded_model,
         request_meta={"regenerate": True, "retry_mode": retry_mode},
     )
 
 
 def run() -> None:
-    uvicorn.run("snlite.main:app", host=SNLITE_HOST, port=SNLITE_PORT, reload=False)
+    # every worker process opens the store on the shared data dir; the store
+    # coordinates them (see SessionStore / SQLiteSessionStore). Everything
+    # else stays per process: stream resume buffers, the stop/cancel
+    # registry, scheduler limits, warm models and the search index (readme:
+    # "Several workers")
+    uvicorn.run(
+        "snlite.main:app",
+        host=SNLITE_HOST,
+        port=SNLITE_PORT,
+        reload=False,
+        workers=max(1, SNLITE_WORKERS),
+    )
 
 
 if __name__ == "__main__":
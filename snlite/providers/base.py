@@ -47,5 +47,8 @@ class Provider(ABC):
         Yields dict chunks.
         Typical shape: {"thinking": "...", "content": "..."}.
         cancelled(): bool -> return True if should cancel
+        The caller may also stop the stream at any await (task cancellation,
+        then aclose()): open upstream requests in `async with` / `finally` so
+        they are closed right away.
         """
         ...
@@ -1,11 +1,11 @@
 from __future__ import annotations
 
-import json
 from dataclasses import dataclass
 from typing import Any, AsyncIterator, Callable, Dict, List, Optional
 
 import httpx
 
+from snlite import codec
 from snlite.providers.base import Provider
 
 
@@ -116,17 +116,18 @@ class OllamaProvider(Provider):
 
         url = f"{self.base_url}/api/chat"
 
-        async with self._client.stream("POST", url, json=payload) as resp:
+        # the payload can carry base64 images: encode it with the fast codec
+        body = codec.dumpb(payload)
+        headers = {"Content-Type": "application/json"}
+        async with self._client.stream("POST", url, content=body, headers=headers) as resp:
             resp.raise_for_status()
 
-            async for line in resp.aiter_lines():
+            async for line in _iter_ndjson_lines(resp):
                 if cancelled():
                     return
-                if not line:
-                    continue
 
                 try:
-                    obj = json.loads(line)
+                    obj = codec.loads(line)
                 except Exception:
                     continue
 
@@ -146,3 +147,16 @@ class OllamaProvider(Provider):
 
     async def aclose(self) -> None:
         await self._client.aclose()
+
+
+async def _iter_ndjson_lines(resp: httpx.Response) -> AsyncIterator[bytes]:
+    """Non-empty lines of a streamed NDJSON body, as bytes (no text decoding pass)."""
+    buf = b""
+    async for chunk in resp.aiter_bytes():
+        buf += chunk
+        *lines, buf = buf.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buf.strip():
+        yield buf
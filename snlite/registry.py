@@ -2,7 +2,7 @@ from __future__ import annotations
 
 import asyncio
 from dataclasses import dataclass
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from uuid import uuid4
 
 from snlite.providers.base import Provider
@@ -13,17 +13,32 @@ class LoadedModel:
     model_id: str
     meta: Dict[str, Any]
 
+
+class ModelsBusy(Exception):
+    """The warm set is full and every model in it is in use."""
+    def __init__(self, limit: int) -> None:
+        super().__init__(f"all {limit} warm models are in use")
+        self.limit = limit
+
+
 class AppRegistry:
     """
     Thread-safe-ish registry for:
-    - current provider
-    - current selected model
+    - warm models: up to `max_models` models loaded (warmed up), with the
+      number of streams using each; different sessions can use different
+      models at once. Adding one more evicts the least recently used model
+      no stream uses, the default only if no other (ModelsBusy if none is idle)
+    - the default model (the last one loaded), for requests that name none
     - streaming cancellation flags
     """
-    def __init__(self) -> None:
+    def __init__(self, max_models: int = 4) -> None:
         self._lock = asyncio.Lock()
+        self.max_models = max(1, max_models)
         self._provider: Optional[Provider] = None
         self._loaded: Optional[LoadedModel] = None
+        self._models: Dict[Tuple[str, str], Tuple[Provider, LoadedModel]] = {}  # least recently used first
+        self._refs: Dict[Tuple[str, str], int] = {}
+        self._draining: Dict[Tuple[str, str], Provider] = {}  # dropped while streams still use them
         self._status: str = "idle"  # idle | loading | ready | error
         self._error: Optional[str] = None
         self._active_streams: Dict[str, asyncio.Event] = {}  # request_id -> cancel_event
@@ -37,7 +52,16 @@ class AppRegistry:
                     "provider": self._loaded.provider_name,
                     "model_id": self._loaded.model_id,
                     "meta": self._loaded.meta,
-                }
+                },
+                "models": [
+                    {
+                        "provider": m.provider_name,
+                        "model_id": m.model_id,
+                        "meta": m.meta,
+                        "streams": self._refs.get(key, 0),
+                    }
+                    for key, (_, m) in self._models.items()
+                ],
             }
 
     async def set_error(self, msg: str) -> None:
@@ -56,22 +80,109 @@ class AppRegistry:
             self._error = None
 
     async def set_provider_and_model(self, provider: Provider, provider_name: str, model_id: str, meta: Dict[str, Any]) -> None:
+        """Add the model to the warm set and make it the default."""
         async with self._lock:
+            key = (provider_name, model_id)
+            if key not in self._models:
+                await self._make_room()
             self._provider = provider
             self._loaded = LoadedModel(provider_name=provider_name, model_id=model_id, meta=meta)
+            self._models.pop(key, None)  # most recently used last
+            self._models[key] = (provider, self._loaded)
+            self._draining.pop(key, None)
             self._status = "ready"
             self._error = None
 
-    async def unload(self) -> None:
+    async def add_model(self, provider: Provider, provider_name: str, model_id: str, meta: Dict[str, Any]) -> LoadedModel:
+        """Add the model to the warm set; the default stays as it is."""
+        async with self._lock:
+            key = (provider_name, model_id)
+            entry = self._models.get(key)
+            if entry is None:
+                await self._make_room()
+                entry = self._models[key] = (
+                    provider, LoadedModel(provider_name=provider_name, model_id=model_id, meta=meta)
+                )
+                self._draining.pop(key, None)
+            return entry[1]
+
+    async def _make_room(self) -> None:
+        """
+        Evict idle models, least recently used first and the default last,
+        until one more fits. Caller holds `self._lock`.
+        """
+        while len(self._models) >= self.max_models:
+            idle = [key for key in self._models if not self._refs.get(key)]
+            if not idle:
+                raise ModelsBusy(self.max_models)
+            idle.sort(key=lambda key: self._models[key][1] is self._loaded)  # stable: LRU order otherwise
+            await self._drop(idle[0])
+
+    async def _drop(self, key: Tuple[str, str]) -> None:
+        """
+        Remove a model from the warm set. Caller holds `self._lock`. Its
+        provider is unloaded once no warm model and no running stream uses it.
+        """
+        entry = self._models.pop(key, None)
+        if entry is None:
+            return
+        if self._loaded is entry[1]:
+            # the most recently used model left becomes the default
+            rest = list(self._models.values())
+            self._provider, self._loaded = rest[-1] if rest else (None, None)
+        if self._refs.get(key):
+            self._draining[key] = entry[0]
+        else:
+            await self._unload_if_unused(entry[0])
+
+    async def _unload_if_unused(self, provider: Provider) -> None:
+        if any(p is provider for p, _ in self._models.values()):
+            return
+        if any(p is provider for p in self._draining.values()):
+            return
+        try:
+            await provider.unload()
+        except Exception:
+            pass
+
+    async def get_model(self, provider_name: str, model_id: str) -> Optional[Tuple[Provider, LoadedModel]]:
+        async with self._lock:
+            key = (provider_name, model_id)
+            entry = self._models.pop(key, None)
+            if entry is not None:
+                self._models[key] = entry  # most recently used last
+            return entry
+
+    async def acquire_model(self, model: LoadedModel) -> None:
+        async with self._lock:
+            key = (model.provider_name, model.model_id)
+            self._refs[key] = self._refs.get(key, 0) + 1
+
+    async def release_model(self, model: LoadedModel) -> None:
         async with self._lock:
-            if self._provider:
-                try:
-                    await self._provider.unload()
-                except Exception:
-                    pass
-            self._provider = None
-            self._loaded = None
-            self._status = "idle"
+            key = (model.provider_name, model.model_id)
+            n = self._refs.get(key, 0) - 1
+            if n > 0:
+                self._refs[key] = n
+                return
+            self._refs.pop(key, None)
+            provider = self._draining.pop(key, None)
+            if provider is not None:
+                await self._unload_if_unused(provider)
+
+    async def unload(self, provider_name: Optional[str] = None, model_id: Optional[str] = None) -> None:
+        """
+        Drop a model (default: the default model) from the warm set. Streams
+        already using it finish normally; the provider itself is unloaded once
+        none of its models is warm or in use any more.
+        """
+        async with self._lock:
+            if model_id is None:
+                if not self._loaded:
+                    return
+                provider_name, model_id = self._loaded.provider_name, self._loaded.model_id
+            await self._drop((str(provider_name), model_id))
+            self._status = "ready" if self._loaded else "idle"
             self._error = None
 
     async def get_provider(self) -> Optional[Provider]:
@@ -100,7 +211,7 @@ class AppRegistry:
         async with self._lock:
             self._active_streams.pop(request_id, None)
 
-    async def is_cancelled(self, request_id: str) -> bool:
+    async def stream_event(self, request_id: str) -> Optional[asyncio.Event]:
+        """The cancel event of a stream, set by `cancel_stream`; the generation waits on it."""
         async with self._lock:
-            ev = self._active_streams.get(request_id)
-            return bool(ev and ev.is_set())
\ No newline at end of file
+            return self._active_streams.get(request_id)
\ No newline at end of file
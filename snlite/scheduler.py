@@ -0,0 +1,170 @@
+from __future__ import annotations
+
+import asyncio
+import bisect
+import itertools
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+# Lanes, served in this order: chat streams first, background work (auto
+# titles) only when no interactive request is waiting for the same slot.
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class SchedulerBusy(Exception):
+    """The wait queue is full; the request was not admitted."""
+    def __init__(self, queued: int) -> None:
+        super().__init__(f"server busy: {queued} requests already waiting")
+        self.queued = queued
+
+
+@dataclass(order=True)
+class _Waiter:
+    lane: int
+    seq: int
+    provider: str = field(compare=False)
+    model: str = field(compare=False)
+    future: "asyncio.Future[None]" = field(compare=False)
+    on_position: Optional[Callable[[int], None]] = field(compare=False, default=None)
+    position: int = field(compare=False, default=0)
+
+
+class Scheduler:
+    """
+    Admission control in front of the providers.
+
+    - at most `per_provider` requests run on one provider and `per_model` on
+      one model at a time (0 = no limit)
+    - the others wait in a bounded queue: lane first, then arrival order; a
+      waiter whose provider/model is full does not hold back waiters for
+      other models
+    - `on_position` is told the waiter's 1-based place in the queue whenever
+      it changes (the chat stream turns it into `status` events)
+    - a full queue raises SchedulerBusy right away instead of piling up work
+      the box cannot serve (`max_queue` 0: never wait)
+    """
+    def __init__(self, per_provider: int = 2, per_model: int = 1, max_queue: int = 32) -> None:
+        self.per_provider = max(0, per_provider)
+        self.per_model = max(0, per_model)
+        self.max_queue = max(0, max_queue)
+        self._running: Dict[Tuple[str, str], int] = {}
+        self._running_by_provider: Dict[str, int] = {}
+        self._waiting: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._stats = {"admitted": 0, "queued": 0, "rejected": 0, "abandoned": 0}
+
+    def _fits(self, provider: str, model: str) -> bool:
+        if self.per_provider and self._running_by_provider.get(provider, 0) >= self.per_provider:
+            return False
+        if self.per_model and self._running.get((provider, model), 0) >= self.per_model:
+            return False
+        return True
+
+    def _free(self, provider: str, model: str) -> bool:
+        # after a dispatch no waiter fits, so if this fits and nobody queued
+        # for the same provider, nobody could take the slot before us
+        return self._fits(provider, model) and not any(w.provider == provider for w in self._waiting)
+
+    def admits(self, provider: str, model: str) -> bool:
+        """False (counted as rejected) if `acquire` would raise SchedulerBusy right now."""
+        if self._free(provider, model) or len(self._waiting) < self.max_queue:
+            return True
+        self._stats["rejected"] += 1
+        return False
+
+    def _take(self, provider: str, model: str) -> None:
+        self._running[(provider, model)] = self._running.get((provider, model), 0) + 1
+        self._running_by_provider[provider] = self._running_by_provider.get(provider, 0) + 1
+        self._stats["admitted"] += 1
+
+    def _release(self, provider: str, model: str) -> None:
+        key = (provider, model)
+        self._running[key] -= 1
+        if not self._running[key]:
+            del self._running[key]
+        self._running_by_provider[provider] -= 1
+        if not self._running_by_provider[provider]:
+            del self._running_by_provider[provider]
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admit every waiter that fits now, in queue order; then update positions."""
+        still: List[_Waiter] = []
+        for w in self._waiting:
+            if not w.future.done() and self._fits(w.provider, w.model):
+                self._take(w.provider, w.model)
+                w.future.set_result(None)
+            elif not w.future.done():
+                still.append(w)
+        self._waiting = still
+        for position, w in enumerate(self._waiting, 1):
+            if w.position != position:
+                w.position = position
+                if w.on_position is not None:
+                    w.on_position(position)
+
+    async def acquire(
+        self,
+        provider: str,
+        model: str,
+        lane: int = INTERACTIVE,
+        on_position: Optional[Callable[[int], None]] = None,
+    ) -> None:
+        """Wait for a slot; pair with `release` (or use `slot`)."""
+        if self._free(provider, model):
+            self._take(provider, model)
+            return
+        if len(self._waiting) >= self.max_queue:
+            self._stats["rejected"] += 1
+            raise SchedulerBusy(len(self._waiting))
+        loop = asyncio.get_event_loop()
+        w = _Waiter(lane, next(self._seq), provider, model, loop.create_future(), on_position)
+        bisect.insort(self._waiting, w)
+        self._stats["queued"] += 1
+        self._dispatch()
+        try:
+            await w.future
+        except BaseException:
+            # cancelled (or timed out) while queued; if the slot was granted
+            # in the same tick, hand it on
+            if w.future.done() and not w.future.cancelled():
+                self._release(provider, model)
+            else:
+                self._waiting = [x for x in self._waiting if x is not w]
+                self._dispatch()
+            self._stats["abandoned"] += 1
+            raise
+
+    def release(self, provider: str, model: str) -> None:
+        self._release(provider, model)
+
+    @asynccontextmanager
+    async def slot(
+        self,
+        provider: str,
+        model: str,
+        lane: int = INTERACTIVE,
+        on_position: Optional[Callable[[int], None]] = None,
+    ) -> AsyncIterator[None]:
+        await self.acquire(provider, model, lane=lane, on_position=on_position)
+        try:
+            yield
+        finally:
+            self.release(provider, model)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "per_provider": self.per_provider,
+            "per_model": self.per_model,
+            "max_queue": self.max_queue,
+            "running": [
+                {"provider": p, "model": m, "count": n} for (p, m), n in sorted(self._running.items())
+            ],
+            "waiting": [
+                {"provider": w.provider, "model": w.model, "lane": w.lane, "position": i}
+                for i, w in enumerate(self._waiting, 1)
+            ],
+            **self._stats,
+        }
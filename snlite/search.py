@@ -0,0 +1,472 @@
+from __future__ import annotations
+
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from snlite import codec
+from snlite.store import BaseSessionStore, Session
+
+# CJK text has no spaces: runs of these characters are indexed as single
+# characters plus overlapping bigrams, everything else as lowercase words.
+_CJK = "\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[^\W_{_CJK}]+")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+MAX_WORD_CHARS = 40  # longer "words" are base64/hash noise
+
+TITLE_WEIGHT = 3
+SNIPPET_BEFORE = 40
+SNIPPET_AFTER = 80
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Index terms of `text`: lowercase words, CJK unigrams and bigrams."""
+    out: List[str] = []
+    for run in _TOKEN_RE.findall(text.lower()):
+        if _CJK_RE.match(run):
+            out.extend(run)
+            out.extend(run[i:i + 2] for i in range(len(run) - 1))
+        elif len(run) <= MAX_WORD_CHARS:
+            out.append(run)
+    return out
+
+
+def query_terms(query: str) -> List[str]:
+    """
+    Terms a document must contain to match `query`: words as-is, CJK runs
+    as their bigrams (a single CJK character as itself).
+    """
+    out: List[str] = []
+    for run in _TOKEN_RE.findall(query.lower()):
+        if _CJK_RE.match(run) and len(run) > 1:
+            out.extend(run[i:i + 2] for i in range(len(run) - 1))
+        elif len(run) <= MAX_WORD_CHARS:
+            out.append(run)
+    return list(dict.fromkeys(out))
+
+
+def _message_text(message: Dict[str, Any]) -> str:
+    content = message.get("content")
+    return content if isinstance(content, str) else str(content or "")
+
+
+def _digest(message: Dict[str, Any]) -> str:
+    raw = f"{message.get('role')}\0{_message_text(message)}".encode("utf-8", errors="replace")
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _count(terms: Dict[str, int], tokens: Iterable[str], weight: int = 1) -> None:
+    for t in tokens:
+        terms[t] = terms.get(t, 0) + weight
+
+
+@dataclass(slots=True)
+class _Doc:
+    """One indexed session ("s:<id>") or archive ("a:<archive_id>")."""
+    kind: str  # session | archive
+    ref: str
+    title: str
+    group: str
+    ts: float  # updated_at (session) / archived_at (archive)
+    terms: Dict[str, int] = field(default_factory=dict)
+    count: int = 0  # messages indexed (sessions)
+    tail: str = ""  # digest of the last indexed message (sessions)
+    length: int = 0  # total term count, for BM25 length normalization
+
+
+class SearchIndex:
+    """
+    Inverted index over session messages and archive bodies, for /api/search.
+
+    - kept current by the writer: after every store write the matching hook
+      below (`index_session`, `session_appended`, ...) updates the one
+      affected document, usually from the data just written, so an appended
+      message is tokenized on its own and nothing is re-read. Queries never
+      refresh
+    - `refresh` catches up with writes the hooks did not see (other worker
+      processes, imports, retention): it runs on the maintenance thread and
+      once before the first query. A session whose updated_at changed is
+      re-read; if it only gained messages (its last indexed message is
+      unchanged) only the new tail is fetched and tokenized. New archives are
+      indexed once (they never change), and sessions/archives that
+      disappeared are dropped
+    - per-document term counts are persisted to `path` (JSON); on startup
+      the postings are rebuilt from them without re-reading any content
+    - hits need every query term and are ranked with BM25 (title terms
+      weigh TITLE_WEIGHT times); snippets are cut for the requested page only
+
+    The store is only read, so any engine works and several worker processes
+    can each keep their own copy (seeing each other's writes after the next
+    refresh).
+    """
+    def __init__(self, store: BaseSessionStore, path: str) -> None:
+        self.store = store
+        self.path = path
+        self._lock = threading.RLock()
+        self._docs: Dict[str, _Doc] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._dirty = False
+        self._fresh: Set[str] = set()  # keys updated by hooks since the current refresh listed the store
+        self._stats: Dict[str, Any] = {
+            "refreshes": 0,
+            "reindexed": 0,
+            "tail_updates": 0,
+            "hook_updates": 0,
+            "last_refresh_ms": 0,
+        }
+        self._load()
+
+    # ---- persistence ----
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "rb") as f:
+                data = codec.loads(f.read())
+            if data.get("version") != 1:
+                return
+            docs = {key: _Doc(**d) for key, d in data["docs"].items()}
+        except (OSError, ValueError, KeyError, TypeError):
+            return
+        for key, doc in docs.items():
+            self._add(key, doc)
+
+    def flush(self) -> None:
+        """Persist the index if it changed since the last flush."""
+        with self._lock:
+            if not self._dirty:
+                return
+            data = {"version": 1, "docs": self._docs}
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(codec.dumpb(data))
+            os.replace(tmp, self.path)
+            self._dirty = False
+
+    # ---- postings ----
+
+    def _add(self, key: str, doc: _Doc) -> None:
+        self._remove(key)
+        doc.length = sum(doc.terms.values())
+        self._docs[key] = doc
+        for term, tf in doc.terms.items():
+            self._postings.setdefault(term, {})[key] = tf
+        self._total_length += doc.length
+        self._dirty = True
+
+    def _remove(self, key: str) -> None:
+        doc = self._docs.pop(key, None)
+        if not doc:
+            return
+        for term in doc.terms:
+            posting = self._postings.get(term)
+            if posting is not None:
+                posting.pop(key, None)
+                if not posting:
+                    del self._postings[term]
+        self._total_length -= doc.length
+        self._dirty = True
+
+    # ---- refresh ----
+
+    def refresh(self) -> Dict[str, int]:
+        """Bring the index up to date with the store; returns what changed."""
+        started = time.time()
+        changed = {"indexed": 0, "removed": 0}
+        with self._lock:
+            self._fresh.clear()
+        # listed without the lock so hooks (and queries) are not held up;
+        # documents a hook updates meanwhile are newer than these rows
+        sessions = self.store.list_sessions()
+        archives = self.store.list_archives()
+        with self._lock:
+            seen: Set[str] = set(self._fresh)
+            for row in sessions:
+                key = f"s:{row['id']}"
+                seen.add(key)
+                if key in self._fresh:
+                    continue
+                doc = self._docs.get(key)
+                if doc and doc.ts == row["updated_at"] and doc.title == row["title"]:
+                    doc.group = row["group"]
+                    continue
+                if self._index_session(key, row, doc):
+                    changed["indexed"] += 1
+            for row in archives:
+                key = f"a:{row.get('archive_id')}"
+                seen.add(key)
+                if key not in self._docs and self._index_archive(key, row):
+                    changed["indexed"] += 1
+            for key in [k for k in self._docs if k not in seen]:
+                self._remove(key)
+                changed["removed"] += 1
+            self._stats["refreshes"] += 1
+            self._stats["last_refresh_ms"] = int((time.time() - started) * 1000)
+        return changed
+
+    def _index_session(self, key: str, row: Dict[str, Any], doc: Optional[_Doc]) -> bool:
+        total = int(row.get("message_count") or 0)
+        if doc and doc.count and doc.title == row["title"] and total == doc.count:
+            # regrouped or touched: nothing to re-tokenize if the last message is the same
+            found = self.store.get_session_window(row["id"], limit=1)
+            if found and found[0].messages and _digest(found[0].messages[0]) == doc.tail:
+                doc.ts, doc.group = row["updated_at"], row["group"]
+                self._dirty = True
+                return False
+        if doc and doc.count and doc.title == row["title"] and total > doc.count:
+            # common case: new turns were appended; read just the tail
+            found = self.store.get_session_window(row["id"], limit=total - doc.count + 1)
+            if found:
+                sess, _ = found
+                if sess.messages and _digest(sess.messages[0]) == doc.tail:
+                    terms = dict(doc.terms)
+                    for m in sess.messages[1:]:
+                        _count(terms, tokenize(_message_text(m)))
+                    self._add(key, _Doc(
+                        kind="session", ref=row["id"], title=row["title"], group=row["group"],
+                        ts=row["updated_at"], terms=terms, count=doc.count + len(sess.messages) - 1,
+                        tail=_digest(sess.messages[-1]),
+                    ))
+                    self._stats["tail_updates"] += 1
+                    return True
+        sess = self.store.get_session(row["id"])
+        if not sess:
+            self._remove(key)
+            return False
+        terms: Dict[str, int] = {}
+        _count(terms, tokenize(sess.title), TITLE_WEIGHT)
+        for m in sess.messages:
+            _count(terms, tokenize(_message_text(m)))
+        self._add(key, _Doc(
+            kind="session", ref=sess.id, title=sess.title, group=sess.group, ts=sess.updated_at,
+            terms=terms, count=len(sess.messages), tail=_digest(sess.messages[-1]) if sess.messages else "",
+        ))
+        self._stats["reindexed"] += 1
+        return True
+
+    def _index_archive(self, key: str, row: Dict[str, Any]) -> bool:
+        item = self.store.get_archive(str(row.get("archive_id")))
+        if not item:
+            return False
+        terms: Dict[str, int] = {}
+        _count(terms, tokenize(str(item.get("title") or "")), TITLE_WEIGHT)
+        _count(terms, tokenize(item["content"]))
+        self._add(key, _Doc(
+            kind="archive", ref=str(item.get("archive_id")), title=str(item.get("title") or ""),
+            group=str(item.get("group") or ""), ts=float(item.get("archived_at") or 0), terms=terms,
+        ))
+        return True
+
+    def maintain(self) -> None:
+        """Refresh and persist; run on the store's maintenance thread."""
+        self.refresh()
+        self.flush()
+
+    # ---- write hooks ----
+
+    def _hooked(self, key: str) -> None:
+        """Caller holds `self._lock`."""
+        self._fresh.add(key)
+        self._stats["hook_updates"] += 1
+
+    def index_session(self, sess: Session) -> None:
+        """A session was saved, renamed or regrouped; `sess` is its new state."""
+        key = f"s:{sess.id}"
+        tail = _digest(sess.messages[-1]) if sess.messages else ""
+        with self._lock:
+            self._hooked(key)
+            doc = self._docs.get(key)
+            if doc and doc.title == sess.title and doc.count == len(sess.messages) and doc.tail == tail:
+                doc.ts, doc.group = sess.updated_at, sess.group
+                self._dirty = True
+                return
+            terms: Dict[str, int] = {}
+            _count(terms, tokenize(sess.title), TITLE_WEIGHT)
+            for m in sess.messages:
+                _count(terms, tokenize(_message_text(m)))
+            self._add(key, _Doc(
+                kind="session", ref=sess.id, title=sess.title, group=sess.group, ts=sess.updated_at,
+                terms=terms, count=len(sess.messages), tail=tail,
+            ))
+
+    def session_appended(self, session_id: str, message: Dict[str, Any]) -> None:
+        """`message` was appended to a session: only its own terms are added."""
+        self._step(session_id, message, +1)
+
+    def session_popped(self, session_id: str, message: Dict[str, Any]) -> None:
+        """`message` was removed from the end of a session: its terms are taken out."""
+        self._step(session_id, message, -1)
+
+    def _step(self, session_id: str, message: Dict[str, Any], sign: int) -> None:
+        row = self.store.get_session_meta(session_id)
+        key = f"s:{session_id}"
+        with self._lock:
+            self._hooked(key)
+            doc = self._docs.get(key)
+            if row is None:
+                self._remove(key)
+                return
+            if not doc or doc.title != row["title"] or doc.count + sign != row["message_count"]:
+                # the document lags behind (another process wrote too): re-read it
+                self._index_session(key, row, doc)
+                return
+            terms = dict(doc.terms)
+            for t in tokenize(_message_text(message)):
+                terms[t] = terms.get(t, 0) + sign
+                if terms[t] <= 0:
+                    del terms[t]
+            self._add(key, _Doc(
+                kind="session", ref=session_id, title=row["title"], group=row["group"], ts=row["updated_at"],
+                terms=terms, count=row["message_count"],
+                # after a pop the new last message is unknown: a later refresh re-reads
+                tail=_digest(message) if sign > 0 else "",
+            ))
+
+    def session_regrouped(self, session_id: str) -> None:
+        """A bulk regroup moved a session; only its group and timestamp change."""
+        row = self.store.get_session_meta(session_id)
+        key = f"s:{session_id}"
+        with self._lock:
+            self._hooked(key)
+            doc = self._docs.get(key)
+            if row is None:
+                self._remove(key)
+            elif doc:
+                doc.ts, doc.group = row["updated_at"], row["group"]
+                self._dirty = True
+
+    def session_deleted(self, session_id: str) -> None:
+        key = f"s:{session_id}"
+        with self._lock:
+            self._hooked(key)
+            self._remove(key)
+
+    def session_archived(self, archive: Dict[str, Any]) -> None:
+        """A session was archived: its document is replaced by the archive's."""
+        self.session_deleted(str(archive.get("session_id")))
+        key = f"a:{archive.get('archive_id')}"
+        with self._lock:
+            self._hooked(key)
+            self._index_archive(key, archive)
+
+    def archive_deleted(self, archive_id: str) -> None:
+        key = f"a:{archive_id}"
+        with self._lock:
+            self._hooked(key)
+            self._remove(key)
+
+    # ---- query ----
+
+    def search(
+        self,
+        query: str,
+        limit: int = 20,
+        offset: int = 0,
+        kind: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        Ranked hits for `query`: {"query", "total", "items", "next_offset"}.
+        `kind` restricts hits to "session" or "archive".
+        """
+        if not self._stats["refreshes"]:
+            self.refresh()  # first query of this process: catch up with what changed while it was down
+        terms = query_terms(query)
+        with self._lock:
+            ranked = self._rank(terms, kind)
+        total = len(ranked)
+        page = ranked[offset:offset + limit]
+        items = [self._hit(doc, score, query, terms) for doc, score in page]
+        return {
+            "query": query,
+            "total": total,
+            "items": items,
+            "next_offset": offset + limit if offset + limit < total else None,
+        }
+
+    def _rank(self, terms: List[str], kind: Optional[str]) -> List[Tuple[_Doc, float]]:
+        """Documents containing every term, best first. Caller holds `self._lock`."""
+        if not terms or not self._docs:
+            return []
+        postings = [self._postings.get(t) for t in terms]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        keys = set(postings[0])
+        for p in postings[1:]:
+            keys.intersection_update(p)
+        n = len(self._docs)
+        avg_len = (self._total_length / n) or 1.0
+        out: List[Tuple[_Doc, float]] = []
+        for key in keys:
+            doc = self._docs[key]
+            if kind and doc.kind != kind:
+                continue
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * doc.length / avg_len)
+            score = 0.0
+            for t in terms:
+                df = len(self._postings[t])
+                tf = doc.terms[t]
+                score += math.log(1 + (n - df + 0.5) / (df + 0.5)) * tf * (BM25_K1 + 1) / (tf + norm)
+            out.append((doc, score))
+        out.sort(key=lambda x: (x[1], x[0].ts), reverse=True)
+        return out
+
+    def _hit(self, doc: _Doc, score: float, query: str, terms: List[str]) -> Dict[str, Any]:
+        hit: Dict[str, Any] = {
+            "kind": doc.kind,
+            "id": doc.ref,
+            "title": doc.title,
+            "group": doc.group,
+            "score": round(score, 4),
+        }
+        needles = [w for w in query.lower().split() if w] + terms
+        if doc.kind == "session":
+            hit["updated_at"] = doc.ts
+            sess = self.store.get_session(doc.ref)
+            for i, m in enumerate(sess.messages if sess else []):
+                snippet = _snippet(_message_text(m), needles)
+                if snippet is not None:
+                    hit["message_index"] = i
+                    hit["snippet"] = snippet
+                    break
+        else:
+            hit["archived_at"] = doc.ts
+            item = self.store.get_archive(doc.ref)
+            if item:
+                hit["snippet"] = _snippet(item["content"], needles)
+        hit.setdefault("snippet", None)
+        return hit
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "documents": len(self._docs),
+                "terms": len(self._postings),
+                **self._stats,
+            }
+
+
+def _snippet(text: str, needles: List[str]) -> Optional[str]:
+    """Text around the first needle found in `text` (whitespace collapsed), or None."""
+    lower = text.lower()
+    pos = -1
+    found = ""
+    for needle in needles:
+        pos = lower.find(needle)
+        if pos >= 0:
+            found = needle
+            break
+    if pos < 0:
+        return None
+    start = max(0, pos - SNIPPET_BEFORE)
+    end = min(len(text), pos + len(found) + SNIPPET_AFTER)
+    snippet = " ".join(text[start:end].split())
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
@@ -0,0 +1,242 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+
+from snlite import codec
+
+# Token events that may be merged; their payload is {"token": text}.
+TOKEN_EVENTS = ("thinking", "content")
+
+
+class TokenCoalescer:
+    """
+    Merges streamed `thinking` / `content` tokens into fewer SSE events.
+
+    - the first token of each kind is sent at once, so time to first token
+      does not change
+    - after that, tokens are buffered until `interval` seconds have passed
+      since the last flush or the buffer holds `max_bytes` (UTF-8)
+    - a token of the other kind flushes the buffer first, so the order of
+      thinking and content is kept
+    - `interval` 0 disables buffering: every token is its own event
+
+    `add` and `flush` return the (event, text) pairs to send now; the stream
+    loop calls `flush` once `due_in` has elapsed even if no token arrives.
+    """
+    def __init__(self, interval: float, max_bytes: int = 4096) -> None:
+        self.interval = max(0.0, interval)
+        self.max_bytes = max(1, max_bytes)
+        self._kind: Optional[str] = None
+        self._parts: List[str] = []
+        self._bytes = 0
+        self._flushed_at = 0.0
+        self._seen: set = set()
+        self.tokens = 0
+        self.events = 0
+
+    def add(self, kind: str, token: str, now: float) -> List[Tuple[str, str]]:
+        self.tokens += 1
+        out: List[Tuple[str, str]] = []
+        if self._kind is not None and kind != self._kind:
+            out.extend(self.flush(now))
+        if not self.interval or kind not in self._seen:
+            self._seen.add(kind)
+            out.extend(self.flush(now))
+            out.append((kind, token))
+            self.events += 1
+            self._flushed_at = now
+            return out
+        self._kind = kind
+        self._parts.append(token)
+        self._bytes += len(token.encode("utf-8"))
+        if self._bytes >= self.max_bytes or now - self._flushed_at >= self.interval:
+            out.extend(self.flush(now))
+        return out
+
+    def due_in(self, now: float) -> Optional[float]:
+        """Seconds until the buffer must be flushed; None if it is empty."""
+        if not self._parts:
+            return None
+        return max(0.0, self._flushed_at + self.interval - now)
+
+    def flush(self, now: float) -> List[Tuple[str, str]]:
+        if not self._parts:
+            return []
+        out = [(str(self._kind), "".join(self._parts))]
+        self._parts, self._bytes, self._kind = [], 0, None
+        self._flushed_at = now
+        self.events += 1
+        return out
+
+    def stats(self) -> Dict[str, Any]:
+        return {"tokens": self.tokens, "events": self.events}
+
+
+class StreamBuffer:
+    """
+    The events of one generation, numbered and kept in a ring buffer so a
+    client can reconnect and resume (SSE `Last-Event-ID`).
+
+    - every published event gets the next id (1, 2, ...) and is encoded once
+    - the newest `capacity` events are kept; the token text of all events is
+      also accumulated, so a client that fell behind the ring gets one
+      `resync` event (the {"content", "thinking"} text before the oldest kept
+      event) instead of a gap, then the kept events
+    - any number of followers may read it; the generation that publishes
+      never waits for them
+    - if no follower is attached for `abandon_after` seconds (the last one
+      disconnected, or none came at all since the buffer was created),
+      `on_abandoned` is called so the generation can be cancelled; None
+      never gives up on it
+    """
+    def __init__(
+        self,
+        capacity: int = 2048,
+        abandon_after: Optional[float] = None,
+        on_abandoned: Optional[Callable[[], None]] = None,
+    ) -> None:
+        # (id, frame, len(content), len(thinking) before this event)
+        self._events: Deque[Tuple[int, bytes, int, int]] = deque(maxlen=max(1, capacity))
+        self._last_id = 0
+        self._changed = asyncio.Event()
+        # token text so far, as parts (joined only for a resync) and lengths
+        self._text: Dict[str, List[str]] = {"content": [], "thinking": []}
+        self._text_len: Dict[str, int] = {"content": 0, "thinking": 0}
+        self.finished_at: Optional[float] = None
+        self.abandon_after = abandon_after
+        self.on_abandoned = on_abandoned
+        self.abandoned = False
+        self._followers = 0
+        self._abandon_timer: Optional[asyncio.TimerHandle] = None
+        self._arm_abandon()  # a client may drop before it ever follows
+
+    @property
+    def last_id(self) -> int:
+        return self._last_id
+
+    @property
+    def followers(self) -> int:
+        return self._followers
+
+    @property
+    def content(self) -> str:
+        return "".join(self._text["content"])
+
+    @property
+    def thinking(self) -> str:
+        return "".join(self._text["thinking"])
+
+    def publish(self, event: str, data: Dict[str, Any]) -> None:
+        self._last_id += 1
+        frame = codec.sse(event, data, event_id=self._last_id)
+        self._events.append((self._last_id, frame, self._text_len["content"], self._text_len["thinking"]))
+        if event in self._text:
+            token = data.get("token") or ""
+            if token:
+                self._text[event].append(token)
+                self._text_len[event] += len(token)
+        self._notify()
+
+    def finish(self) -> None:
+        self.finished_at = time.monotonic()
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+        self._notify()
+
+    def _attach(self) -> None:
+        self._followers += 1
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+            self._abandon_timer = None
+
+    def _detach(self) -> None:
+        self._followers -= 1
+        self._arm_abandon()
+
+    def _arm_abandon(self) -> None:
+        if self._followers or self.finished_at is not None or self.abandon_after is None:
+            return
+        if self._abandon_timer is not None:
+            self._abandon_timer.cancel()
+        loop = asyncio.get_event_loop()
+        self._abandon_timer = loop.call_later(max(0.0, self.abandon_after), self._abandon)
+
+    def _abandon(self) -> None:
+        self._abandon_timer = None
+        if self._followers or self.finished_at is not None or self.abandoned:
+            return
+        self.abandoned = True
+        if self.on_abandoned is not None:
+            self.on_abandoned()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self, last_id: Optional[int] = None) -> AsyncIterator[bytes]:
+        """Events after `last_id` (all if None) until the generation finishes."""
+        sent = max(0, last_id or 0)
+        self._attach()
+        try:
+            while True:
+                oldest = self._events[0][0] if self._events else self._last_id + 1
+                if sent + 1 < oldest:
+                    # fell behind the ring: the text up to its oldest event instead
+                    _, _, content_len, thinking_len = self._events[0]
+                    sent = oldest - 1
+                    text = {"content": self.content[:content_len], "thinking": self.thinking[:thinking_len]}
+                    yield codec.sse("resync", text, event_id=sent)
+                for event_id, frame, _, _ in itertools.islice(self._events, max(0, sent + 1 - oldest), None):
+                    sent = event_id
+                    yield frame
+                if self.finished_at is not None and sent >= self._last_id:
+                    return
+                if sent >= self._last_id:
+                    await self._changed.wait()
+        finally:
+            self._detach()
+
+class StreamHub:
+    """
+    StreamBuffers by request id. A buffer stays available for `grace`
+    seconds after its generation finished, so a client that lost the
+    connection near the end can still fetch the rest; see StreamBuffer for
+    `abandon_after`.
+    """
+    def __init__(self, capacity: int = 2048, grace: float = 60.0, abandon_after: Optional[float] = None) -> None:
+        self.capacity = capacity
+        self.grace = grace
+        self.abandon_after = abandon_after
+        self._buffers: Dict[str, StreamBuffer] = {}
+
+    def open(self, request_id: str, on_abandoned: Optional[Callable[[], None]] = None) -> StreamBuffer:
+        self._expire()
+        buf = self._buffers[request_id] = StreamBuffer(self.capacity, self.abandon_after, on_abandoned)
+        return buf
+
+    def get(self, request_id: str) -> Optional[StreamBuffer]:
+        self._expire()
+        return self._buffers.get(request_id)
+
+    def _expire(self) -> None:
+        now = time.monotonic()
+        for request_id, buf in list(self._buffers.items()):
+            if buf.finished_at is not None and now - buf.finished_at > self.grace:
+                del self._buffers[request_id]
+
+    def stats(self) -> Dict[str, Any]:
+        self._expire()
+        running = sum(1 for b in self._buffers.values() if b.finished_at is None)
+        followed = sum(1 for b in self._buffers.values() if b.finished_at is None and b.followers)
+        return {
+            "running": running,
+            "followed": followed,
+            "finished": len(self._buffers) - running,
+            "grace_s": self.grace,
+            "abandon_after_s": self.abandon_after,
+        }
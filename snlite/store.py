@@ -1,98 +1,352 @@
 from __future__ import annotations
 
+import base64
+import gzip
 import json
+import logging
 import os
+import threading
 import time
-from dataclasses import dataclass, asdict
-from typing import List, Dict, Any, Optional
+from abc import ABC, abstractmethod
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, asdict, field, fields, replace
+from typing import Any, BinaryIO, Callable, ContextManager, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from uuid import uuid4
 
+from snlite import codec
+from snlite.blobs import (
+    IMAGES_B64_KEY,
+    BlobStore,
+    externalize_user_meta,
+    inline_user_meta,
+    message_blob_refs,
+    messages_blob_refs,
+)
+from snlite.compact import CompactMessage, pack_messages
+
+try:
+    import fcntl
+except ImportError:  # Windows: single process only
+    fcntl = None  # type: ignore[assignment]
+
+logger = logging.getLogger(__name__)
 
 DEFAULT_GROUP = "未分组"
 
-@dataclass
+@dataclass(slots=True)
 class Session:
     id: str
     title: str
     group: str
     created_at: float
     updated_at: float
-    messages: List[Dict[str, Any]]  # {role, content}
+    messages: List[Dict[str, Any]]  # {role, content}; CompactMessage when held in bulk
+    version: int = 0  # bumped by every write to the session
+
+
+class VersionConflict(Exception):
+    """A conditional write found the session at another version than `expected`."""
+    def __init__(self, session_id: str, expected: int, current: Optional[int]) -> None:
+        super().__init__(f"session {session_id} is at version {current}, not {expected}")
+        self.session_id = session_id
+        self.expected = expected
+        self.current = current
+
+
+def check_version(session_id: str, expected: Optional[int], current: Optional[int]) -> None:
+    """Raise VersionConflict unless `expected` is None or equals `current` (None = no such session)."""
+    if expected is not None and expected != current:
+        raise VersionConflict(session_id, expected, current)
 
-class SessionStore:
+
+def session_record(sess: Session) -> Dict[str, Any]:
+    """A session as a log/export record: a shallow dict, unlike `asdict` (no copy of the messages)."""
+    return {f.name: getattr(sess, f.name) for f in fields(sess)}
+
+
+@dataclass(slots=True)
+class _IndexEntry:
     """
-    Lightweight JSONL store:
-    - file: data/sessions.jsonl
-    - each line is a full session snapshot
-    - last snapshot wins
+    Location of one session's records in the log: the byte span of its latest
+    full snapshot plus the spans of the delta records appended after it, and
+    the list metadata and blob references those records produce.
+    """
+    offset: int
+    length: int
+    title: str
+    group: str
+    created_at: float
+    updated_at: float
+    deltas: List[Tuple[int, int]] = field(default_factory=list)
+    message_count: int = 0
+    preview: Optional[str] = ""  # None = stale (after a pop), recomputed on demand
+    version: int = 0
+    blob_refs: Optional[List[str]] = field(default_factory=list)  # None = stale, like `preview`
+
+
+# Delta record ops. Delta lines carry the session id as "sid" (not "id") so an
+# older reader that only knows snapshots skips them instead of mistaking them
+# for a session.
+OP_APPEND = "append"
+OP_POP = "pop"
+OP_RENAME = "rename"
+OP_GROUP = "group"
+OP_DELETE = "delete"  # tombstone: the session is gone; its records are purged later
+DELTA_OPS = (OP_APPEND, OP_POP, OP_RENAME, OP_GROUP, OP_DELETE)
+
+PREVIEW_CHARS = 120
+
+# When appends to the session log reach the disk:
+# none     - written to the OS before the call returns, never fsynced
+# interval - as `none`, plus an fsync at most every `fsync_interval` seconds
+# always   - the call returns only after its batch has been fsynced
+FSYNC_POLICIES = ("none", "interval", "always")
+
+
+# Per-message meta that is only needed to regenerate a turn; can be large
+# (the prompt includes injected file excerpts).
+HEAVY_META_KEYS = ("prompt", "system_text")
+
+
+def strip_heavy_meta(message: Dict[str, Any]) -> Dict[str, Any]:
+    meta = message.get("meta")
+    if not isinstance(meta, dict) or not any(k in meta for k in HEAVY_META_KEYS):
+        return message
+    return {**message, "meta": {k: v for k, v in meta.items() if k not in HEAVY_META_KEYS}}
+
+
+def encode_cursor(updated_at: float, session_id: str) -> str:
+    raw = json.dumps([updated_at, session_id]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[float, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        updated_at, session_id = json.loads(raw)
+        return float(updated_at), str(session_id)
+    except Exception:
+        raise ValueError("invalid cursor")
+
+
+# How archive bodies are written; reads follow the file extension, so
+# archives written under another setting (or plain .txt ones) stay readable.
+ARCHIVE_COMPRESSIONS = ("gzip", "none")
+
+
+@dataclass
+class ArchiveRetention:
+    """
+    Archive retention limits; 0 disables a limit. Enforced per month
+    partition (oldest first), and the newest partition is never evicted.
     """
-    def __init__(self, data_dir: str) -> None:
+    max_age: float = 0.0  # seconds since the partition's last archive
+    max_bytes: int = 0  # total archive file bytes
+    max_count: int = 0  # total archives
+    interval: float = 3600.0  # seconds between background enforcement runs
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.max_age or self.max_bytes or self.max_count)
+
+
+def archive_partition(archived_at: float) -> str:
+    """Month partition ("YYYY-MM", UTC) an archive is stored under."""
+    return time.strftime("%Y-%m", time.gmtime(archived_at))
+
+
+BACKUP_FORMAT = "snlite.sessions.backup.v1"
+NDJSON_BACKUP_FORMAT = "snlite.sessions.ndjson.v1"
+
+
+def iter_ndjson(lines: Iterable[Union[str, bytes]]) -> Iterator[Any]:
+    """Parse an NDJSON backup line by line, skipping the header; a line that is not JSON yields None."""
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8", errors="replace")
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = codec.loads_snapshot(line)
+        except Exception:
+            yield None
+            continue
+        if isinstance(obj, dict) and "format" in obj and "id" not in obj:
+            continue
+        yield obj
+
+
+def message_preview(messages: List[Dict[str, Any]]) -> str:
+    """One-line preview of the last message, for session lists."""
+    if not messages:
+        return ""
+    text = " ".join(str(messages[-1].get("content") or "").split())
+    if len(text) > PREVIEW_CHARS:
+        text = text[:PREVIEW_CHARS].rstrip() + "…"
+    return text
+
+
+class BaseSessionStore(ABC):
+    """
+    Storage-backend interface for sessions and the archive index:
+    - engines implement session persistence and the archive index
+    - shared here: archive bodies (data/archives/YYYY-MM), retention, blob GC,
+      export and input normalization
+    """
+    def __init__(
+        self,
+        data_dir: str,
+        archive_compression: str = "gzip",
+        archive_retention: Optional[ArchiveRetention] = None,
+        blobs: Optional[BlobStore] = None,
+    ) -> None:
+        if archive_compression not in ARCHIVE_COMPRESSIONS:
+            raise ValueError(
+                f"unknown archive compression: {archive_compression!r} "
+                f"(expected one of {', '.join(ARCHIVE_COMPRESSIONS)})"
+            )
         self.data_dir = data_dir
         os.makedirs(self.data_dir, exist_ok=True)
-        self.path = os.path.join(self.data_dir, "sessions.jsonl")
         self.archives_dir = os.path.join(self.data_dir, "archives")
         os.makedirs(self.archives_dir, exist_ok=True)
-        self.archive_index_path = os.path.join(self.data_dir, "archives.jsonl")
+        self.archive_compression = archive_compression
+        self.archive_retention = archive_retention or ArchiveRetention()
+        self.blobs = blobs
+        self._blob_gc_at: Optional[float] = None
+        self._released_blobs: Dict[str, float] = {}  # digest -> delete time, until the purge pass
+        self._released_lock = threading.Lock()
+        self._retention: Dict[str, Any] = {
+            "runs": 0,
+            "last_run_at": None,
+            "evicted_partitions": 0,
+            "evicted_archives": 0,
+            "evicted_bytes": 0,
+        }
+
+        self._bg_thread: Optional[threading.Thread] = None
+        self._bg_wake = threading.Event()
+        self._bg_stop = threading.Event()
+        self._bg_hooks: List[Callable[[], None]] = []
 
     def _normalize_group(self, group: Optional[str]) -> str:
         g = str(group or "").strip()
         return g or DEFAULT_GROUP
 
-    def _load_all_snapshots(self) -> List[Dict[str, Any]]:
-        if not os.path.exists(self.path):
-            return []
-        out: List[Dict[str, Any]] = []
-        with open(self.path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    out.append(json.loads(line))
-                except Exception:
-                    continue
-        return out
-
-    def _materialize(self) -> Dict[str, Session]:
-        snapshots = self._load_all_snapshots()
-        by_id: Dict[str, Session] = {}
-        for s in snapshots:
-            try:
-                sess = Session(
-                    id=s["id"],
-                    title=s.get("title", "Untitled"),
-                    group=self._normalize_group(s.get("group")),
-                    created_at=float(s.get("created_at", time.time())),
-                    updated_at=float(s.get("updated_at", time.time())),
-                    messages=list(s.get("messages", [])),
-                )
-                by_id[sess.id] = sess
-            except Exception:
-                continue
-        return by_id
+    def _session_from_raw(self, raw: Dict[str, Any]) -> Optional[Session]:
+        """Validate an exported/imported session dict."""
+        try:
+            sid = str(raw.get("id") or "").strip() or uuid4().hex
+            title = str(raw.get("title") or "New Chat").strip() or "New Chat"
+            group = self._normalize_group(raw.get("group"))
+            created_at = float(raw.get("created_at") or time.time())
+            updated_at = float(raw.get("updated_at") or created_at)
+            messages = raw.get("messages") or []
+            if not isinstance(messages, list):
+                messages = []
+            normalized = []
+            for m in messages:
+                if isinstance(m, dict) and "role" in m and "content" in m:
+                    normalized.append(m)
+            return Session(
+                id=sid,
+                title=title,
+                group=group,
+                created_at=created_at,
+                updated_at=updated_at,
+                messages=normalized,
+                version=max(0, int(raw.get("version") or 0)),
+            )
+        except Exception:
+            return None
 
-    def _write_all(self, sessions: List[Session]) -> None:
-        with open(self.path, "w", encoding="utf-8") as f:
-            for sess in sessions:
-                f.write(json.dumps(asdict(sess), ensure_ascii=False) + "\n")
+    # ---- sessions ----
 
+    @abstractmethod
     def list_sessions(self) -> List[Dict[str, Any]]:
-        by_id = self._materialize()
-        items = sorted(by_id.values(), key=lambda x: x.updated_at, reverse=True)
-        return [
-            {
-                "id": s.id,
-                "title": s.title,
-                "group": s.group,
-                "updated_at": s.updated_at,
-                "created_at": s.created_at,
-            }
-            for s in items
-        ]
+        """
+        Session summaries, most recently updated first: id, title, group,
+        created_at, updated_at, message_count, a last-message preview and
+        the session version.
+        Served from summary metadata, never by loading message bodies.
+        """
+        ...
 
+    @abstractmethod
     def get_session(self, session_id: str) -> Optional[Session]:
-        by_id = self._materialize()
-        return by_id.get(session_id)
+        ...
+
+    def get_session_meta(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """The `list_sessions` row of one session, or None."""
+        for row in self.list_sessions():
+            if row["id"] == session_id:
+                return row
+        return None
+
+    def list_sessions_page(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        group: Optional[str] = None,
+        q: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """
+        One page of `list_sessions`, newest first, after `cursor`; `q` matches title or
+        group (case-insensitive). Skips "__deleted__" rows; ValueError for a bad cursor.
+        """
+        after = decode_cursor(cursor) if cursor else None
+        needle = (q or "").strip().lower()
+        rows = self.list_sessions()
+        rows.sort(key=lambda x: (x["updated_at"], x["id"]), reverse=True)
+        items: List[Dict[str, Any]] = []
+        for row in rows:
+            if row["title"] == "__deleted__":
+                continue
+            if group is not None and row["group"] != group:
+                continue
+            if needle and needle not in row["title"].lower() and needle not in row["group"].lower():
+                continue
+            if after and (row["updated_at"], row["id"]) >= after:
+                continue
+            items.append(row)
+            if len(items) > limit:
+                break
+        return self._page(items, limit)
+
+    def _page(self, items: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+        """Cut `items` (fetched with one extra row) to a page with its next cursor."""
+        has_more = len(items) > limit
+        items = items[:limit]
+        last = items[-1] if items else None
+        return {
+            "items": items,
+            "next_cursor": encode_cursor(last["updated_at"], last["id"]) if has_more and last else None,
+        }
+
+    def get_session_window(
+        self,
+        session_id: str,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+        strip_meta: bool = False,
+    ) -> Optional[Tuple[Session, Dict[str, Any]]]:
+        """
+        A session with only messages [start, end) where end = `before` (or the
+        message count) and start = end - `limit`. Returns the session and the
+        window bounds; with `strip_meta`, HEAVY_META_KEYS are dropped.
+        """
+        sess = self.get_session(session_id)
+        if not sess:
+            return None
+        total = len(sess.messages)
+        end = total if before is None else max(0, min(int(before), total))
+        start = 0 if limit is None else max(0, end - max(0, int(limit)))
+        messages = sess.messages[start:end]
+        if strip_meta:
+            messages = [strip_heavy_meta(m) for m in messages]
+        sess.messages = messages
+        return sess, {"start": start, "end": end, "total": total, "has_more": start > 0}
 
     def create_session(self, title: str = "New Chat", group: str = DEFAULT_GROUP) -> Session:
         now = time.time()
@@ -107,28 +361,374 @@ class SessionStore:
         self.save_session(sess)
         return sess
 
-    def save_session(self, session: Session) -> None:
-        session.updated_at = time.time()
-        line = json.dumps(asdict(session), ensure_ascii=False)
-        with open(self.path, "a", encoding="utf-8") as f:
-            f.write(line + "\n")
+    # Versions: every write to a session (append, pop, rename, regroup,
+    # snapshot) increments `Session.version` by one, across restarts and
+    # compaction. The single-session writes below take `expected_version`;
+    # when given, the write happens only if the session is still at that
+    # version and raises VersionConflict otherwise (compare-and-append).
+    # Writes are operations, not snapshots, so unconditional writes of
+    # different callers merge instead of overwriting each other; callers use
+    # `expected_version` where their write depends on what they read.
 
-    def rename_session(self, session_id: str, title: str) -> Optional[Session]:
-        sess = self.get_session(session_id)
-        if not sess:
-            return None
-        sess.title = title
-        self.save_session(sess)
-        return sess
+    @abstractmethod
+    def save_session(self, session: Session, expected_version: Optional[int] = None) -> None:
+        """
+        Persist a full session, replacing whatever was stored for its id.
+        `session.version` is set to the stored version.
+        """
+        ...
 
-    def set_session_group(self, session_id: str, group: str) -> Optional[Session]:
-        sess = self.get_session(session_id)
-        if not sess:
-            return None
-        sess.group = self._normalize_group(group)
-        self.save_session(sess)
+    @abstractmethod
+    def append_message(
+        self, session_id: str, message: Dict[str, Any], expected_version: Optional[int] = None
+    ) -> Optional[int]:
+        """Append a message; returns the new session version (None if there is no such session)."""
+        ...
+
+    @abstractmethod
+    def pop_message(self, session_id: str, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Remove and return the last message of a session."""
+        ...
+
+    @abstractmethod
+    def rename_session(self, session_id: str, title: str, expected_version: Optional[int] = None) -> Optional[Session]:
+        ...
+
+    @abstractmethod
+    def set_session_group(
+        self, session_id: str, group: str, expected_version: Optional[int] = None
+    ) -> Optional[Session]:
+        ...
+
+    @abstractmethod
+    def delete_session(self, session_id: str) -> bool:
+        """Hard delete: gone from every read at once, and from storage within `purge_after` seconds."""
+        ...
+
+    # ---- bulk ----
+
+    def select_sessions(
+        self,
+        session_ids: Optional[Iterable[str]] = None,
+        group: Optional[str] = None,
+        updated_before: Optional[float] = None,
+    ) -> List[str]:
+        """
+        Ids for a bulk operation: `session_ids` as given (deduplicated, order
+        kept, unknown ids included so callers can report them), or else every
+        session matching `group` and/or `updated_before`. Raises ValueError
+        when no selector is given.
+        """
+        if session_ids is not None:
+            return list(dict.fromkeys(str(x) for x in session_ids))
+        if group is None and updated_before is None:
+            raise ValueError("ids, group or updated_before is required")
+        out: List[str] = []
+        for row in self.list_sessions():
+            if group is not None and row["group"] != group:
+                continue
+            if updated_before is not None and row["updated_at"] >= updated_before:
+                continue
+            out.append(row["id"])
+        return out
+
+    def delete_sessions(self, session_ids: Iterable[str]) -> Dict[str, bool]:
+        """Hard delete several sessions; id -> whether it existed. Engines batch this."""
+        return {sid: self.delete_session(sid) for sid in dict.fromkeys(session_ids)}
+
+    def set_sessions_group(self, session_ids: Iterable[str], group: str) -> Dict[str, bool]:
+        """Move several sessions to `group`; id -> whether it existed. Engines batch this."""
+        return {sid: self.set_session_group(sid, group) is not None for sid in dict.fromkeys(session_ids)}
+
+    def archive_sessions(self, session_ids: Iterable[str]) -> Dict[str, Optional[Dict[str, Any]]]:
+        """
+        Archive several sessions: one archive file each, then a single
+        archive-index append and a single batched delete. Returns id ->
+        archive metadata (None for unknown ids).
+        """
+        out: Dict[str, Optional[Dict[str, Any]]] = {}
+        for sid in dict.fromkeys(session_ids):
+            sess = self.get_session(sid)
+            out[sid] = self._write_archive(sess) if sess else None
+        archived = [meta for meta in out.values() if meta]
+        if archived:
+            self._append_archive_indexes(archived)
+            self.delete_sessions(meta["session_id"] for meta in archived)
+        return out
+
+    @abstractmethod
+    def import_all(self, sessions: Iterable[Any], mode: str = "append") -> Dict[str, int]:
+        """
+        Merge sessions into the store; the newer `updated_at` wins per id.
+        `sessions` is consumed once, so it may be a stream of any length.
+        """
+        ...
+
+    def _merge_import(
+        self,
+        sessions: Iterable[Any],
+        updated_at_of: Callable[[str], Optional[float]],
+        counts: Dict[str, int],
+    ) -> Iterator[Session]:
+        """Yield the imported sessions that win the `updated_at` merge; tallies `counts`."""
+        for raw in sessions:
+            sess = self._session_from_raw(raw) if isinstance(raw, dict) else None
+            if not sess:
+                counts["skipped"] += 1
+                continue
+            prev = updated_at_of(sess.id)
+            if prev is not None and prev > sess.updated_at:
+                counts["skipped"] += 1
+                continue
+            counts["imported"] += 1
+            yield self._importable(sess)
+
+    @abstractmethod
+    def compact(self) -> Dict[str, int]:
+        ...
+
+    # ---- archive index ----
+
+    @abstractmethod
+    def list_archives(self) -> List[Dict[str, Any]]:
+        """Archive metadata rows, most recently archived first."""
+        ...
+
+    @abstractmethod
+    def _find_archive(self, archive_id: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def _append_archive_index(self, archive: Dict[str, Any]) -> None:
+        ...
+
+    def _append_archive_indexes(self, archives: List[Dict[str, Any]]) -> None:
+        """Append several archive rows; engines override to do it in one write."""
+        for archive in archives:
+            self._append_archive_index(archive)
+
+    @abstractmethod
+    def _remove_archive_index(self, archive_id: str) -> None:
+        ...
+
+    def _remove_archive_indexes(self, archive_ids: Iterable[str]) -> None:
+        """Drop several archive rows; engines override to do it in one pass."""
+        for archive_id in archive_ids:
+            self._remove_archive_index(archive_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """Engine-specific storage statistics."""
+        return {}
+
+    # ---- background maintenance ----
+
+    def start_background(self, interval: float = 30.0) -> None:
+        """Start the maintenance thread (runs `_background_tick`)."""
+        if self._bg_thread and self._bg_thread.is_alive():
+            return
+        self._bg_stop.clear()
+
+        def loop() -> None:
+            while not self._bg_stop.is_set():
+                self._bg_wake.wait(max(0.0, min(interval, self._background_due_in())))
+                self._bg_wake.clear()
+                if self._bg_stop.is_set():
+                    return
+                try:
+                    self._background_tick()
+                    self._archive_tick()
+                    self._blob_tick()
+                    for hook in self._bg_hooks:
+                        hook()
+                except Exception:  # pragma: no cover - keep the thread alive
+                    logger.exception("store background maintenance failed")
+
+        self._bg_thread = threading.Thread(target=loop, name="snlite-store-maintenance", daemon=True)
+        self._bg_thread.start()
+
+    def add_background_hook(self, hook: Callable[[], None]) -> None:
+        """Also run `hook` on the maintenance thread, after every tick."""
+        self._bg_hooks.append(hook)
+
+    def stop_background(self) -> None:
+        self._bg_stop.set()
+        self._bg_wake.set()
+        if self._bg_thread:
+            self._bg_thread.join(timeout=10)
+            self._bg_thread = None
+        self.flush()
+
+    def flush(self) -> None:
+        """Persist any lazily written state (e.g. sidecar indexes)."""
+        return
+
+    def close(self) -> None:
+        """Release engine resources (files, threads, connections)."""
+        return
+
+    def _wake_background(self) -> None:
+        if self._bg_thread:
+            self._bg_wake.set()
+
+    def _background_tick(self) -> None:
+        return
+
+    def _background_due_in(self) -> float:
+        """Seconds until maintenance with a deadline (e.g. a purge) is due."""
+        return float("inf")
+
+    def _archive_tick(self) -> None:
+        policy = self.archive_retention
+        last = self._retention["last_run_at"]
+        if policy.enabled and (last is None or time.time() - last >= policy.interval):
+            self.enforce_archive_retention()
+
+    def _blob_tick(self) -> None:
+        if self.blobs is None:
+            return
+        if self._blob_gc_at is None or time.time() - self._blob_gc_at >= self.blobs.gc_interval:
+            self.collect_blobs()
+
+    # ---- blobs ----
+
+    def collect_blobs(self) -> Dict[str, int]:
+        """
+        Mark and sweep: count blob references in every live session, then
+        let the blob store drop the unreferenced ones. Archives keep no
+        message meta, so only sessions hold references.
+        """
+        if self.blobs is None:
+            return {"kept": 0, "removed": 0, "reclaimed_bytes": 0}
+        self._blob_gc_at = time.time()
+        return self.blobs.collect(self._blob_references())
+
+    def _blob_references(self) -> Counter:
+        """Blob hash -> references from live sessions. Engines serve this from their indexes."""
+        refs: Counter = Counter()
+        for row in self.list_sessions():
+            sess = self.get_session(row["id"])
+            refs.update(messages_blob_refs(sess.messages if sess else []))
+        return refs
+
+    def _release_blobs(self, digests: Iterable[str]) -> None:
+        """Note the blobs of a session being deleted; `_purge_blobs` removes them."""
+        now = time.time()
+        with self._released_lock:
+            for digest in digests:
+                self._released_blobs[digest] = now
+
+    def _purge_blobs(self) -> None:
+        """Part of the purge pass: remove released blobs no live session references."""
+        if self.blobs is None:
+            return
+        with self._released_lock:
+            released, self._released_blobs = self._released_blobs, {}
+        if released:
+            self.blobs.release(released, self._blob_references())
+
+    def _exportable(self, sess: Session) -> Dict[str, Any]:
+        """A session as exported: prompts and images kept in blobs are inlined again."""
+        out = session_record(sess)
+        if self.blobs is None:
+            return out
+        out["messages"] = [
+            {**m, "meta": inline_user_meta(self.blobs, m["meta"])} if isinstance(m.get("meta"), dict) else m
+            for m in out["messages"]
+        ]
+        return out
+
+    def _importable(self, sess: Session) -> Session:
+        """A session as stored: prompts and images inlined by an export go back into blobs."""
+        if self.blobs is None:
+            return sess
+        messages = []
+        for m in sess.messages:
+            meta = m.get("meta")
+            if isinstance(meta, dict):
+                images = meta.get(IMAGES_B64_KEY)
+                rest = {k: v for k, v in meta.items() if k != IMAGES_B64_KEY}
+                try:
+                    meta = externalize_user_meta(self.blobs, rest, images if isinstance(images, list) else [])
+                except (TypeError, ValueError):
+                    meta = rest  # not base64: the turn loses its images, not the import
+                m = {**m, "meta": meta}
+            messages.append(m)
+        sess.messages = messages
         return sess
 
+    # ---- archive retention ----
+
+    def enforce_archive_retention(self, now: Optional[float] = None) -> Dict[str, Any]:
+        """Evict whole month partitions, oldest first (never the newest), until the retention policy holds."""
+        now = time.time() if now is None else now
+        policy = self.archive_retention
+        partitions: Dict[str, List[Dict[str, Any]]] = {}
+        for row in self.list_archives():
+            part = str(row.get("partition") or archive_partition(float(row.get("archived_at", 0))))
+            partitions.setdefault(part, []).append(row)
+        sizes = {
+            part: sum(self._archive_file_bytes(row) for row in rows) for part, rows in partitions.items()
+        }
+        total_bytes = sum(sizes.values())
+        total_count = sum(len(rows) for rows in partitions.values())
+
+        evicted: List[str] = []
+        for part in sorted(partitions)[:-1]:
+            rows = partitions[part]
+            newest = max(float(row.get("archived_at", 0)) for row in rows)
+            if not (
+                (policy.max_age and now - newest > policy.max_age)
+                or (policy.max_bytes and total_bytes > policy.max_bytes)
+                or (policy.max_count and total_count > policy.max_count)
+            ):
+                break
+            evicted.append(part)
+            total_bytes -= sizes[part]
+            total_count -= len(rows)
+
+        ids: List[str] = []
+        for part in evicted:
+            for row in partitions[part]:
+                ids.append(str(row.get("archive_id")))
+                try:
+                    os.remove(str(row.get("file_path") or ""))
+                except OSError:
+                    pass
+            try:
+                os.rmdir(os.path.join(self.archives_dir, part))
+            except OSError:
+                pass  # not empty (foreign files) or a pre-partitioning archive
+        if ids:
+            self._remove_archive_indexes(ids)
+
+        r = self._retention
+        r["runs"] += 1
+        r["last_run_at"] = now
+        r["evicted_partitions"] += len(evicted)
+        r["evicted_archives"] += len(ids)
+        r["evicted_bytes"] += sum(sizes[part] for part in evicted)
+        return {
+            "evicted_partitions": evicted,
+            "evicted_archives": len(ids),
+            "evicted_bytes": sum(sizes[part] for part in evicted),
+            "archives": total_count,
+            "archive_bytes": total_bytes,
+        }
+
+    @staticmethod
+    def _archive_file_bytes(row: Dict[str, Any]) -> int:
+        if "file_bytes" in row:
+            return int(row["file_bytes"])
+        try:
+            return os.path.getsize(str(row.get("file_path") or ""))
+        except OSError:
+            return 0
+
+    def retention_stats(self) -> Dict[str, Any]:
+        return {**asdict(self.archive_retention), **self._retention}
+
+    # ---- shared ----
+
     def _build_archive_text(self, sess: Session, archived_at: float) -> str:
         lines = [
             f"# {sess.title}",
@@ -149,46 +749,32 @@ class SessionStore:
             lines.append("")
         return "\n".join(lines).strip() + "\n"
 
-    def _append_archive_index(self, archive: Dict[str, Any]) -> None:
-        with open(self.archive_index_path, "a", encoding="utf-8") as f:
-            f.write(json.dumps(archive, ensure_ascii=False) + "\n")
-
-    def list_archives(self) -> List[Dict[str, Any]]:
-        if not os.path.exists(self.archive_index_path):
-            return []
-        out: Dict[str, Dict[str, Any]] = {}
-        with open(self.archive_index_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line:
-                    continue
-                try:
-                    row = json.loads(line)
-                except Exception:
-                    continue
-                archive_id = str(row.get("archive_id") or "").strip()
-                if not archive_id:
-                    continue
-                out[archive_id] = row
-        rows = list(out.values())
-        rows.sort(key=lambda x: float(x.get("archived_at", 0)), reverse=True)
-        return rows
-
-    def get_archive(self, archive_id: str) -> Optional[Dict[str, Any]]:
-        rows = self.list_archives()
-        item = next((x for x in rows if x.get("archive_id") == archive_id), None)
+    def open_archive(self, archive_id: str) -> Optional[Tuple[Dict[str, Any], BinaryIO]]:
+        """
+        Archive metadata and its body as a binary file object (UTF-8 text,
+        decompressed while read). The caller closes the file.
+        """
+        item = self._find_archive(archive_id)
         if not item:
             return None
         file_path = item.get("file_path") or ""
-        if not file_path or not os.path.exists(file_path):
+        try:
+            f = gzip.open(file_path, "rb") if file_path.endswith(".gz") else open(file_path, "rb")
+        except OSError:
             return None
-        with open(file_path, "r", encoding="utf-8") as f:
-            content = f.read()
+        return item, f
+
+    def get_archive(self, archive_id: str) -> Optional[Dict[str, Any]]:
+        opened = self.open_archive(archive_id)
+        if not opened:
+            return None
+        item, f = opened
+        with f:
+            content = f.read().decode("utf-8", errors="replace")
         return {**item, "content": content}
 
     def delete_archive(self, archive_id: str) -> bool:
-        rows = self.list_archives()
-        target = next((x for x in rows if x.get("archive_id") == archive_id), None)
+        target = self._find_archive(archive_id)
         if not target:
             return False
 
@@ -199,26 +785,27 @@ class SessionStore:
             except OSError:
                 pass
 
-        kept = [x for x in rows if x.get("archive_id") != archive_id]
-        with open(self.archive_index_path, "w", encoding="utf-8") as f:
-            for row in kept:
-                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+        self._remove_archive_index(archive_id)
         return True
 
     def archive_session(self, session_id: str) -> Optional[Dict[str, Any]]:
-        sess = self.get_session(session_id)
-        if not sess:
-            return None
+        return self.archive_sessions([session_id])[session_id]
 
+    def _write_archive(self, sess: Session) -> Dict[str, Any]:
+        """Write the archive file of `sess` and return its index row."""
         archived_at = time.time()
         archive_id = uuid4().hex
-        filename = f"archive_{int(archived_at)}_{session_id}.txt"
-        file_path = os.path.join(self.archives_dir, filename)
-        content = self._build_archive_text(sess, archived_at)
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        filename = f"archive_{int(archived_at)}_{sess.id}.txt"
+        if self.archive_compression == "gzip":
+            filename += ".gz"
+        partition = archive_partition(archived_at)
+        os.makedirs(os.path.join(self.archives_dir, partition), exist_ok=True)
+        file_path = os.path.join(self.archives_dir, partition, filename)
+        data = self._build_archive_text(sess, archived_at).encode("utf-8")
+        with gzip.open(file_path, "wb") if filename.endswith(".gz") else open(file_path, "wb") as f:
+            f.write(data)
 
-        archive_meta = {
+        return {
             "archive_id": archive_id,
             "session_id": sess.id,
             "title": sess.title,
@@ -228,38 +815,9 @@ class SessionStore:
             "message_count": len(sess.messages),
             "file_path": file_path,
             "file_name": filename,
+            "partition": partition,
+            "file_bytes": os.path.getsize(file_path),
         }
-        self._append_archive_index(archive_meta)
-        self.delete_session(session_id)
-        return archive_meta
-
-    def delete_session(self, session_id: str) -> bool:
-        """
-        Hard delete all snapshots for a session from JSONL.
-
-        This prevents deleted session content from remaining in the underlying
-        `sessions.jsonl` file, which can otherwise happen with tombstone-only
-        deletion.
-        """
-        snapshots = self._load_all_snapshots()
-        if not snapshots:
-            return False
-
-        kept: List[Dict[str, Any]] = []
-        found = False
-        for raw in snapshots:
-            if str(raw.get("id")) == session_id:
-                found = True
-                continue
-            kept.append(raw)
-
-        if not found:
-            return False
-
-        with open(self.path, "w", encoding="utf-8") as f:
-            for raw in kept:
-                f.write(json.dumps(raw, ensure_ascii=False) + "\n")
-        return True
 
     def export_markdown(self, session_id: str) -> Optional[str]:
         sess = self.get_session(session_id)
@@ -282,69 +840,1200 @@ class SessionStore:
                 lines.append(f"## {role}\n\n{content}\n")
         return "\n".join(lines)
 
+    def export_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        sess = self.get_session(session_id)
+        if not sess or sess.title == "__deleted__":
+            return None
+        return self._exportable(sess)
+
     def export_all(self) -> Dict[str, Any]:
-        by_id = self._materialize()
-        items = [asdict(s) for s in sorted(by_id.values(), key=lambda x: x.updated_at, reverse=True) if s.title != "__deleted__"]
+        items = []
+        for row in self.list_sessions():
+            sess = self.get_session(row["id"])
+            if sess and sess.title != "__deleted__":
+                items.append(self._exportable(sess))
         return {
-            "format": "snlite.sessions.backup.v1",
+            "format": BACKUP_FORMAT,
             "exported_at": time.time(),
             "count": len(items),
             "sessions": items,
         }
 
-    def import_all(self, sessions: List[Dict[str, Any]], mode: str = "append") -> Dict[str, int]:
-        if mode not in ("append", "replace"):
-            raise ValueError("mode must be append or replace")
+    def iter_export_ndjson(self) -> Iterator[str]:
+        """Full backup as NDJSON: a header line, then one session per line (one in memory at a time)."""
+        rows = self.list_sessions()
+        header = {"format": NDJSON_BACKUP_FORMAT, "exported_at": time.time(), "count": len(rows)}
+        yield codec.dumps(header) + "\n"
+        for row in rows:
+            sess = self.get_session(row["id"])
+            if sess and sess.title != "__deleted__":
+                yield codec.dumps(self._exportable(sess)) + "\n"
+
+
+class _LogLock:
+    """
+    Cross-process lock file for the session log (`sessions.lock`):
+    - `exclusive()` takes an advisory flock around appends and rewrites
+    - the file holds the log generation, bumped by every rewrite
+    - a no-op without fcntl (Windows)
+    """
+    def __init__(self, path: str) -> None:
+        self.path = path
+        os.close(os.open(path, os.O_RDWR | os.O_CREAT, 0o644))
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)  # releases the flock
+
+    def generation(self) -> int:
+        try:
+            with open(self.path, "rb") as f:
+                return int(f.read(32).strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def bump(self) -> int:
+        """Increment the generation. Caller holds `exclusive()`."""
+        gen = self.generation() + 1
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, f"{gen:020d}\n".encode("ascii"))
+        finally:
+            os.close(fd)
+        return gen
+
+
+class _LogWriter:
+    """
+    Single writer thread for the session log (group commit):
+    - `submit` queues a line; the thread writes all queued lines at once and
+      fsyncs per the policy; `wait(seq)` blocks until `seq` is durable
+    - never takes the store lock; writes under `lock` (the log lock)
+    """
+    def __init__(
+        self,
+        path: str,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        lock: Optional[Callable[[], ContextManager[Any]]] = None,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy: {fsync!r} (expected one of {', '.join(FSYNC_POLICIES)})")
+        self.path = path
+        self.fsync = fsync
+        self.fsync_interval = max(0.0, float(fsync_interval))
+        self._lock = lock
+
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = False
+        self._pending: List[bytes] = []
+        self._pending_offset = 0  # log offset the first queued line is expected at
+        self._pending_since = 0.0
+        self._submitted = 0
+        self._written = 0
+        self._synced = 0
+        self._unsynced = False
+        self._last_fsync = time.monotonic()
+        self._failed: Tuple[int, int] = (0, 0)  # (first, last) seq of the last failed batch
+        self._error: Optional[OSError] = None
+        self._fingerprint: Optional[Tuple[int, int, int]] = None
+        self._conflict = False
+
+        self._batches = 0
+        self._records = 0
+        self._bytes = 0
+        self._fsyncs = 0
+        self._errors = 0
+        self._max_batch = 0
+        self._last_batch = 0
+        self._latency_total = 0.0
+        self._latency_max = 0.0
+        self._latency_last = 0.0
+
+    @property
+    def submitted(self) -> int:
+        return self._submitted
+
+    def submit(self, data: bytes, offset: int) -> int:
+        """Queue one encoded line expected to land at log `offset`; returns its seq."""
+        with self._cond:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="snlite-log-writer", daemon=True)
+                self._thread.start()
+            if not self._pending:
+                self._pending_offset = offset
+                self._pending_since = time.monotonic()
+            self._pending.append(data)
+            self._submitted += 1
+            self._cond.notify_all()
+            return self._submitted
+
+    def busy(self) -> bool:
+        """True while queued lines are not yet in the file."""
+        with self._cond:
+            return self._written < self._submitted
+
+    def take_state(self) -> Tuple[Optional[Tuple[int, int, int]], bool]:
+        """(fingerprint after our last write, whether the file moved under us); resets both."""
+        with self._cond:
+            state = (self._fingerprint, self._conflict)
+            self._fingerprint = None
+            self._conflict = False
+            return state
+
+    def drain(self) -> None:
+        """Wait until everything submitted so far is in the file (not necessarily fsynced)."""
+        with self._cond:
+            seq = self._submitted
+            while self._written < seq:
+                self._cond.wait()
+
+    def wait(self, seq: int) -> None:
+        """Wait until `seq` is durable per the policy; raises if its batch failed."""
+        with self._cond:
+            while (self._synced if self.fsync == "always" else self._written) < seq:
+                self._cond.wait()
+            first, last = self._failed
+            if self._error is not None and first <= seq <= last:
+                raise self._error
+
+    def sync(self) -> None:
+        """Write out everything queued and fsync it now (unless the policy is none)."""
+        self.drain()
+        if self.fsync == "none" or not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            os.fsync(f.fileno())
+        with self._cond:
+            self._fsyncs += 1
+            self._unsynced = False
+            self._last_fsync = time.monotonic()
+
+    def close(self) -> None:
+        with self._cond:
+            self._stop = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread:
+            thread.join(timeout=10)
+            self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending and not self._stop:
+                    if self.fsync == "interval" and self._unsynced:
+                        timeout = self._last_fsync + self.fsync_interval - time.monotonic()
+                        if timeout <= 0:
+                            break
+                        self._cond.wait(timeout)
+                    else:
+                        self._cond.wait()
+                if not self._pending and self._stop:
+                    return
+                batch, self._pending = self._pending, []
+                offset, since = self._pending_offset, self._pending_since
+                first, last = self._written + 1, self._written + len(batch)
+            self._write_batch(batch, offset, since, first, last)
+
+    def _write_batch(self, batch: List[bytes], offset: int, since: float, first: int, last: int) -> None:
+        do_fsync = self.fsync == "always" or (
+            self.fsync == "interval" and time.monotonic() - self._last_fsync >= self.fsync_interval
+        )
+        data = b"".join(batch)
+        error: Optional[OSError] = None
+        fsynced = False
+        f = None
+        try:
+            if batch:
+                # open under the lock: a rewrite may replace the file until we hold it
+                with self._lock() if self._lock else nullcontext():
+                    f = open(self.path, "ab")
+                    conflict = f.seek(0, os.SEEK_END) != offset
+                    f.write(data)
+                    f.flush()
+                    st = os.fstat(f.fileno())
+                with self._cond:
+                    fp = (st.st_ino, st.st_size, st.st_mtime_ns)
+                    self._record_batch(fp, conflict, len(batch), len(data), since)
+                    if self.fsync != "always":
+                        # readers and non-fsync waiters need not wait for the fsync
+                        self._written = last
+                        self._cond.notify_all()
+            elif do_fsync and os.path.exists(self.path):
+                f = open(self.path, "ab")
+            if do_fsync and f is not None:
+                os.fsync(f.fileno())
+                fsynced = True
+        except OSError as e:
+            error = e
+        finally:
+            if f is not None:
+                f.close()
+        with self._cond:
+            if error is not None:
+                self._errors += 1
+                if batch:
+                    self._error = error
+                    self._failed = (first, last)
+                    self._conflict = True  # the index is ahead of the file; rebuild it
+                logger.error("session log write failed: %s", error)
+            if fsynced:
+                self._fsyncs += 1
+                self._last_fsync = time.monotonic()
+                self._unsynced = False
+            elif batch:
+                self._unsynced = True
+            elif do_fsync:
+                # a timed fsync that could not run: with the file gone there
+                # is nothing left to sync, else retry after another interval
+                self._unsynced = f is not None
+                self._last_fsync = time.monotonic()
+            self._written = self._synced = max(self._written, last)
+            self._cond.notify_all()
+
+    def _record_batch(self, fp: Tuple[int, int, int], conflict: bool, records: int, nbytes: int, since: float) -> None:
+        """Publish the file state after a write and update the counters. Caller holds `self._cond`."""
+        self._fingerprint = fp
+        self._conflict = self._conflict or conflict
+        latency = (time.monotonic() - since) * 1000
+        self._batches += 1
+        self._records += records
+        self._bytes += nbytes
+        self._last_batch = records
+        self._max_batch = max(self._max_batch, records)
+        self._latency_total += latency
+        self._latency_last = latency
+        self._latency_max = max(self._latency_max, latency)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            batches = self._batches
+            return {
+                "fsync": self.fsync,
+                "fsync_interval": self.fsync_interval,
+                "batches": batches,
+                "records": self._records,
+                "bytes": self._bytes,
+                "fsyncs": self._fsyncs,
+                "errors": self._errors,
+                "pending": len(self._pending),
+                "batch_records": {
+                    "last": self._last_batch,
+                    "max": self._max_batch,
+                    "avg": round(self._records / batches, 2) if batches else 0,
+                },
+                "write_latency_ms": {
+                    "last": round(self._latency_last, 3),
+                    "max": round(self._latency_max, 3),
+                    "avg": round(self._latency_total / batches, 3) if batches else 0,
+                },
+            }
+
+
+class SessionStore(BaseSessionStore):
+    """
+    Lightweight JSONL store:
+    - file: data/sessions.jsonl
+    - a line is a full session snapshot or a small delta record
+      ({"op", "sid", "ts"}); a session is its last snapshot plus the deltas after it
+    - an in-memory index (byte spans and list metadata per session), persisted
+      to `sessions.summary.json`; only the log tail past it is scanned on start
+    - appends go through `_LogWriter` (group commit, `fsync` policy)
+    - the background thread compacts the log once the live ratio drops below
+      `compact_live_ratio`, and purges deleted sessions within `purge_after`
+    - worker processes share the log through `_LogLock`
+    - the archive index (`archives.jsonl`) is cached by archive id
+    """
+    def __init__(
+        self,
+        data_dir: str,
+        compact_min_bytes: int = 1024 * 1024,
+        compact_live_ratio: float = 0.5,
+        fsync: str = "interval",
+        fsync_interval: float = 1.0,
+        purge_after: float = 60.0,
+        archive_compression: str = "gzip",
+        archive_retention: Optional[ArchiveRetention] = None,
+        blobs: Optional[BlobStore] = None,
+        **_: Any,
+    ) -> None:
+        super().__init__(
+            data_dir, archive_compression=archive_compression, archive_retention=archive_retention, blobs=blobs
+        )
+        self.path = os.path.join(self.data_dir, "sessions.jsonl")
+        self.summary_path = os.path.join(self.data_dir, "sessions.summary.json")
+        self.archive_index_path = os.path.join(self.data_dir, "archives.jsonl")
+        self.lock_path = os.path.join(self.data_dir, "sessions.lock")
+        self.compact_min_bytes = compact_min_bytes
+        self.compact_live_ratio = compact_live_ratio
+        self.purge_after = max(0.0, float(purge_after))
+
+        self._lock = threading.RLock()
+        self._log_lock = _LogLock(self.lock_path)
+        self._writer = _LogWriter(
+            self.path, fsync=fsync, fsync_interval=fsync_interval, lock=self._log_lock.exclusive
+        )
+        self._write_depth = 0
+        self._flock_depth = 0
+        self._index: Dict[str, _IndexEntry] = {}
+        self._indexed_size = 0  # bytes of complete lines covered by the index
+        self._fingerprint: Optional[Tuple[int, int, int]] = None  # (ino, size, mtime_ns)
+        self._generation = self._log_lock.generation()  # log generation the index belongs to
+        self._total_records = 0
+        self._live_records = 0
+        self._live_bytes = 0
+        self._tombstones: Dict[str, float] = {}  # deleted session id -> delete time, until purged
+        self._summary_dirty = False
+        self._archive_lock = threading.Lock()
+        self._archives: Dict[str, Dict[str, Any]] = {}  # archive_id -> row, cached from archives.jsonl
+        self._archives_sorted: Optional[List[Dict[str, Any]]] = None
+        self._archives_size = 0  # bytes of archives.jsonl covered by the cache
+        self._archives_fp: Optional[Tuple[int, int, int]] = None
+        self._compaction: Dict[str, Any] = {
+            "runs": 0,
+            "auto_runs": 0,
+            "purge_runs": 0,
+            "aborted": 0,
+            "last_run_at": None,
+            "last_duration_ms": 0,
+            "last_reclaimed_bytes": 0,
+            "reclaimed_bytes_total": 0,
+        }
+        with self._lock:
+            self._sync_index()
+
+    def _iter_records(self) -> Iterator[Dict[str, Any]]:
+        """All records in log order (snapshots and deltas), parsed one line at a time."""
+        self._writer.drain()
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    yield codec.loads(line)
+                except Exception:
+                    continue
+
+    @staticmethod
+    def _is_delta(rec: Dict[str, Any]) -> bool:
+        return rec.get("op") in DELTA_OPS
+
+    def _parse_session(self, s: Dict[str, Any]) -> Optional[Session]:
+        try:
+            return Session(
+                id=s["id"],
+                title=s.get("title", "Untitled"),
+                group=self._normalize_group(s.get("group")),
+                created_at=float(s.get("created_at", time.time())),
+                updated_at=float(s.get("updated_at", time.time())),
+                messages=list(s.get("messages", [])),
+                version=int(s.get("version") or 0),
+            )
+        except Exception:
+            return None
+
+    def _apply_delta(self, sess: Session, rec: Dict[str, Any]) -> None:
+        op = rec.get("op")
+        if op == OP_APPEND:
+            msg = rec.get("message")
+            if isinstance(msg, dict):
+                sess.messages.append(msg)
+        elif op == OP_POP:
+            if sess.messages:
+                sess.messages.pop()
+        elif op == OP_RENAME:
+            sess.title = str(rec.get("title") or sess.title)
+        elif op == OP_GROUP:
+            sess.group = self._normalize_group(rec.get("group"))
+        sess.version += 1
+        try:
+            sess.updated_at = float(rec.get("ts", sess.updated_at))
+        except (TypeError, ValueError):
+            pass
+
+    def _materialize(self) -> Dict[str, Session]:
+        """Every session in memory (migration), messages packed as CompactMessage while the log streams."""
+        by_id: Dict[str, Session] = {}
+        for rec in self._iter_records():
+            if rec.get("op") == OP_DELETE:
+                by_id.pop(str(rec.get("sid")), None)
+                continue
+            if self._is_delta(rec):
+                sess = by_id.get(str(rec.get("sid")))
+                if sess:
+                    self._apply_delta(sess, rec)
+                    if sess.messages and isinstance(sess.messages[-1], dict):
+                        sess.messages[-1] = CompactMessage.from_dict(sess.messages[-1])
+                continue
+            sess = self._parse_session(rec)
+            if sess:
+                sess.messages = pack_messages(sess.messages)
+                by_id[sess.id] = sess
+        return by_id
+
+    # ---- index ----
+
+    def _reset_index(self) -> None:
+        self._index = {}
+        self._indexed_size = 0
+        self._fingerprint = None
+        self._total_records = 0
+        self._live_records = 0
+        self._live_bytes = 0
+        self._tombstones = {}
+
+    def _drop_entry(self, session_id: str) -> None:
+        entry = self._index.pop(session_id, None)
+        if entry:
+            self._live_records -= 1 + len(entry.deltas)
+            self._live_bytes -= entry.length + sum(n for _, n in entry.deltas)
+
+    def _index_record(self, rec: Dict[str, Any], offset: int, length: int) -> None:
+        self._total_records += 1
+        if rec.get("op") == OP_DELETE:
+            sid = str(rec.get("sid"))
+            self._drop_entry(sid)
+            try:
+                self._tombstones[sid] = float(rec.get("ts", time.time()))
+            except (TypeError, ValueError):
+                self._tombstones[sid] = time.time()
+            return
+        if self._is_delta(rec):
+            entry = self._index.get(str(rec.get("sid")))
+            if not entry:
+                return  # delta without a base snapshot
+            entry.deltas.append((offset, length))
+            self._live_records += 1
+            self._live_bytes += length
+            op = rec.get("op")
+            if op == OP_APPEND and isinstance(rec.get("message"), dict):
+                entry.message_count += 1
+                entry.preview = message_preview([rec["message"]])
+                if entry.blob_refs is not None:
+                    entry.blob_refs.extend(message_blob_refs(rec["message"]))
+            elif op == OP_POP:
+                if entry.message_count:
+                    entry.message_count -= 1
+                    entry.preview = None
+                    if entry.blob_refs:
+                        entry.blob_refs = None
+            elif op == OP_RENAME:
+                entry.title = str(rec.get("title") or entry.title)
+            elif op == OP_GROUP:
+                entry.group = self._normalize_group(rec.get("group"))
+            entry.version += 1
+            try:
+                entry.updated_at = float(rec.get("ts", entry.updated_at))
+            except (TypeError, ValueError):
+                pass
+            return
+        try:
+            entry = _IndexEntry(
+                offset=offset,
+                length=length,
+                title=rec.get("title", "Untitled"),
+                group=self._normalize_group(rec.get("group")),
+                created_at=float(rec.get("created_at", time.time())),
+                updated_at=float(rec.get("updated_at", time.time())),
+                version=int(rec.get("version") or 0),
+            )
+            messages = rec.get("messages") or []
+            entry.message_count = len(messages)
+            entry.preview = message_preview(messages)
+            entry.blob_refs = messages_blob_refs(messages)
+            sid = str(rec["id"])
+        except Exception:
+            return
+        self._drop_entry(sid)
+        self._index[sid] = entry
+        self._live_records += 1
+        self._live_bytes += length
+
+    def _index_line(self, raw_line: bytes, offset: int) -> None:
+        line = raw_line.strip()
+        if not line:
+            return
+        try:
+            rec = codec.loads(line)
+        except Exception:
+            return
+        if isinstance(rec, dict):
+            self._index_record(rec, offset, len(raw_line))
+
+    def _scan_from(self, start: int) -> None:
+        """Index complete lines from byte `start` to EOF."""
+        with open(self.path, "rb") as f:
+            f.seek(start)
+            offset = start
+            for raw_line in f:
+                if not raw_line.endswith(b"\n"):
+                    # partial line from an in-flight append; pick it up next sync
+                    break
+                self._index_line(raw_line, offset)
+                offset += len(raw_line)
+        self._indexed_size = offset
+
+    def _sync_index(self) -> None:
+        """Make the index match the file on disk. Caller holds `self._lock`."""
+        if self._writer.busy():
+            # our own appends are in flight: the index is ahead of the file
+            return
+        fp, conflict = self._writer.take_state()
+        if conflict:
+            self._fingerprint = None
+        elif fp:
+            self._fingerprint = fp
+        if self._log_lock.generation() != self._generation:
+            self._fingerprint = None  # rewritten by another process
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset_index()
+            return
+        if (st.st_ino, st.st_size, st.st_mtime_ns) == self._fingerprint:
+            return
+        with self._exclusive():
+            # no other process appends or rewrites while we look
+            self._generation = self._log_lock.generation()
+            try:
+                st = os.stat(self.path)
+            except FileNotFoundError:
+                self._reset_index()
+                return
+            fp = (st.st_ino, st.st_size, st.st_mtime_ns)
+            if self._fingerprint is None or st.st_ino != self._fingerprint[0] or st.st_size <= self._indexed_size:
+                # first build, file replaced or rewritten in place
+                self._reset_index()
+                self._load_summary(st)
+            if st.st_size > self._indexed_size:
+                self._scan_from(self._indexed_size)
+                self._summary_dirty = True
+            self._fingerprint = fp
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """
+        Hold the cross-process log lock (reentrant). Caller holds `self._lock`
+        and must not wait on the log writer until it is released.
+        """
+        self._flock_depth += 1
+        try:
+            if self._flock_depth == 1:
+                with self._log_lock.exclusive():
+                    yield
+            else:
+                yield
+        finally:
+            self._flock_depth -= 1
+
+    # ---- summary sidecar ----
+
+    def _load_summary(self, st: os.stat_result) -> bool:
+        """Adopt the sidecar index if it describes a prefix of the current log."""
+        try:
+            with open(self.summary_path, "rb") as f:
+                data = codec.loads(f.read())
+            covered = int(data["indexed_size"])
+            if (
+                data.get("version") != 3
+                or int(data["ino"]) != st.st_ino
+                or int(data.get("generation", self._generation)) != self._generation
+                or covered > st.st_size
+            ):
+                return False
+            if covered:
+                with open(self.path, "rb") as lf:
+                    lf.seek(covered - 1)
+                    if lf.read(1) != b"\n":
+                        return False
+            index = {
+                sid: _IndexEntry(**{**e, "deltas": [tuple(d) for d in e.get("deltas", [])]})
+                for sid, e in data["entries"].items()
+            }
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+        self._index = index
+        self._indexed_size = covered
+        self._total_records = int(data.get("total_records", len(index)))
+        self._live_records = int(data.get("live_records", len(index)))
+        self._live_bytes = int(data.get("live_bytes", 0))
+        self._tombstones = {str(k): float(v) for k, v in (data.get("tombstones") or {}).items()}
+        return True
+
+    def _write_summary(self) -> None:
+        """Write the sidecar index. Caller holds `self._lock`."""
+        self._writer.drain()
+        self._sync_index()
+        if not self._fingerprint:
+            return
+        data = {
+            "version": 3,
+            "ino": self._fingerprint[0],
+            "generation": self._generation,
+            "indexed_size": self._indexed_size,
+            "total_records": self._total_records,
+            "live_records": self._live_records,
+            "live_bytes": self._live_bytes,
+            "entries": self._index,
+            "tombstones": self._tombstones,
+        }
+        tmp = f"{self.summary_path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(codec.dumpb(data))
+        os.replace(tmp, self.summary_path)
+        self._summary_dirty = False
+
+    def flush(self) -> None:
+        self._writer.sync()
+        with self._lock:
+            if self._summary_dirty:
+                self._write_summary()
 
-        existing = self._materialize()
-        imported = 0
-        skipped = 0
+    def close(self) -> None:
+        if self._tombstones:
+            self._purge()
+        self.flush()
+        self._writer.close()
 
-        def _to_session(raw: Dict[str, Any]) -> Optional[Session]:
+    @contextmanager
+    def _writing(self) -> Iterator[None]:
+        """
+        Hold the lock for a write, then wait for the appended records to be
+        durable (per the fsync policy) after releasing it.
+        """
+        with self._lock:
+            self._write_depth += 1
             try:
-                sid = str(raw.get("id") or "").strip() or uuid4().hex
-                title = str(raw.get("title") or "New Chat").strip() or "New Chat"
-                group = self._normalize_group(raw.get("group"))
-                created_at = float(raw.get("created_at") or time.time())
-                updated_at = float(raw.get("updated_at") or created_at)
-                messages = raw.get("messages") or []
-                if not isinstance(messages, list):
-                    messages = []
-                normalized = []
-                for m in messages:
-                    if isinstance(m, dict) and "role" in m and "content" in m:
-                        normalized.append(m)
-                return Session(id=sid, title=title, group=group, created_at=created_at, updated_at=updated_at, messages=normalized)
+                yield
+            finally:
+                self._write_depth -= 1
+                outermost = self._write_depth == 0
+                seq = self._writer.submitted
+        if outermost:
+            self._writer.wait(seq)
+
+    def _read_session(self, session_id: str) -> Optional[Session]:
+        """Read one session through the index. Caller holds `self._lock`."""
+        self._writer.drain()
+        for attempt in range(3):
+            with self._exclusive() if attempt == 2 else nullcontext():
+                self._sync_index()
+                entry = self._index.get(session_id)
+                if not entry or not self._fingerprint:
+                    return None
+                with open(self.path, "rb") as f:
+                    if os.fstat(f.fileno()).st_ino == self._fingerprint[0]:
+                        return self._read_entry_from(f, entry)
+            self._fingerprint = None  # replaced since the last sync
+        return None
+
+    def _read_entry_from(self, f: Any, entry: _IndexEntry) -> Optional[Session]:
+        """Read the snapshot of `entry` from open binary file `f` and replay its deltas."""
+        f.seek(entry.offset)
+        raw_line = f.read(entry.length)
+        try:
+            sess = self._parse_session(codec.loads_snapshot(raw_line))
+        except Exception:
+            return None
+        if not sess:
+            return None
+        for offset, length in entry.deltas:
+            f.seek(offset)
+            try:
+                rec = codec.loads(f.read(length))
             except Exception:
+                continue
+            self._apply_delta(sess, rec)
+        return sess
+
+    def _append_record(self, rec: Dict[str, Any]) -> None:
+        """Queue one record on the log writer and index it. Caller holds `self._lock`."""
+        data = codec.dump_line(rec)
+        self._sync_index()
+        offset = self._indexed_size
+        self._writer.submit(data, offset)
+        self._index_record(rec, offset, len(data))
+        self._indexed_size = offset + len(data)
+        self._summary_dirty = True
+        if self._should_compact():
+            self._wake_background()
+
+    def _replace_log(self, records: Iterable[Dict[str, Any]]) -> None:
+        """
+        Atomically replace the log with `records` and rebuild the index.
+        Caller holds `self._lock`; the log lock is taken here unless the
+        caller already holds it (needed when `records` derive from the log).
+        """
+        self._writer.drain()
+        with self._exclusive():
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp, "wb") as f:
+                    for rec in records:
+                        f.write(codec.dump_line(rec))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+            finally:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+            self._generation = self._log_lock.bump()
+            self._reset_index()
+            self._sync_index()
+            self._write_summary()
+
+    def _write_all(self, sessions: List[Session]) -> None:
+        with self._lock:
+            self._replace_log(session_record(sess) for sess in sessions)
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            self._sync_index()
+            for sid, e in list(self._index.items()):
+                if e.preview is None:
+                    sess = self._read_session(sid)
+                    e.preview = message_preview(sess.messages) if sess else ""
+                    self._summary_dirty = True
+            items = sorted(self._index.items(), key=lambda x: x[1].updated_at, reverse=True)
+            return [self._entry_meta(sid, e) for sid, e in items]
+
+    def _entry_meta(self, session_id: str, e: _IndexEntry) -> Dict[str, Any]:
+        return {
+            "id": session_id,
+            "title": e.title,
+            "group": e.group,
+            "updated_at": e.updated_at,
+            "created_at": e.created_at,
+            "message_count": e.message_count,
+            "preview": e.preview,
+            "version": e.version,
+        }
+
+    def get_session_meta(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            self._sync_index()
+            e = self._index.get(session_id)
+            if not e:
                 return None
+            if e.preview is None:
+                sess = self._read_session(session_id)
+                e.preview = message_preview(sess.messages) if sess else ""
+                self._summary_dirty = True
+            return self._entry_meta(session_id, e)
 
-        if mode == "replace":
-            existing = {}
+    def get_session(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            return self._read_session(session_id)
 
-        for raw in sessions:
-            if not isinstance(raw, dict):
-                skipped += 1
-                continue
-            sess = _to_session(raw)
+    def _entry_blob_refs(self, session_id: str, e: _IndexEntry) -> List[str]:
+        """A session's blob references, recounted after a pop. Caller holds `self._lock`."""
+        if e.blob_refs is None:
+            sess = self._read_session(session_id)
+            e.blob_refs = messages_blob_refs(sess.messages) if sess else []
+            self._summary_dirty = True
+        return e.blob_refs
+
+    def _blob_references(self) -> Counter:
+        refs: Counter = Counter()
+        with self._lock:
+            self._sync_index()
+            for sid, e in self._index.items():
+                refs.update(self._entry_blob_refs(sid, e))
+        return refs
+
+    def _stamp_version(self, session: Session) -> None:
+        """Give a snapshot about to replace an indexed session the next version."""
+        entry = self._index.get(session.id)
+        if entry:
+            session.version = max(session.version, entry.version + 1)
+
+    def save_session(self, session: Session, expected_version: Optional[int] = None) -> None:
+        """Write a full snapshot. Prefer the delta methods for incremental edits."""
+        with self._writing():
+            self._sync_index()
+            entry = self._index.get(session.id)
+            check_version(session.id, expected_version, entry.version if entry else None)
+            session.updated_at = time.time()
+            self._stamp_version(session)
+            self._append_record(session_record(session))
+
+    def _append_delta(
+        self, session_id: str, op: str, expected_version: Optional[int] = None, **fields: Any
+    ) -> Optional[_IndexEntry]:
+        """Append a delta for an existing session; returns its updated index entry (version, timestamp)."""
+        with self._writing():
+            self._sync_index()
+            entry = self._index.get(session_id)
+            if not entry:
+                return None
+            # exact within this process; other workers' appends as of the sync above
+            check_version(session_id, expected_version, entry.version)
+            self._append_record({"op": op, "sid": session_id, "ts": time.time(), **fields})
+            return entry
+
+    def append_message(
+        self, session_id: str, message: Dict[str, Any], expected_version: Optional[int] = None
+    ) -> Optional[int]:
+        entry = self._append_delta(session_id, OP_APPEND, expected_version, message=message)
+        return entry.version if entry else None
+
+    def pop_message(self, session_id: str, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """Remove and return the last message of a session."""
+        with self._writing():
+            sess = self.get_session(session_id)
             if not sess:
-                skipped += 1
-                continue
+                return None
+            check_version(session_id, expected_version, sess.version)
+            if not sess.messages:
+                return None
+            self._append_delta(session_id, OP_POP)
+            return sess.messages[-1]
 
-            prev = existing.get(sess.id)
-            if prev and prev.updated_at > sess.updated_at:
-                skipped += 1
-                continue
-            existing[sess.id] = sess
-            imported += 1
+    def _update_meta(
+        self, session_id: str, op: str, expected_version: Optional[int], **fields: Any
+    ) -> Optional[Session]:
+        """Append a rename/group delta and return the session as it is afterwards."""
+        with self._writing():
+            sess = self.get_session(session_id)
+            if not sess:
+                return None
+            entry = self._append_delta(session_id, op, expected_version, **fields)
+            if entry:
+                self._apply_delta(sess, {"op": op, "ts": entry.updated_at, **fields})
+            return sess
+
+    def rename_session(self, session_id: str, title: str, expected_version: Optional[int] = None) -> Optional[Session]:
+        return self._update_meta(session_id, OP_RENAME, expected_version, title=title)
+
+    def set_session_group(
+        self, session_id: str, group: str, expected_version: Optional[int] = None
+    ) -> Optional[Session]:
+        return self._update_meta(session_id, OP_GROUP, expected_version, group=self._normalize_group(group))
+
+    def _append_archive_index(self, archive: Dict[str, Any]) -> None:
+        self._append_archive_indexes([archive])
+
+    def _append_archive_indexes(self, archives: List[Dict[str, Any]]) -> None:
+        data = b"".join(codec.dump_line(archive) for archive in archives)
+        with self._lock, self._exclusive():
+            with open(self.archive_index_path, "ab") as f:
+                f.write(data)
 
-        out = sorted(existing.values(), key=lambda x: x.updated_at)
-        self._write_all(out)
-        return {"imported": imported, "skipped": skipped, "total": len(out)}
+    def _sync_archives(self) -> None:
+        """
+        Make the archive cache match archives.jsonl. Caller holds
+        `self._archive_lock`. Like the session index, the cache is tied to
+        the file's (inode, size, mtime): appends are read from the old end,
+        a replaced file is read again from the start.
+        """
+        try:
+            st = os.stat(self.archive_index_path)
+        except FileNotFoundError:
+            self._archives, self._archives_sorted = {}, None
+            self._archives_size, self._archives_fp = 0, None
+            return
+        fp = (st.st_ino, st.st_size, st.st_mtime_ns)
+        if fp == self._archives_fp:
+            return
+        if self._archives_fp is None or st.st_ino != self._archives_fp[0] or st.st_size < self._archives_size:
+            self._archives, self._archives_size = {}, 0
+        with open(self.archive_index_path, "rb") as f:
+            f.seek(self._archives_size)
+            for raw_line in f:
+                if not raw_line.endswith(b"\n"):
+                    break  # partial line from an in-flight append
+                self._archives_size += len(raw_line)
+                try:
+                    row = codec.loads(raw_line)
+                except Exception:
+                    continue
+                archive_id = str(row.get("archive_id") or "").strip() if isinstance(row, dict) else ""
+                if archive_id:
+                    self._archives[archive_id] = row
+        self._archives_sorted = None
+        self._archives_fp = fp
+
+    def list_archives(self) -> List[Dict[str, Any]]:
+        with self._archive_lock:
+            self._sync_archives()
+            if self._archives_sorted is None:
+                self._archives_sorted = sorted(
+                    self._archives.values(), key=lambda x: float(x.get("archived_at", 0)), reverse=True
+                )
+            return list(self._archives_sorted)
+
+    def _find_archive(self, archive_id: str) -> Optional[Dict[str, Any]]:
+        with self._archive_lock:
+            self._sync_archives()
+            return self._archives.get(archive_id)
+
+    def _remove_archive_index(self, archive_id: str) -> None:
+        self._remove_archive_indexes([archive_id])
+
+    def _remove_archive_indexes(self, archive_ids: Iterable[str]) -> None:
+        """Rewrite archives.jsonl once without these rows (also drops superseded and bad lines)."""
+        drop = set(archive_ids)
+        with self._lock, self._exclusive():
+            kept = [x for x in self.list_archives() if x.get("archive_id") not in drop]
+            tmp = f"{self.archive_index_path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                for row in kept:
+                    f.write(codec.dump_line(row))
+            os.replace(tmp, self.archive_index_path)
+
+    def delete_session(self, session_id: str) -> bool:
+        """Append a tombstone: hidden at once, purged from the log within `purge_after` seconds."""
+        return self.delete_sessions([session_id])[session_id]
+
+    def delete_sessions(self, session_ids: Iterable[str]) -> Dict[str, bool]:
+        """Tombstone several sessions; the records share one group-commit write."""
+        out: Dict[str, bool] = {}
+        with self._writing():
+            self._sync_index()
+            ts = time.time()
+            for sid in dict.fromkeys(session_ids):
+                out[sid] = sid in self._index
+                if out[sid]:
+                    if self.blobs is not None:
+                        self._release_blobs(self._entry_blob_refs(sid, self._index[sid]))
+                    self._append_record({"op": OP_DELETE, "sid": sid, "ts": ts})
+        if any(out.values()):
+            self._wake_background()
+        return out
+
+    def set_sessions_group(self, session_ids: Iterable[str], group: str) -> Dict[str, bool]:
+        """Append one group delta per session, all in one group-commit write."""
+        group = self._normalize_group(group)
+        out: Dict[str, bool] = {}
+        with self._writing():
+            self._sync_index()
+            ts = time.time()
+            for sid in dict.fromkeys(session_ids):
+                out[sid] = sid in self._index
+                if out[sid]:
+                    self._append_record({"op": OP_GROUP, "sid": sid, "ts": ts, "group": group})
+        return out
+
+    def import_all(self, sessions: Iterable[Any], mode: str = "append") -> Dict[str, int]:
+        """Stream an import into the log (append: snapshots appended; replace: written into the new log)."""
+        if mode not in ("append", "replace"):
+            raise ValueError("mode must be append or replace")
+
+        counts = {"imported": 0, "skipped": 0}
+        with self._writing():
+            if mode == "replace":
+                if self.blobs is not None:
+                    self._sync_index()
+                    for sid, e in list(self._index.items()):
+                        self._release_blobs(self._entry_blob_refs(sid, e))
+                seen: Dict[str, float] = {}
+
+                def records() -> Iterator[Dict[str, Any]]:
+                    for sess in self._merge_import(sessions, seen.get, counts):
+                        seen[sess.id] = sess.updated_at
+                        yield session_record(sess)
+
+                self._replace_log(records())
+            else:
+                self._sync_index()
+
+                def updated_at_of(session_id: str) -> Optional[float]:
+                    entry = self._index.get(session_id)
+                    return entry.updated_at if entry else None
+
+                for sess in self._merge_import(sessions, updated_at_of, counts):
+                    self._stamp_version(sess)
+                    self._append_record(session_record(sess))
+            total = len(self._index)
+        if mode == "replace":
+            self._purge_blobs()  # the old sessions are gone from the log already
+        return {**counts, "total": total}
 
     def compact(self) -> Dict[str, int]:
-        snapshots = self._load_all_snapshots()
-        before = len(snapshots)
-        by_id = self._materialize()
-        ordered = sorted(by_id.values(), key=lambda x: x.updated_at)
-        self._write_all(ordered)
-        return {"before": before, "after": len(ordered), "saved": max(0, before - len(ordered))}
+        """Rewrite the log as one snapshot per session, folding in all deltas."""
+        before = self._total_records
+        if self._compact_now(auto=False) is None:
+            # a concurrent rewrite raced us; finish while holding the lock
+            with self._lock:
+                self._compact_now(auto=False)
+        after = self._total_records
+        return {"before": before, "after": after, "saved": max(0, before - after)}
+
+    def _should_compact(self) -> bool:
+        if not self._fingerprint or self._total_records == 0:
+            return False
+        if self._indexed_size < self.compact_min_bytes:
+            return False
+        return self._live_records / self._total_records < self.compact_live_ratio
+
+    def _background_tick(self) -> None:
+        if self._background_due_in() <= 0:
+            self._purge()
+        elif self._should_compact():
+            self._compact_now(auto=True)
+        self.flush()
+
+    def _background_due_in(self) -> float:
+        with self._lock:
+            if not self._tombstones:
+                return float("inf")
+            oldest = min(self._tombstones.values())
+        return oldest + self.purge_after - time.time()
+
+    def _purge(self) -> None:
+        """Physically remove deleted sessions: a compaction drops every record of them."""
+        if self._compact_now(auto=True) is None:
+            with self._lock:
+                self._compact_now(auto=True)
+        with self._lock:
+            self._compaction["purge_runs"] += 1
+        self._purge_blobs()
+
+    def _compact_now(self, auto: bool) -> Optional[Dict[str, Any]]:
+        """Compact without holding the lock for the rewrite; None if someone else rewrote the log meanwhile."""
+        started = time.time()
+        with self._lock:
+            self._writer.drain()
+            self._sync_index()
+            if not self._fingerprint:
+                return {"reclaimed_bytes": 0}
+            generation = self._generation
+            ino = self._fingerprint[0]
+            end = self._indexed_size
+            plan = sorted(
+                ((sid, replace(e, deltas=list(e.deltas))) for sid, e in self._index.items()),
+                key=lambda x: x[1].updated_at,
+            )
+
+        # unique per attempt: compactions may run concurrently in threads and processes
+        tmp = f"{self.path}.{os.getpid()}.{threading.get_ident()}.compact.tmp"
+        new_index: Dict[str, _IndexEntry] = {}
+        src = open(self.path, "rb")
+        dst = open(tmp, "wb")
+        try:
+            if os.fstat(src.fileno()).st_ino != ino:
+                return self._abort_compaction()
+            for sid, entry in plan:
+                sess = self._read_entry_from(src, entry)
+                if not sess:
+                    continue
+                data = codec.dump_line(sess)
+                new_index[sid] = _IndexEntry(
+                    offset=dst.tell(),
+                    length=len(data),
+                    title=sess.title,
+                    group=sess.group,
+                    created_at=sess.created_at,
+                    updated_at=sess.updated_at,
+                    message_count=len(sess.messages),
+                    preview=message_preview(sess.messages),
+                    version=sess.version,
+                    blob_refs=messages_blob_refs(sess.messages),
+                )
+                dst.write(data)
+
+            with self._lock:
+                self._writer.drain()
+                with self._exclusive():
+                    self._sync_index()
+                    if self._generation != generation or not self._fingerprint or self._fingerprint[0] != ino:
+                        return self._abort_compaction()
+                    # replay records appended while we were writing
+                    compacted_size = dst.tell()
+                    src.seek(end)
+                    dst.write(src.read(self._indexed_size - end))
+                    dst.flush()
+                    os.fsync(dst.fileno())
+                    src.close()
+                    dst.close()
+                    os.replace(tmp, self.path)
+
+                    self._generation = self._log_lock.bump()
+                    self._index = new_index
+                    self._total_records = self._live_records = len(new_index)
+                    self._live_bytes = compacted_size
+                    self._indexed_size = compacted_size
+                    self._tombstones = {}  # purged; deletes in the replayed tail re-add theirs
+                    self._scan_from(compacted_size)
+                    st = os.stat(self.path)
+                    self._fingerprint = (st.st_ino, st.st_size, st.st_mtime_ns)
+                    self._write_summary()
+
+                    reclaimed = max(0, end - compacted_size)
+                    c = self._compaction
+                    c["runs"] += 1
+                    if auto:
+                        c["auto_runs"] += 1
+                    c["last_run_at"] = started
+                    c["last_duration_ms"] = int((time.time() - started) * 1000)
+                    c["last_reclaimed_bytes"] = reclaimed
+                    c["reclaimed_bytes_total"] += reclaimed
+                    return {"reclaimed_bytes": reclaimed}
+        finally:
+            src.close()
+            dst.close()
+            if os.path.exists(tmp):
+                os.remove(tmp)
+
+    def _abort_compaction(self) -> None:
+        """Record a compaction attempt that lost a race with another rewrite."""
+        with self._lock:
+            self._compaction["aborted"] += 1
+        return None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._writer.drain()
+            self._sync_index()
+            file_bytes = self._fingerprint[1] if self._fingerprint else 0
+            return {
+                "engine": "jsonl",
+                "sessions": len(self._index),
+                "file_bytes": file_bytes,
+                "live_bytes": self._live_bytes,
+                "total_records": self._total_records,
+                "live_records": self._live_records,
+                "live_ratio": (self._live_records / self._total_records) if self._total_records else 1.0,
+                "tombstones": len(self._tombstones),
+                "oldest_tombstone_age_s": (
+                    round(time.time() - min(self._tombstones.values()), 3) if self._tombstones else None
+                ),
+                "purge_after_s": self.purge_after,
+                "compaction": {
+                    **self._compaction,
+                    "min_bytes": self.compact_min_bytes,
+                    "live_ratio_threshold": self.compact_live_ratio,
+                },
+                "writer": self._writer.stats(),
+                "archive_retention": self.retention_stats(),
+                "blobs": self.blobs.stats() if self.blobs else None,
+            }
+
+STORE_ENGINES = ("jsonl", "sqlite")
+
+
+def open_store(data_dir: str, engine: str = "jsonl", **options: Any) -> BaseSessionStore:
+    """
+    Create the session store for `engine` ("jsonl" or "sqlite").
+    Engine-specific `options` are passed through; unknown ones are ignored.
+    """
+    name = (engine or "jsonl").strip().lower()
+    if name == "jsonl":
+        return SessionStore(data_dir, **options)
+    if name == "sqlite":
+        from snlite.store_sqlite import SQLiteSessionStore
+
+        return SQLiteSessionStore(data_dir, **options)
+    raise ValueError(f"unknown store engine: {engine!r} (expected one of {', '.join(STORE_ENGINES)})")
@@ -0,0 +1,604 @@
+from __future__ import annotations
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from snlite import codec
+from snlite.blobs import BlobStore, message_blob_refs
+from snlite.compact import message_json
+from snlite.store import (
+    FSYNC_POLICIES,
+    ArchiveRetention,
+    BaseSessionStore,
+    Session,
+    SessionStore,
+    check_version,
+    decode_cursor,
+    message_preview,
+    strip_heavy_meta,
+)
+
+logger = logging.getLogger(__name__)
+
+# Files of the jsonl engine that the migration copies into the database.
+LEGACY_JSONL_FILES = ("sessions.jsonl", "sessions.summary.json", "archives.jsonl")
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    title TEXT NOT NULL,
+    "group" TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    preview TEXT NOT NULL DEFAULT '',
+    version INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions (updated_at DESC, id DESC);
+CREATE INDEX IF NOT EXISTS idx_sessions_group_updated ON sessions ("group", updated_at DESC, id DESC);
+
+CREATE TABLE IF NOT EXISTS messages (
+    session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    body TEXT NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS blob_refs (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    digest TEXT NOT NULL,
+    FOREIGN KEY (session_id, seq) REFERENCES messages (session_id, seq) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS idx_blob_refs_message ON blob_refs (session_id, seq);
+
+CREATE TABLE IF NOT EXISTS archives (
+    archive_id TEXT PRIMARY KEY,
+    archived_at REAL NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_archives_archived ON archives (archived_at DESC);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# fsync policy -> PRAGMA synchronous (WAL: NORMAL syncs at checkpoints, FULL on every commit)
+SYNCHRONOUS = {"none": "OFF", "interval": "NORMAL", "always": "FULL"}
+
+
+class SQLiteSessionStore(BaseSessionStore):
+    """
+    SQLite store (stdlib sqlite3, WAL mode):
+    - file: data/snlite.db
+    - sessions: one row per session (title, group, timestamps, message
+      count and last-message preview, kept current on every write)
+    - messages: one row per message, JSON body, ordered by seq
+    - blob_refs: the blob hashes each message references, removed with it,
+      so blob collection does not read message bodies
+    - archives: archive index rows (archive bodies stay in data/archives)
+
+    Listing is served from the (updated_at) / (group, updated_at) indexes and
+    a session fetch reads only its own message rows, so neither depends on
+    the total amount of stored history. Deletes, imports and compaction touch
+    only the affected rows.
+
+    On first open, existing `sessions.jsonl` / `archives.jsonl` are imported
+    once; the JSONL files are left in place untouched.
+
+    The `fsync` policy maps to PRAGMA synchronous: SQLite already commits
+    concurrent writers in WAL batches, so only the sync level is configurable.
+
+    Deletes run with secure_delete, so freed pages are zeroed; the old page
+    images left in the WAL are removed by a TRUNCATE checkpoint that the
+    maintenance thread runs within `purge_after` seconds of a delete.
+    """
+    def __init__(
+        self,
+        data_dir: str,
+        fsync: str = "interval",
+        purge_after: float = 60.0,
+        archive_compression: str = "gzip",
+        archive_retention: Optional[ArchiveRetention] = None,
+        blobs: Optional[BlobStore] = None,
+        **_: Any,
+    ) -> None:
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"unknown fsync policy: {fsync!r} (expected one of {', '.join(FSYNC_POLICIES)})")
+        super().__init__(
+            data_dir, archive_compression=archive_compression, archive_retention=archive_retention, blobs=blobs
+        )
+        self.path = os.path.join(self.data_dir, "snlite.db")
+        self._lock = threading.RLock()
+        # several worker processes may share the database; wait for their write locks
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        # SQLite's lower() only folds ASCII; match the JSONL engine's str.lower
+        self._conn.create_function("py_lower", 1, lambda v: v.lower() if isinstance(v, str) else v, deterministic=True)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(f"PRAGMA synchronous={SYNCHRONOUS[fsync]}")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.execute("PRAGMA secure_delete=ON")
+        self.purge_after = max(0.0, float(purge_after))
+        self._purge_pending_since: Optional[float] = None
+        with self._lock:
+            self._conn.executescript(SCHEMA)
+            self._upgrade_schema()
+            self._migrate_from_jsonl()
+
+    def close(self) -> None:
+        with self._lock:
+            if self._purge_pending_since is not None and self._checkpoint():
+                self._purge_blobs()
+            self._conn.close()
+
+    def _tx(self) -> "_Transaction":
+        return _Transaction(self)
+
+    # ---- migration ----
+
+    def _upgrade_schema(self) -> None:
+        """Add summary and version columns to databases created before they existed."""
+        cols = {r["name"] for r in self._conn.execute("PRAGMA table_info(sessions)")}
+        if "message_count" not in cols:
+            with self._tx():
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN message_count INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN preview TEXT NOT NULL DEFAULT ''")
+                for row in self._conn.execute("SELECT id FROM sessions").fetchall():
+                    self._refresh_summary(row["id"])
+        if "version" not in cols:
+            with self._tx():
+                self._conn.execute("ALTER TABLE sessions ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+        if not self._conn.execute("SELECT 1 FROM meta WHERE key = 'blob_refs'").fetchone():
+            with self._tx():
+                if not self._conn.execute("SELECT 1 FROM meta WHERE key = 'blob_refs'").fetchone():
+                    self._conn.execute("DELETE FROM blob_refs")
+                    for row in self._conn.execute("SELECT session_id, seq, body FROM messages").fetchall():
+                        self._insert_blob_refs(row["session_id"], row["seq"], codec.loads(row["body"]))
+                    self._conn.execute("INSERT INTO meta (key, value) VALUES ('blob_refs', '1')")
+
+    def _migrate_from_jsonl(self) -> None:
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'jsonl_migrated'").fetchone()
+        if row:
+            self._remove_legacy_jsonl()  # left behind by versions that kept them
+            return
+
+        jsonl = SessionStore(self.data_dir)
+        try:
+            sessions = jsonl._materialize()
+            archives = jsonl.list_archives()
+        finally:
+            jsonl.close()
+        with self._tx():
+            # another worker process may have migrated while we were reading
+            if self._conn.execute("SELECT 1 FROM meta WHERE key = 'jsonl_migrated'").fetchone():
+                return
+            for sess in sessions.values():
+                self._insert_session(sess)
+            for archive in archives:
+                self._append_archive_index(archive)
+            self._conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('jsonl_migrated', ?)",
+                (codec.dumps({"at": time.time(), "sessions": len(sessions), "archives": len(archives)}),),
+            )
+        self._remove_legacy_jsonl()
+
+    def _remove_legacy_jsonl(self) -> None:
+        """
+        Delete the migrated jsonl files: kept around, they would hold every
+        session deleted later past the purge window.
+        """
+        for name in LEGACY_JSONL_FILES:
+            path = os.path.join(self.data_dir, name)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            logger.info("removed %s: its data was migrated into %s", path, self.path)
+
+    # ---- sessions ----
+
+    def _insert_session(self, sess: Session) -> None:
+        self._conn.execute(
+            'INSERT OR REPLACE INTO sessions (id, title, "group", created_at, updated_at, message_count, preview, version) '
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                sess.id, sess.title, sess.group, sess.created_at, sess.updated_at,
+                len(sess.messages), message_preview(sess.messages), sess.version,
+            ),
+        )
+        self._conn.execute("DELETE FROM messages WHERE session_id = ?", (sess.id,))
+        self._conn.executemany(
+            "INSERT INTO messages (session_id, seq, body) VALUES (?, ?, ?)",
+            [(sess.id, i, message_json(m)) for i, m in enumerate(sess.messages)],
+        )
+        for i, m in enumerate(sess.messages):
+            self._insert_blob_refs(sess.id, i, m)
+
+    def _insert_blob_refs(self, session_id: str, seq: int, message: Dict[str, Any]) -> None:
+        self._conn.executemany(
+            "INSERT INTO blob_refs (session_id, seq, digest) VALUES (?, ?, ?)",
+            [(session_id, seq, digest) for digest in message_blob_refs(message)],
+        )
+
+    def _refresh_summary(self, session_id: str) -> None:
+        """Recompute message_count and preview from the message rows."""
+        count = self._conn.execute("SELECT COUNT(*) FROM messages WHERE session_id = ?", (session_id,)).fetchone()[0]
+        last = self._conn.execute(
+            "SELECT body FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1", (session_id,)
+        ).fetchone()
+        preview = message_preview([codec.loads(last["body"])]) if last else ""
+        self._conn.execute(
+            "UPDATE sessions SET message_count = ?, preview = ? WHERE id = ?", (count, preview, session_id)
+        )
+
+    def _session_row(self, session_id: str) -> Optional[sqlite3.Row]:
+        return self._conn.execute(
+            'SELECT id, title, "group", created_at, updated_at, message_count, preview, version FROM sessions WHERE id = ?',
+            (session_id,),
+        ).fetchone()
+
+    def _row_to_meta(self, row: sqlite3.Row) -> Dict[str, Any]:
+        return {
+            "id": row["id"],
+            "title": row["title"],
+            "group": row["group"],
+            "updated_at": row["updated_at"],
+            "created_at": row["created_at"],
+            "message_count": row["message_count"],
+            "preview": row["preview"],
+            "version": row["version"],
+        }
+
+    def list_sessions(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT id, title, "group", created_at, updated_at, message_count, preview, version '
+                "FROM sessions ORDER BY updated_at DESC"
+            ).fetchall()
+        return [self._row_to_meta(r) for r in rows]
+
+    def get_session_meta(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._session_row(session_id)
+        return self._row_to_meta(row) if row else None
+
+    def list_sessions_page(
+        self,
+        limit: int = 50,
+        cursor: Optional[str] = None,
+        group: Optional[str] = None,
+        q: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        where: List[str] = ["title != '__deleted__'"]
+        args: List[Any] = []
+        if group is not None:
+            where.append('"group" = ?')
+            args.append(group)
+        needle = (q or "").strip().lower()
+        if needle:
+            where.append('(instr(py_lower(title), ?) > 0 OR instr(py_lower("group"), ?) > 0)')
+            args.extend([needle, needle])
+        if cursor:
+            updated_at, session_id = decode_cursor(cursor)
+            where.append("(updated_at, id) < (?, ?)")
+            args.extend([updated_at, session_id])
+        sql = (
+            'SELECT id, title, "group", created_at, updated_at, message_count, preview, version FROM sessions'
+            + " WHERE " + " AND ".join(where)
+            + " ORDER BY updated_at DESC, id DESC LIMIT ?"
+        )
+        with self._lock:
+            rows = self._conn.execute(sql, (*args, limit + 1)).fetchall()
+        return self._page([self._row_to_meta(r) for r in rows], limit)
+
+    def get_session_window(
+        self,
+        session_id: str,
+        before: Optional[int] = None,
+        limit: Optional[int] = None,
+        strip_meta: bool = False,
+    ) -> Optional[Tuple[Session, Dict[str, Any]]]:
+        with self._lock:
+            row = self._session_row(session_id)
+            if not row:
+                return None
+            total = row["message_count"]
+            end = total if before is None else max(0, min(int(before), total))
+            start = 0 if limit is None else max(0, end - max(0, int(limit)))
+            bodies = self._conn.execute(
+                "SELECT body FROM messages WHERE session_id = ? AND seq >= ? AND seq < ? ORDER BY seq",
+                (session_id, start, end),
+            ).fetchall()
+        messages = [codec.loads(b["body"]) for b in bodies]
+        if strip_meta:
+            messages = [strip_heavy_meta(m) for m in messages]
+        sess = Session(
+            id=row["id"],
+            title=row["title"],
+            group=row["group"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            messages=messages,
+            version=row["version"],
+        )
+        return sess, {"start": start, "end": end, "total": total, "has_more": start > 0}
+
+    def get_session(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._session_row(session_id)
+            if not row:
+                return None
+            bodies = self._conn.execute(
+                "SELECT body FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        messages = []
+        for b in bodies:
+            try:
+                messages.append(codec.loads(b["body"]))
+            except Exception:
+                continue
+        return Session(
+            id=row["id"],
+            title=row["title"],
+            group=row["group"],
+            created_at=row["created_at"],
+            updated_at=row["updated_at"],
+            messages=messages,
+            version=row["version"],
+        )
+
+    def _version(self, session_id: str) -> Optional[int]:
+        row = self._conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row["version"] if row else None
+
+    def save_session(self, session: Session, expected_version: Optional[int] = None) -> None:
+        with self._lock, self._tx():
+            current = self._version(session.id)
+            check_version(session.id, expected_version, current)
+            session.updated_at = time.time()
+            if current is not None:
+                session.version = max(session.version, current + 1)
+            self._insert_session(session)
+
+    def _touch(self, session_id: str, expected_version: Optional[int] = None, **columns: Any) -> Optional[int]:
+        """
+        Update session columns plus updated_at and bump the version; returns
+        the new version. Caller holds a transaction (BEGIN IMMEDIATE), so the
+        version check is exact across processes too.
+        """
+        if expected_version is not None:
+            current = self._version(session_id)
+            if current is None:
+                return None
+            check_version(session_id, expected_version, current)
+        sets = ", ".join(f'"{k}" = ?' for k in columns)
+        sql = f"UPDATE sessions SET {sets + ', ' if sets else ''}updated_at = ?, version = version + 1 WHERE id = ?"
+        cur = self._conn.execute(sql, (*columns.values(), time.time(), session_id))
+        return self._version(session_id) if cur.rowcount else None
+
+    def append_message(
+        self, session_id: str, message: Dict[str, Any], expected_version: Optional[int] = None
+    ) -> Optional[int]:
+        with self._lock, self._tx():
+            version = self._touch(session_id, expected_version)
+            if version is None:
+                return None
+            seq = self._conn.execute(
+                "SELECT COALESCE(MAX(seq), -1) + 1 FROM messages WHERE session_id = ?", (session_id,)
+            ).fetchone()[0]
+            self._conn.execute(
+                "INSERT INTO messages (session_id, seq, body) VALUES (?, ?, ?)",
+                (session_id, seq, codec.dumps(message)),
+            )
+            self._insert_blob_refs(session_id, seq, message)
+            self._conn.execute(
+                "UPDATE sessions SET message_count = message_count + 1, preview = ? WHERE id = ?",
+                (message_preview([message]), session_id),
+            )
+            return version
+
+    def pop_message(self, session_id: str, expected_version: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        with self._lock, self._tx():
+            current = self._version(session_id)
+            if current is None:
+                return None
+            check_version(session_id, expected_version, current)
+            row = self._conn.execute(
+                "SELECT seq, body FROM messages WHERE session_id = ? ORDER BY seq DESC LIMIT 1",
+                (session_id,),
+            ).fetchone()
+            if not row:
+                return None
+            self._conn.execute("DELETE FROM messages WHERE session_id = ? AND seq = ?", (session_id, row["seq"]))
+            self._touch(session_id)
+            self._refresh_summary(session_id)
+        try:
+            return codec.loads(row["body"])
+        except Exception:
+            return {}
+
+    def rename_session(self, session_id: str, title: str, expected_version: Optional[int] = None) -> Optional[Session]:
+        with self._lock:
+            with self._tx():
+                if self._touch(session_id, expected_version, title=title) is None:
+                    return None
+            return self.get_session(session_id)
+
+    def set_session_group(
+        self, session_id: str, group: str, expected_version: Optional[int] = None
+    ) -> Optional[Session]:
+        with self._lock:
+            with self._tx():
+                if self._touch(session_id, expected_version, group=self._normalize_group(group)) is None:
+                    return None
+            return self.get_session(session_id)
+
+    def delete_session(self, session_id: str) -> bool:
+        return self.delete_sessions([session_id])[session_id]
+
+    def delete_sessions(self, session_ids: Iterable[str]) -> Dict[str, bool]:
+        out: Dict[str, bool] = {}
+        with self._lock:
+            with self._tx():
+                for sid in dict.fromkeys(session_ids):
+                    if self.blobs is not None:
+                        rows = self._conn.execute("SELECT digest FROM blob_refs WHERE session_id = ?", (sid,))
+                        self._release_blobs(r["digest"] for r in rows)
+                    out[sid] = self._conn.execute("DELETE FROM sessions WHERE id = ?", (sid,)).rowcount > 0
+            if any(out.values()) and self._purge_pending_since is None:
+                self._purge_pending_since = time.time()
+        if any(out.values()):
+            self._wake_background()
+        return out
+
+    def set_sessions_group(self, session_ids: Iterable[str], group: str) -> Dict[str, bool]:
+        group = self._normalize_group(group)
+        with self._lock, self._tx():
+            return {sid: self._touch(sid, group=group) is not None for sid in dict.fromkeys(session_ids)}
+
+    # ---- purge ----
+
+    def _checkpoint(self) -> bool:
+        """Copy the WAL into the database and truncate it; False if readers kept it busy."""
+        busy = self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()[0]
+        if busy:
+            return False
+        self._purge_pending_since = None
+        return True
+
+    def _background_due_in(self) -> float:
+        since = self._purge_pending_since
+        if since is None:
+            return float("inf")
+        return since + self.purge_after - time.time()
+
+    def _background_tick(self) -> None:
+        if self._background_due_in() <= 0:
+            with self._lock:
+                purged = self._checkpoint()
+            if purged:
+                self._purge_blobs()
+
+    def _blob_references(self) -> Counter:
+        with self._lock:
+            rows = self._conn.execute("SELECT digest, COUNT(*) AS n FROM blob_refs GROUP BY digest").fetchall()
+        return Counter({r["digest"]: r["n"] for r in rows})
+
+    def import_all(self, sessions: Iterable[Any], mode: str = "append") -> Dict[str, int]:
+        if mode not in ("append", "replace"):
+            raise ValueError("mode must be append or replace")
+
+        def updated_at_of(session_id: str) -> Optional[float]:
+            row = self._conn.execute("SELECT updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            return row["updated_at"] if row else None
+
+        counts = {"imported": 0, "skipped": 0}
+        with self._lock, self._tx():
+            if mode == "replace":
+                if self.blobs is not None:
+                    self._release_blobs(r["digest"] for r in self._conn.execute("SELECT DISTINCT digest FROM blob_refs"))
+                self._conn.execute("DELETE FROM sessions")
+                self._purge_pending_since = self._purge_pending_since or time.time()
+            for sess in self._merge_import(sessions, updated_at_of, counts):
+                current = self._version(sess.id)
+                if current is not None:
+                    sess.version = max(sess.version, current + 1)
+                self._insert_session(sess)
+            total = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {**counts, "total": total}
+
+    def compact(self) -> Dict[str, int]:
+        """Checkpoint the WAL and VACUUM; row counts are unchanged."""
+        with self._lock:
+            count = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            self._conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._conn.execute("VACUUM")
+        return {"before": count, "after": count, "saved": 0}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sessions = self._conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            messages = self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        wal = self.path + "-wal"
+        return {
+            "engine": "sqlite",
+            "sessions": sessions,
+            "messages": messages,
+            "file_bytes": os.path.getsize(self.path),
+            "wal_bytes": os.path.getsize(wal) if os.path.exists(wal) else 0,
+            "purge_pending_since": self._purge_pending_since,
+            "purge_after_s": self.purge_after,
+            "archive_retention": self.retention_stats(),
+            "blobs": self.blobs.stats() if self.blobs else None,
+        }
+
+    # ---- archive index ----
+
+    def list_archives(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT body FROM archives ORDER BY archived_at DESC").fetchall()
+        return [codec.loads(r["body"]) for r in rows]
+
+    def _find_archive(self, archive_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT body FROM archives WHERE archive_id = ?", (archive_id,)).fetchone()
+        return codec.loads(row["body"]) if row else None
+
+    def _append_archive_index(self, archive: Dict[str, Any]) -> None:
+        archive_id = str(archive.get("archive_id") or "").strip()
+        if not archive_id:
+            return
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO archives (archive_id, archived_at, body) VALUES (?, ?, ?)",
+                (archive_id, float(archive.get("archived_at", 0)), codec.dumps(archive)),
+            )
+
+    def _append_archive_indexes(self, archives: List[Dict[str, Any]]) -> None:
+        rows = [
+            (str(a.get("archive_id")).strip(), float(a.get("archived_at", 0)), codec.dumps(a))
+            for a in archives
+            if str(a.get("archive_id") or "").strip()
+        ]
+        with self._lock, self._tx():
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO archives (archive_id, archived_at, body) VALUES (?, ?, ?)", rows
+            )
+
+    def _remove_archive_index(self, archive_id: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM archives WHERE archive_id = ?", (archive_id,))
+
+    def _remove_archive_indexes(self, archive_ids: Iterable[str]) -> None:
+        with self._lock, self._tx():
+            self._conn.executemany("DELETE FROM archives WHERE archive_id = ?", [(x,) for x in archive_ids])
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT/ROLLBACK; nested use joins the outer one."""
+    def __init__(self, store: SQLiteSessionStore) -> None:
+        self._conn = store._conn
+        self._owner = False
+
+    def __enter__(self) -> "_Transaction":
+        if not self._conn.in_transaction:
+            self._conn.execute("BEGIN IMMEDIATE")
+            self._owner = True
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        if not self._owner:
+            return
+        if exc_type is None:
+            self._conn.execute("COMMIT")
+        else:
+            self._conn.execute("ROLLBACK")
@@ -7,6 +7,7 @@ const $ = (id) => document.getElementById(id);
 let state = {
   providers: [],
   loaded: null,
+  model: null, // {provider, model_id} loaded in this tab; sent with every chat request
   currentSessionId: null,
   streaming: false,
   requestId: null,
@@ -14,8 +15,14 @@ let state = {
   chatSearchMatches: [],
   chatSearchIndex: -1,
   selectedArchiveId: null,
+  sessionItems: [],
+  sessionCursor: null,
+  messageWindow: { sessionId: null, start: 0, loading: false },
 };
 
+const SESSION_PAGE_SIZE = 100;
+const MESSAGE_PAGE_SIZE = 40;
+
 let attachedImage = { name: null, b64: null };
 let attachedFiles = []; // {name, mime, size, b64}
 
@@ -714,6 +721,66 @@ async function apiDelete(url) {
   return r.json();
 }
 
+// Reads a chat event stream and hands out whole SSE frames as text. If the
+// connection drops before the `done` event, it reconnects to
+// /api/chat/stream/<request_id> with the last event id seen, so the
+// generation (which keeps running on the server) continues where it left off.
+const STREAM_RESUME_TRIES = 5;
+
+function resumableReader(resp) {
+  let reader = resp.body.getReader();
+  let decoder = new TextDecoder("utf-8");
+  let pending = "";
+  let lastId = null;
+  let finished = false;
+  let tries = 0;
+
+  async function reconnect() {
+    while (tries < STREAM_RESUME_TRIES) {
+      tries += 1;
+      await new Promise(r => setTimeout(r, 300 * tries));
+      try {
+        const headers = lastId === null ? {} : { "Last-Event-ID": String(lastId) };
+        const r = await fetch(`/api/chat/stream/${encodeURIComponent(state.requestId)}`, { headers });
+        if (r.status === 404) return false;
+        if (!r.ok) continue;
+        reader = r.body.getReader();
+        decoder = new TextDecoder("utf-8");
+        pending = "";
+        return true;
+      } catch {}
+    }
+    return false;
+  }
+
+  return {
+    async read() {
+      while (true) {
+        let chunk = null;
+        try {
+          const { value, done } = await reader.read();
+          if (!done) chunk = value;
+        } catch (e) {
+          if (!state.requestId) throw e;
+        }
+        if (chunk === null) {
+          if (finished || !state.requestId || !(await reconnect())) return { value: undefined, done: true };
+          continue;
+        }
+        pending += decoder.decode(chunk, { stream: true });
+        const cut = pending.lastIndexOf("\n\n");
+        if (cut === -1) continue;
+        const text = pending.slice(0, cut + 2);
+        pending = pending.slice(cut + 2);
+        for (const m of text.matchAll(/^id: *(\d+)$/gm)) lastId = Number(m[1]);
+        if (/^event: *done$/m.test(text)) finished = true;
+        tries = 0;
+        return { value: text, done: false };
+      }
+    },
+  };
+}
+
 /* ---------------------------
    UI helpers
 ---------------------------- */
@@ -897,6 +964,7 @@ function setMessageContent(contentEl, rawText, bubbleEl = null) {
 
 function clearUI() {
   $("messages").innerHTML = "";
+  state.messageWindow = { sessionId: null, start: 0, loading: false };
   state.chatSearchMatches = [];
   state.chatSearchIndex = -1;
   updateChatSearch();
@@ -984,7 +1052,10 @@ async function refreshModels() {
   setModelStatus(t("status.refreshing"));
   const data = await apiGet("/api/models");
   state.providers = data.providers;
-  state.loaded = data.state.loaded;
+  // another tab may have loaded a different default since; this tab keeps its own model
+  state.loaded = state.model
+    ? ((data.state.models || []).find(m => m.provider === state.model.provider && m.model_id === state.model.model_id) || state.model)
+    : data.state.loaded;
   setLoadedBadge();
 
   const providerSelect = $("providerSelect");
@@ -1035,6 +1106,7 @@ async function loadModel() {
   if (!model_id) return;
   setModelStatus(t("status.loading"));
   const data = await apiPost("/api/models/load", { provider, model_id, params: {} });
+  state.model = { provider, model_id };
   state.loaded = data.loaded;
   setLoadedBadge();
   setModelStatus(data.status === "ready" ? t("status.ready_model", { provider: state.loaded.provider, model: state.loaded.model_id }) : data.status);
@@ -1042,7 +1114,8 @@ async function loadModel() {
 }
 
 async function unloadModel() {
-  const data = await apiPost("/api/models/unload", {});
+  const data = await apiPost("/api/models/unload", state.model || {});
+  state.model = null;
   state.loaded = data.loaded;
   setLoadedBadge();
   setModelStatus(t("status.unloaded"));
@@ -1050,21 +1123,37 @@ async function unloadModel() {
 }
 
 /* ---------- Sessions ---------- */
-async function refreshSessions() {
-  const items = await apiGet("/api/sessions");
-  const q = ($("sessionSearch")?.value || "").trim().toLowerCase();
-  const filtered = q
-    ? items.filter((s) => {
-      const t = (s.title || "").toLowerCase();
-      const g = (s.group || "").toLowerCase();
-      return t.includes(q) || g.includes(q);
-    })
-    : items;
+async function fetchSessionPage(cursor, limit) {
+  const qs = new URLSearchParams({ limit: String(limit) });
+  if (cursor) qs.set("cursor", cursor);
+  // filtered on the server, so sessions beyond the loaded pages are found too
+  const q = ($("sessionSearch")?.value || "").trim();
+  if (q) qs.set("q", q);
+  return apiGet(`/api/sessions?${qs.toString()}`);
+}
+
+async function loadMoreSessions() {
+  if (!state.sessionCursor) return;
+  const page = await fetchSessionPage(state.sessionCursor, SESSION_PAGE_SIZE);
+  state.sessionItems = state.sessionItems.concat(page.items || []);
+  state.sessionCursor = page.next_cursor || null;
+  await refreshSessions({ reload: false });
+}
+
+async function refreshSessions(opts = {}) {
+  if (opts.reload !== false) {
+    // keep as many sessions loaded as before so the sidebar does not shrink
+    const limit = Math.min(500, Math.max(SESSION_PAGE_SIZE, state.sessionItems.length));
+    const page = await fetchSessionPage(null, limit);
+    state.sessionItems = page.items || [];
+    state.sessionCursor = page.next_cursor || null;
+  }
+  const items = state.sessionItems;
   const container = $("sessions");
   container.innerHTML = "";
 
   const grouped = new Map();
-  for (const s of filtered) {
+  for (const s of items) {
     const groupName = (s.group || t("session.ungrouped")).trim() || t("session.ungrouped");
     if (!grouped.has(groupName)) grouped.set(groupName, []);
     grouped.get(groupName).push(s);
@@ -1080,6 +1169,7 @@ async function refreshSessions() {
       const div = document.createElement("div");
       div.className = "session-item" + (state.currentSessionId === s.id ? " active" : "");
       div.innerHTML = `<span class="session-title">${escapeHtml(s.title || t("session.new_chat"))}</span><span class="session-meta">${escapeHtml(groupName)}</span>`;
+      if (s.preview) div.title = s.preview;
       div.onclick = async () => {
         state.currentSessionId = s.id;
         await openSession(s.id);
@@ -1089,6 +1179,14 @@ async function refreshSessions() {
     }
   }
 
+  if (state.sessionCursor) {
+    const more = document.createElement("div");
+    more.className = "session-item session-more";
+    more.textContent = t("session.load_more");
+    more.onclick = loadMoreSessions;
+    container.appendChild(more);
+  }
+
   if (!state.currentSessionId && items.length) {
     state.currentSessionId = items[0].id;
     await openSession(items[0].id);
@@ -1169,9 +1267,10 @@ async function refreshArchives() {
     const ts = new Date((a.archived_at || 0) * 1000).toLocaleString();
     div.innerHTML = `<div class="archive-title">${escapeHtml(a.title || t("archive.untitled"))}</div><div class="archive-meta">${escapeHtml(a.group || t("session.ungrouped"))} · ${escapeHtml(ts)}</div>`;
     div.onclick = async () => {
-      const detail = await apiGet(`/api/archives/${a.archive_id}`);
+      const r = await fetch(`/api/archives/${a.archive_id}`);
+      if (!r.ok) throw new Error(await r.text());
       state.selectedArchiveId = a.archive_id;
-      $("archiveContent").value = detail.content || "";
+      $("archiveContent").value = await r.text();
       await refreshArchives();
     };
     box.appendChild(div);
@@ -1227,28 +1326,42 @@ async function exportSessionJson() {
 }
 
 async function exportAllSessions() {
-  const r = await fetch('/api/export/sessions.json');
-  if (!r.ok) {
-    alert(t('alert.backup_failed'));
-    return;
-  }
-  const data = await r.json();
+  // NDJSON backup, streamed by the server straight into the download
   const ts = new Date().toISOString().replace(/[:.]/g, '-');
-  const blob = new Blob([JSON.stringify(data, null, 2)], { type: 'application/json;charset=utf-8' });
   const a = document.createElement('a');
-  a.href = URL.createObjectURL(blob);
-  a.download = `snlite_backup_${ts}.json`;
+  a.href = '/api/export/sessions.ndjson';
+  a.download = `snlite_backup_${ts}.ndjson`;
   a.click();
-  URL.revokeObjectURL(a.href);
+}
+
+async function importNdjsonBackup(file) {
+  const replace = confirm(t('confirm.import_mode'));
+  const mode = replace ? 'replace' : 'append';
+  const r = await fetch(`/api/sessions/import.ndjson?mode=${mode}`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/x-ndjson' },
+    body: file,
+  });
+  if (!r.ok) {
+    alert(t('alert.invalid_json'));
+    return;
+  }
+  const result = await r.json();
+  alert(t('alert.import_done', { imported: result.imported, skipped: result.skipped }));
+  await refreshSessions();
 }
 
 async function importAllSessions() {
   const picker = document.createElement('input');
   picker.type = 'file';
-  picker.accept = '.json,application/json';
+  picker.accept = '.json,.ndjson,.jsonl,application/json,application/x-ndjson';
   picker.onchange = async (e) => {
     const file = e.target.files && e.target.files[0];
     if (!file) return;
+    if (/\.(ndjson|jsonl)$/i.test(file.name)) {
+      await importNdjsonBackup(file);
+      return;
+    }
     let parsed;
     try {
       parsed = JSON.parse(await file.text());
@@ -1277,26 +1390,61 @@ async function compactSessions() {
   alert(t('alert.compaction_done', { before: result.before, after: result.after, saved: result.saved }));
 }
 
+function renderStoredMessage(m) {
+  if (m.role !== "user" && m.role !== "assistant") return null;
+  const msg = createMessageRow(m.role, { raw: m.content });
+  setMessageContent(msg.contentEl, m.content, msg.bubble);
+  return msg.row;
+}
+
 async function openSession(sessionId) {
-  const sess = await apiGet(`/api/sessions/${sessionId}`);
+  const sess = await apiGet(`/api/sessions/${sessionId}?limit=${MESSAGE_PAGE_SIZE}&strip_meta=true`);
+  if (sess.model) {
+    // the session stays on the model it was using: show it and send it
+    state.model = { provider: sess.model.provider, model_id: sess.model.model_id };
+    state.loaded = sess.model;
+    setLoadedBadge();
+    syncThinkModeOptions();
+  }
   if ($("sessionGroup")) {
     $("sessionGroup").value = sess.group || "";
   }
   clearUI();
+  state.messageWindow = { sessionId, start: sess.window ? sess.window.start : 0, loading: false };
   for (const m of sess.messages) {
-    if (m.role === "user") {
-      const msg = createMessageRow("user", { raw: m.content });
-      setMessageContent(msg.contentEl, m.content, msg.bubble);
-    } else if (m.role === "assistant") {
-      const msg = createMessageRow("assistant", { raw: m.content });
-      setMessageContent(msg.contentEl, m.content, msg.bubble);
-    }
+    renderStoredMessage(m);
   }
   maybeAutoScroll(true);
   updateRegenButtons();
   updateChatSearch();
 }
 
+async function loadOlderMessages() {
+  const w = state.messageWindow;
+  if (!w.sessionId || w.loading || w.start <= 0 || state.currentSessionId !== w.sessionId) return;
+  w.loading = true;
+  try {
+    const sess = await apiGet(`/api/sessions/${w.sessionId}?before=${w.start}&limit=${MESSAGE_PAGE_SIZE}&strip_meta=true`);
+    if (state.currentSessionId !== w.sessionId) return;
+    const box = $("messages");
+    const scroller = $("chatScroll");
+    const prevHeight = scroller.scrollHeight;
+    const prevTop = scroller.scrollTop;
+    const firstRow = box.firstChild;
+    for (const m of sess.messages) {
+      const row = renderStoredMessage(m);
+      if (row) box.insertBefore(row, firstRow);
+    }
+    scroller.scrollTop = scroller.scrollHeight - prevHeight + prevTop;
+    w.start = sess.window ? sess.window.start : 0;
+    updateChatSearch();
+  } catch (err) {
+    console.error(err);
+  } finally {
+    w.loading = false;
+  }
+}
+
 async function stopStreaming() {
   if (!state.requestId) return;
   await apiPost("/api/chat/stop", { request_id: state.requestId });
@@ -1304,7 +1452,7 @@ async function stopStreaming() {
 
 async function maybeAutoTitle(sessionId) {
   try {
-    const sess = await apiGet(`/api/sessions/${sessionId}`);
+    const sess = await apiGet(`/api/sessions/${sessionId}?limit=4&strip_meta=true`);
     if (![t("session.new_chat"), "New Chat", "新聊天"].some((x) => sess.title === x || (sess.title || "").startsWith(x))) return;
     const hasUser = (sess.messages || []).some(m => m.role === "user" && (m.content || "").trim().length > 0);
     if (!hasUser) return;
@@ -1518,10 +1666,11 @@ async function regenerateLast() {
   $("btnStop").disabled = false;
   updateRegenButtons();
 
-  setStage(t("stage.answering"));
+  setStage(t("stage.sending"));
 
   const body = {
     session_id: state.currentSessionId,
+    ...(state.model || {}),
     show_trace: showTrace,
     retry_mode: $("retryMode")?.value || "keep_params",
   };
@@ -1543,8 +1692,7 @@ async function regenerateLast() {
     return;
   }
 
-  const reader = resp.body.getReader();
-  const decoder = new TextDecoder("utf-8");
+  const reader = resumableReader(resp);
   let buffer = "";
   let assistantRaw = "";
   const streamMeta = { fileChars: 0, fileTruncated: false, elapsedMs: null, outputChars: null, cancelled: false, finishReason: "" };
@@ -1556,7 +1704,7 @@ async function regenerateLast() {
     while (true) {
       const { value, done } = await reader.read();
       if (done) break;
-      buffer += decoder.decode(value, { stream: true });
+      buffer += value;
 
       let idx;
       while ((idx = buffer.indexOf("\n\n")) !== -1) {
@@ -1595,6 +1743,19 @@ async function regenerateLast() {
             const s = JSON.parse(dataLine);
             if (s.stage === "thinking") setStage(t("stage.thinking"));
             if (s.stage === "answering") setStage(t("stage.answering"));
+            if (s.stage === "queued") setStage(t("stage.queued", { position: s.position }));
+          } catch {}
+          continue;
+        }
+
+        if (eventType === "resync") {
+          // reconnected after the missed events left the server's buffer
+          try {
+            const obj = JSON.parse(dataLine);
+            assistantRaw = obj.content || "";
+            setMessageContent(assistantMsg.contentEl, assistantRaw, assistantMsg.bubble);
+            if ($("showTrace").checked) $("wsText").textContent = obj.thinking || "";
+            maybeAutoScroll(false);
           } catch {}
           continue;
         }
@@ -1711,7 +1872,7 @@ async function send() {
   wsShow(showTrace);
   if (showTrace) wsClear();
 
-  setStage(t("stage.answering"));
+  setStage(t("stage.sending"));
 
   const thinkMode = $("thinkMode").value;
 
@@ -1723,6 +1884,7 @@ async function send() {
 
   const body = {
     session_id: state.currentSessionId,
+    ...(state.model || {}),
     user_text: text,
     system_text: $("systemText").value || "",
     params: paramsFromUI(),
@@ -1752,8 +1914,7 @@ async function send() {
     return;
   }
 
-  const reader = resp.body.getReader();
-  const decoder = new TextDecoder("utf-8");
+  const reader = resumableReader(resp);
   let buffer = "";
   let assistantRaw = "";
   const streamMeta = { fileChars: 0, fileTruncated: false, elapsedMs: null, outputChars: null, cancelled: false, finishReason: "" };
@@ -1765,7 +1926,7 @@ async function send() {
     while (true) {
       const { value, done } = await reader.read();
       if (done) break;
-      buffer += decoder.decode(value, { stream: true });
+      buffer += value;
 
       let idx;
       while ((idx = buffer.indexOf("\n\n")) !== -1) {
@@ -1803,6 +1964,19 @@ async function send() {
             const s = JSON.parse(dataLine);
             if (s.stage === "thinking") setStage(t("stage.thinking"));
             if (s.stage === "answering") setStage(t("stage.answering"));
+            if (s.stage === "queued") setStage(t("stage.queued", { position: s.position }));
+          } catch {}
+          continue;
+        }
+
+        if (eventType === "resync") {
+          // reconnected after the missed events left the server's buffer
+          try {
+            const obj = JSON.parse(dataLine);
+            assistantRaw = obj.content || "";
+            setMessageContent(assistantMsg.contentEl, assistantRaw, assistantMsg.bubble);
+            if ($("showTrace").checked) $("wsText").textContent = obj.thinking || "";
+            maybeAutoScroll(false);
           } catch {}
           continue;
         }
@@ -1926,7 +2100,10 @@ async function init() {
     }
   });
 
-  $("chatScroll").addEventListener("scroll", () => updateUserScrolledFlag());
+  $("chatScroll").addEventListener("scroll", () => {
+    updateUserScrolledFlag();
+    if ($("chatScroll").scrollTop < 80) loadOlderMessages();
+  });
   $("chatSearch").addEventListener("input", () => updateChatSearch());
   $("btnSearchNext").onclick = () => focusChatSearchMatch(state.chatSearchIndex + 1);
   $("btnSearchPrev").onclick = () => focusChatSearchMatch(state.chatSearchIndex - 1);
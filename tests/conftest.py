@@ -0,0 +1,21 @@
+import pytest
+
+from snlite.blobs import BlobStore
+from snlite.store import STORE_ENGINES, open_store
+
+
+@pytest.fixture(params=STORE_ENGINES)
+def engine(request):
+    return request.param
+
+
+@pytest.fixture
+def blobs(tmp_path):
+    return BlobStore(str(tmp_path / "blobs"), grace=0)
+
+
+@pytest.fixture
+def store(tmp_path, engine, blobs):
+    st = open_store(str(tmp_path), engine, purge_after=0, blobs=blobs)
+    yield st
+    st.close()
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+
+os.environ.setdefault("SNLITE_DATA_DIR", tempfile.mkdtemp(prefix="snlite-test-"))
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from snlite import main
+from tests.test_registry import FakeProvider
+
+
+class ListedProvider(FakeProvider):
+    async def list_models(self):
+        return [{"id": "a"}, {"id": "b"}]
+
+    async def stream_chat(self, model_id, messages, params, cancelled):
+        for i in range(500):  # long enough to be stopped midway
+            if cancelled():
+                return
+            await asyncio.sleep(0.01)
+            yield {"content": f"t{i} "}
+
+
+@pytest.fixture(scope="module")
+def app_client():
+    # one app lifetime per module: shutdown closes the store
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setitem(main.PROVIDERS, "fake", ListedProvider())
+        with TestClient(main.app) as c:
+            yield c
+
+
+@pytest.fixture
+def client(app_client):
+    yield app_client
+    for model_id in ("a", "b"):
+        app_client.post("/api/models/unload", json={"provider": "fake", "model_id": model_id})
+
+
+def test_only_listed_models_are_loaded(client):
+    r = client.post("/api/models/load", json={"provider": "fake", "model_id": "nope"})
+    assert r.status_code == 400 and "nope" in r.json()["detail"]
+    r = client.post("/api/models/load", json={"provider": "fake", "model_id": "a"})
+    assert r.status_code == 200 and r.json()["loaded"]["model_id"] == "a"
+
+
+def test_rejected_turn_leaves_no_stream_behind(client, monkeypatch):
+    assert client.post("/api/models/load", json={"provider": "fake", "model_id": "a"}).status_code == 200
+    session_id = client.post("/api/sessions", json={}).json()["id"]
+
+    async def conflict(*args, **kwargs):
+        raise HTTPException(status_code=409, detail="session changed")
+
+    monkeypatch.setattr(main.astore, "externalize_user_meta", conflict)
+    before = len(main.registry._active_streams)
+    r = client.post("/api/chat/stream", json={"session_id": session_id, "user_text": "hi"})
+    assert r.status_code == 409
+    assert len(main.registry._active_streams) == before
+
+
+def test_regenerate_of_a_session_deleted_meanwhile_is_404(client, monkeypatch):
+    assert client.post("/api/models/load", json={"provider": "fake", "model_id": "a"}).status_code == 200
+    session_id = client.post("/api/sessions", json={}).json()["id"]
+    main.store.append_message(session_id, {"role": "user", "content": "hi", "meta": {}})
+    main.store.append_message(session_id, {"role": "assistant", "content": "hello"})
+
+    async def gone(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(main.astore, "pop_message", gone)
+    r = client.post("/api/chat/regenerate/stream", json={"session_id": session_id})
+    assert r.status_code == 404
+
+
+
+def _on_app_loop(client, fn):
+    # TestClient reads a response whole; to act mid stream, call the handler on the app's loop
+    return client.portal.call(fn)
+
+
+def _data(frame):
+    return json.loads(frame.split(b"data: ", 1)[1])
+
+
+async def _start_turn():
+    await main.load_model({"provider": "fake", "model_id": "a"})
+    sess = await main.astore.create_session("New Chat")
+    resp = await main.chat_stream({"session_id": sess.id, "user_text": "hi"})
+    frames = resp.body_iterator
+    request_id = _data(await frames.__anext__())["request_id"]
+    async for frame in frames:  # up to the first token
+        if b"event: content" in frame:
+            break
+    return sess.id, request_id, frames
+
+
+async def _reply_meta(session_id, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        messages = (await main.astore.get_session(session_id)).messages
+        if messages[-1]["role"] == "assistant":
+            return messages[-1]["meta"]
+        await asyncio.sleep(0.02)
+    raise AssertionError("no reply was stored")
+
+
+def test_stop_cancels_the_generation(client):
+    async def scenario():
+        session_id, request_id, frames = await _start_turn()
+        assert await main.chat_stop({"request_id": request_id}) == {"ok": True}
+        rest = [frame async for frame in frames]
+        assert _data(rest[-1])["finish_reason"] == "cancelled"
+        assert (await _reply_meta(session_id))["finish_reason"] == "cancelled"
+        assert await main.chat_stop({"request_id": request_id}) == {"ok": False}
+
+    _on_app_loop(client, scenario)
+
+
+def test_generation_without_clients_is_abandoned(client, monkeypatch):
+    monkeypatch.setattr(main.stream_hub, "abandon_after", 0.05)
+
+    async def scenario():
+        session_id, _, frames = await _start_turn()
+        await frames.aclose()  # the client goes away mid reply
+        meta = await _reply_meta(session_id)
+        assert meta["finish_reason"] == "abandoned" and meta["output_chars"] < len("t0 ") * 500
+
+    _on_app_loop(client, scenario)
+
+
+def test_image_that_is_not_base64_is_400(client):
+    assert client.post("/api/models/load", json={"provider": "fake", "model_id": "a"}).status_code == 200
+    session_id = client.post("/api/sessions", json={}).json()["id"]
+    r = client.post("/api/chat/stream", json={"session_id": session_id, "images_b64": ["not base64!"]})
+    assert r.status_code == 400
+    assert main.store.get_session(session_id).messages == []
+
+
+def test_ndjson_backup_streams_both_ways(client):
+    session_id = client.post("/api/sessions", json={"title": "backed up"}).json()["id"]
+    r = client.get("/api/export/sessions.ndjson")
+    assert r.status_code == 200 and r.headers["content-type"].startswith("application/x-ndjson")
+    lines = r.text.splitlines()
+    assert json.loads(lines[0])["format"] == "snlite.sessions.ndjson.v1"
+
+    client.delete(f"/api/sessions/{session_id}/hard")
+    r = client.post("/api/sessions/import.ndjson", content=r.content)
+    assert r.status_code == 200 and r.json()["imported"] == len(lines) - 1
+    assert client.get(f"/api/sessions/{session_id}").json()["title"] == "backed up"
+
+
+def test_bulk_actions(client):
+    ids = [client.post("/api/sessions", json={"title": f"b{i}", "group": "bulk-in"}).json()["id"] for i in range(4)]
+
+    r = client.post("/api/sessions/bulk", json={"action": "set_group", "ids": [*ids[:3], "nope"], "group": "bulk-out"})
+    assert r.json()["counts"] == {"regrouped": 3, "not_found": 1}
+
+    r = client.post("/api/sessions/bulk", json={"action": "archive", "filter": {"group": "bulk-out"}})
+    body = r.json()
+    assert body["counts"] == {"archived": 3}
+    assert all(row["archive"]["session_id"] == row["id"] for row in body["results"])
+    assert client.get(f"/api/sessions/{ids[0]}").status_code == 404
+
+    r = client.post("/api/sessions/bulk", json={"action": "delete", "ids": [ids[3]]})
+    assert r.json()["results"] == [{"id": ids[3], "status": "deleted"}]
+
+    assert client.post("/api/sessions/bulk", json={"action": "explode", "ids": []}).status_code == 400
+    assert client.post("/api/sessions/bulk", json={"action": "delete", "ids": "x"}).status_code == 400
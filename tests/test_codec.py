@@ -0,0 +1,26 @@
+import importlib
+import json
+import sys
+
+from snlite import codec
+
+
+def test_stdlib_fallback_writes_the_same_json(monkeypatch):
+    value = {"text": "中文 ✓", "n": [1, 2.5, None, True], "nested": {"k": "v"}}
+    fast = codec.dumpb(value)
+    monkeypatch.setitem(sys.modules, "orjson", None)  # import fails: stdlib json
+    try:
+        stdlib = importlib.reload(codec)
+        assert stdlib.BACKEND == "json"
+        assert stdlib.dumpb(value) == fast
+        assert stdlib.loads(fast) == value
+        assert stdlib.sse("content", {"token": "x"}, event_id=7) == b'id: 7\nevent: content\ndata: {"token":"x"}\n\n'
+    finally:
+        monkeypatch.undo()
+        importlib.reload(codec)
+
+
+def test_snapshots_are_read_with_stdlib_json(monkeypatch):
+    calls = []
+    monkeypatch.setattr(json, "loads", lambda data: calls.append(data) or {"id": "s"})
+    assert codec.loads_snapshot(b'{"id":"s"}') == {"id": "s"} and calls == [b'{"id":"s"}']
@@ -0,0 +1,108 @@
+import asyncio
+
+import pytest
+
+from snlite.providers.base import Provider
+from snlite.registry import AppRegistry, ModelsBusy
+
+
+class FakeProvider(Provider):
+    name = "fake"
+
+    def __init__(self):
+        self.unloads = 0
+
+    async def list_models(self):
+        return []
+
+    async def load(self, model_id, **kwargs):
+        return {"model_id": model_id}
+
+    async def unload(self):
+        self.unloads += 1
+
+    async def chat(self, model_id, messages, params):
+        return ""
+
+    async def stream_chat(self, model_id, messages, params, cancelled):
+        yield {}
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_models_are_kept_per_provider_and_id():
+    async def main():
+        reg = AppRegistry()
+        p = FakeProvider()
+        await reg.set_provider_and_model(p, "fake", "a", {})
+        b = await reg.add_model(p, "fake", "b", {})
+        assert (await reg.get_loaded_model()).model_id == "a"  # adding does not change the default
+        assert (await reg.get_model("fake", "b")) == (p, b)
+        assert await reg.get_model("other", "b") is None
+        await reg.acquire_model(b)
+        state = await reg.get_state()
+        assert [(m["model_id"], m["streams"]) for m in state["models"]] == [("a", 0), ("b", 1)]
+
+    run(main())
+
+
+def test_unload_waits_for_the_last_stream():
+    async def main():
+        reg = AppRegistry()
+        p = FakeProvider()
+        await reg.set_provider_and_model(p, "fake", "a", {})
+        model = await reg.get_loaded_model()
+        await reg.acquire_model(model)
+        await reg.unload()
+        assert await reg.get_model("fake", "a") is None  # no new streams on it
+        assert p.unloads == 0
+        await reg.release_model(model)
+        assert p.unloads == 1
+        assert (await reg.get_state())["status"] == "idle"
+
+    run(main())
+
+
+def test_provider_stays_loaded_while_another_model_uses_it():
+    async def main():
+        reg = AppRegistry()
+        p = FakeProvider()
+        await reg.set_provider_and_model(p, "fake", "a", {})
+        await reg.add_model(p, "fake", "b", {})
+        await reg.unload("fake", "a")
+        assert p.unloads == 0 and (await reg.get_loaded_model()).model_id == "b"
+        await reg.unload("fake", "b")
+        assert p.unloads == 1
+
+    run(main())
+
+
+def test_warm_set_is_bounded_by_least_recent_idle_model():
+    async def main():
+        reg = AppRegistry(max_models=3)
+        p = FakeProvider()
+        await reg.set_provider_and_model(p, "fake", "default", {})
+        busy = await reg.add_model(p, "fake", "busy", {})
+        await reg.acquire_model(busy)
+        await reg.add_model(p, "fake", "idle", {})
+        await reg.get_model("fake", "default")  # used last, but still evicted last
+        await reg.add_model(p, "fake", "more", {})  # "idle" goes, "busy" is in use
+        assert [m["model_id"] for m in (await reg.get_state())["models"]] == ["busy", "default", "more"]
+
+        await reg.add_model(p, "fake", "again", {})  # only the default and "more" were idle
+        assert [m["model_id"] for m in (await reg.get_state())["models"]] == ["busy", "default", "again"]
+        again = await reg.add_model(p, "fake", "again", {})
+        await reg.acquire_model(again)
+        await reg.add_model(p, "fake", "last", {})  # nothing but the default is idle
+        assert [m["model_id"] for m in (await reg.get_state())["models"]] == ["busy", "again", "last"]
+        assert (await reg.get_loaded_model()).model_id == "again"  # the most recent model left is the default
+        assert p.unloads == 0  # the provider still serves the others
+
+        last = await reg.add_model(p, "fake", "last", {})
+        await reg.acquire_model(last)
+        with pytest.raises(ModelsBusy):
+            await reg.add_model(p, "fake", "one-more", {})
+
+    run(main())
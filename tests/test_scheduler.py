@@ -0,0 +1,95 @@
+import asyncio
+
+import pytest
+
+from snlite.scheduler import BACKGROUND, Scheduler, SchedulerBusy
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_per_model_and_per_provider_limits():
+    async def main():
+        sched = Scheduler(per_provider=2, per_model=1, max_queue=8)
+        await sched.acquire("p", "a")
+        await sched.acquire("p", "b")  # another model on the same provider fits
+        waiter = asyncio.create_task(sched.acquire("p", "c"))  # provider full
+        same_model = asyncio.create_task(sched.acquire("p", "a"))
+        other = asyncio.create_task(sched.acquire("q", "a"))  # other provider: not held back
+        await asyncio.sleep(0)
+        assert other.done() and not waiter.done() and not same_model.done()
+        assert [w["model"] for w in sched.stats()["waiting"]] == ["c", "a"]
+
+        sched.release("p", "b")
+        await asyncio.sleep(0)
+        assert waiter.done() and not same_model.done()
+        sched.release("p", "a")
+        await asyncio.sleep(0)
+        assert same_model.done()
+
+    run(main())
+
+
+def test_full_queue_rejects():
+    async def main():
+        sched = Scheduler(per_provider=0, per_model=1, max_queue=1)
+        await sched.acquire("p", "m")
+        queued = asyncio.create_task(sched.acquire("p", "m"))
+        await asyncio.sleep(0)
+        assert not sched.admits("p", "m")
+        with pytest.raises(SchedulerBusy):
+            await sched.acquire("p", "m")
+        assert sched.stats()["rejected"] == 2
+        sched.release("p", "m")
+        await queued
+        sched.release("p", "m")
+
+    run(main())
+
+
+def test_positions_and_lanes():
+    async def main():
+        sched = Scheduler(per_provider=0, per_model=1, max_queue=8)
+        positions = {"title": [], "chat": []}
+        order = []
+
+        async def take(name, lane):
+            await sched.acquire("p", "m", lane=lane, on_position=positions[name].append)
+            order.append(name)
+
+        await sched.acquire("p", "m")
+        title = asyncio.create_task(take("title", BACKGROUND))
+        await asyncio.sleep(0)
+        chat = asyncio.create_task(take("chat", 0))  # arrives later, served first
+        await asyncio.sleep(0)
+        assert positions == {"title": [1, 2], "chat": [1]}
+
+        sched.release("p", "m")
+        await asyncio.sleep(0)
+        assert order == ["chat"] and positions["title"] == [1, 2, 1]
+        sched.release("p", "m")
+        await title
+        assert order == ["chat", "title"]
+        assert chat.done()
+
+    run(main())
+
+
+def test_cancel_while_queued_frees_the_place():
+    async def main():
+        sched = Scheduler(per_provider=0, per_model=1, max_queue=8)
+        await sched.acquire("p", "m")
+        first = asyncio.create_task(sched.acquire("p", "m"))
+        second = asyncio.create_task(sched.acquire("p", "m"))
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        assert len(sched.stats()["waiting"]) == 1
+
+        sched.release("p", "m")
+        await second
+        stats = sched.stats()
+        assert stats["abandoned"] == 1 and stats["running"] == [{"provider": "p", "model": "m", "count": 1}]
+
+    run(main())
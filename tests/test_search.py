@@ -0,0 +1,68 @@
+import asyncio
+
+from snlite.async_store import AsyncSessionStore
+from snlite.search import SearchIndex, query_terms, tokenize
+
+
+def test_cjk_terms():
+    assert tokenize("Hi 你好世界") == ["hi", "你", "好", "世", "界", "你好", "好世", "世界"]
+    assert query_terms("世界 hi") == ["世界", "hi"]
+
+
+def test_writes_update_the_index_without_rereading(tmp_path, store):
+    index = SearchIndex(store, str(tmp_path / "search.index.json"))
+    astore = AsyncSessionStore(store, search_index=index)
+    reads = []
+    get_session, list_sessions = store.get_session, store.list_sessions
+
+    def total(query, **kw):
+        return index.search(query, **kw)["total"]
+
+    async def main():
+        sess = await astore.create_session("Alpha")
+        await astore.append_message(sess.id, {"role": "user", "content": "banana 你好"})
+        assert total("banana") == 1  # the first query catches up once
+        store.get_session = lambda sid: reads.append(sid) or get_session(sid)
+        store.list_sessions = lambda: reads.append("list") or list_sessions()
+
+        await astore.append_message(sess.id, {"role": "assistant", "content": "cherry"})
+        assert reads == []
+        assert total("cherry") == 1 and total("你好", kind="session") == 1
+        await astore.pop_message(sess.id)
+        assert total("cherry") == 0 and total("banana") == 1
+        await astore.rename_session(sess.id, "Mango")
+        assert total("mango") == 1 and total("alpha") == 0
+        await astore.set_session_group(sess.id, "work")
+        assert index.search("mango")["items"][0]["group"] == "work"
+
+        other = await astore.create_session("Other")
+        await astore.append_message(other.id, {"role": "user", "content": "banana split"})
+        assert total("banana") == 2
+        await astore.delete_session(other.id)
+        assert total("banana") == 1
+        archive = await astore.archive_session(sess.id)
+        assert index.search("banana")["items"][0]["kind"] == "archive"
+        await astore.delete_archive(archive["archive_id"])
+        assert total("banana") == 0
+
+    try:
+        asyncio.run(main())
+    finally:
+        astore.close()
+    assert "list" not in reads
+    store.get_session, store.list_sessions = get_session, list_sessions
+    assert index.refresh() == {"indexed": 0, "removed": 0}
+
+
+def test_refresh_sees_writes_made_elsewhere(tmp_path, store):
+    index = SearchIndex(store, str(tmp_path / "search.index.json"))
+    assert index.search("kiwi")["total"] == 0
+    sess = store.create_session("external")
+    store.append_message(sess.id, {"role": "user", "content": "kiwi"})
+    assert index.search("kiwi")["total"] == 0  # queries do not refresh
+    index.maintain()
+    assert index.search("kiwi")["total"] == 1
+
+    index2 = SearchIndex(store, str(tmp_path / "search.index.json"))  # loaded from disk
+    assert index2.stats()["documents"] == 1
+    assert index2.search("kiwi")["items"][0]["snippet"] == "kiwi"
@@ -0,0 +1,130 @@
+import asyncio
+
+import pytest
+
+from snlite import codec
+from snlite.sse import StreamBuffer, TokenCoalescer
+
+
+def test_coalescer_sends_the_first_token_of_each_kind_at_once():
+    c = TokenCoalescer(interval=0.05)
+    assert c.add("thinking", "a", 0.0) == [("thinking", "a")]
+    assert c.add("thinking", "b", 0.01) == []
+    assert c.due_in(0.01) == pytest.approx(0.04)
+    assert c.add("content", "x", 0.02) == [("thinking", "b"), ("content", "x")]  # order is kept
+    assert c.add("content", "y", 0.03) == [] and c.add("content", "z", 0.04) == []
+    assert c.add("content", "w", 0.07) == [("content", "yzw")]  # interval elapsed
+    assert c.due_in(0.07) is None and c.flush(0.08) == []
+    assert c.stats() == {"tokens": 6, "events": 4}
+
+
+def test_coalescer_flushes_a_full_buffer_and_can_be_disabled():
+    c = TokenCoalescer(interval=10.0, max_bytes=4)
+    c.add("content", "first", 0.0)
+    assert c.add("content", "你", 0.0) == []  # 3 bytes
+    assert c.add("content", "!", 0.0) == [("content", "你!")]
+    assert c.add("content", "ta", 0.0) == []
+    assert c.flush(0.0) == [("content", "ta")]
+
+    c = TokenCoalescer(interval=0)
+    assert [c.add("content", t, 0.0) for t in "ab"] == [[("content", "a")], [("content", "b")]]
+    assert c.due_in(0.0) is None and c.stats() == {"tokens": 2, "events": 2}
+
+
+def _events(frames):
+    out = []
+    for frame in frames:
+        fields = dict(line.split(": ", 1) for line in frame.decode("utf-8").strip().split("\n"))
+        out.append((int(fields["id"]), fields["event"], codec.loads(fields["data"])))
+    return out
+
+
+def _replay(buf, last_id=None):
+    async def collect():
+        return [frame async for frame in buf.follow(last_id)]
+
+    return _events(asyncio.run(collect()))
+
+
+async def _collect(buf, last_id=None):
+    return [frame async for frame in buf.follow(last_id)]
+
+
+def test_resume_after_last_event_id():
+    buf = StreamBuffer(capacity=16)
+    buf.publish("meta", {"request_id": "r"})
+    for token in ("a", "b", "c"):
+        buf.publish("content", {"token": token})
+    buf.publish("done", {"done": True})
+    buf.finish()
+
+    assert [e[0] for e in _replay(buf)] == [1, 2, 3, 4, 5]
+    assert _replay(buf, last_id=3) == [(4, "content", {"token": "c"}), (5, "done", {"done": True})]
+    assert buf.content == "abc"
+
+
+def test_client_behind_the_ring_gets_a_resync():
+    buf = StreamBuffer(capacity=3)
+    buf.publish("thinking", {"token": "hm"})
+    for token in ("a", "b", "c", "d"):
+        buf.publish("content", {"token": token})
+    buf.publish("done", {"done": True})
+    buf.finish()
+
+    events = _replay(buf, last_id=1)
+    # ids 1-6 were published, 4-6 are kept: the text of 1-3 comes as one event
+    assert events[0] == (3, "resync", {"content": "ab", "thinking": "hm"})
+    assert events[1:] == [(4, "content", {"token": "c"}), (5, "content", {"token": "d"}), (6, "done", {"done": True})]
+
+
+def test_follower_sees_events_published_later():
+    async def main():
+        buf = StreamBuffer(capacity=8)
+        follower = asyncio.create_task(_collect(buf))
+        await asyncio.sleep(0)
+        assert buf.followers == 1
+        buf.publish("content", {"token": "x"})
+        buf.finish()
+        return await follower
+
+    assert _events(asyncio.run(main())) == [(1, "content", {"token": "x"})]
+
+
+def test_abandoned_when_no_client_ever_follows():
+    async def main():
+        gone = asyncio.Event()
+        buf = StreamBuffer(abandon_after=0.01, on_abandoned=gone.set)
+        await asyncio.wait_for(gone.wait(), 1)
+        return buf.abandoned
+
+    assert asyncio.run(main())
+
+
+def test_abandoned_after_the_last_follower_left_unless_one_returns():
+    async def main():
+        calls = []
+        buf = StreamBuffer(abandon_after=0.05, on_abandoned=lambda: calls.append(1))
+        follower = asyncio.create_task(_collect(buf))
+        await asyncio.sleep(0.1)
+        assert not calls  # followed the whole time
+        follower.cancel()
+        await asyncio.sleep(0.01)
+        back = asyncio.create_task(_collect(buf))  # reconnects in time
+        await asyncio.sleep(0.1)
+        assert not calls
+        back.cancel()
+        await asyncio.sleep(0.1)
+        assert calls == [1] and buf.abandoned
+
+    asyncio.run(main())
+
+
+def test_finished_stream_is_not_abandoned():
+    async def main():
+        calls = []
+        buf = StreamBuffer(abandon_after=0.01, on_abandoned=lambda: calls.append(1))
+        buf.finish()
+        await asyncio.sleep(0.05)
+        return calls
+
+    assert asyncio.run(main()) == []
@@ -0,0 +1,512 @@
+import base64
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from snlite import codec
+from snlite.blobs import BlobStore, externalize_user_meta, resolve_images
+from snlite.store import (
+    ArchiveRetention,
+    SessionStore,
+    VersionConflict,
+    _LogWriter,
+    archive_partition,
+    iter_ndjson,
+    open_store,
+)
+from snlite.store_sqlite import LEGACY_JSONL_FILES
+
+
+def test_sqlite_migration_copies_then_removes_the_jsonl_files(tmp_path):
+    data_dir = str(tmp_path)
+    jsonl = SessionStore(data_dir)
+    sess = jsonl.create_session("old")
+    jsonl.append_message(sess.id, {"role": "user", "content": "hello", "meta": {"k": 1}})
+    gone = jsonl.create_session("deleted")
+    jsonl.delete_session(gone.id)
+    jsonl.close()
+
+    st = open_store(data_dir, "sqlite")
+    migrated = st.get_session(sess.id)
+    assert (migrated.title, migrated.messages) == ("old", [{"role": "user", "content": "hello", "meta": {"k": 1}}])
+    assert st.get_session(gone.id) is None
+    st.close()
+    assert not set(LEGACY_JSONL_FILES) & set(os.listdir(data_dir))
+
+    # a log left behind by an older version is removed, not migrated again
+    with open(os.path.join(data_dir, "sessions.jsonl"), "w") as f:
+        f.write('{"id":"stale","title":"stale","messages":[]}\n')
+    st = open_store(data_dir, "sqlite")
+    assert [row["id"] for row in st.list_sessions()] == [sess.id]
+    st.close()
+    assert not os.path.exists(os.path.join(data_dir, "sessions.jsonl"))
+
+
+# ---- versions ----
+
+
+def test_conditional_writes_check_the_version(store):
+    sess = store.create_session("t")
+    v0 = sess.version
+    v1 = store.append_message(sess.id, {"role": "user", "content": "a"}, expected_version=v0)
+    assert v1 == v0 + 1
+
+    with pytest.raises(VersionConflict) as err:
+        store.append_message(sess.id, {"role": "user", "content": "b"}, expected_version=v0)
+    assert (err.value.expected, err.value.current) == (v0, v1)
+    with pytest.raises(VersionConflict):
+        store.rename_session(sess.id, "x", expected_version=v0)
+    with pytest.raises(VersionConflict):
+        store.pop_message(sess.id, expected_version=v0)
+    stale = store.get_session(sess.id)
+    store.set_session_group(sess.id, "g")
+    with pytest.raises(VersionConflict):
+        store.save_session(stale, expected_version=v1)
+
+    assert [m["content"] for m in store.get_session(sess.id).messages] == ["a"]
+    assert store.pop_message(sess.id, expected_version=v1 + 1)["content"] == "a"
+
+
+def test_missing_session_is_not_a_conflict(store):
+    assert store.append_message("nope", {"role": "user", "content": "a"}, expected_version=1) is None
+    assert store.pop_message("nope", expected_version=1) is None
+    assert store.rename_session("nope", "x", expected_version=1) is None
+
+
+def test_version_survives_reopen(tmp_path, engine):
+    st = open_store(str(tmp_path), engine)
+    sess = st.create_session("t")
+    version = st.append_message(sess.id, {"role": "user", "content": "a"})
+    st.close()
+    st = open_store(str(tmp_path), engine)
+    assert st.get_session(sess.id).version == version
+    with pytest.raises(VersionConflict):
+        st.append_message(sess.id, {"role": "user", "content": "b"}, expected_version=version - 1)
+    st.close()
+
+
+# ---- blobs ----
+
+
+def _files_containing(root, needle):
+    found = []
+    for dirpath, _, files in os.walk(root):
+        for name in files:
+            path = os.path.join(dirpath, name)
+            with open(path, "rb") as f:
+                if needle in f.read():
+                    found.append(path)
+    return found
+
+
+def test_purge_removes_deleted_content_and_blobs(tmp_path, store, blobs):
+    secret = store.create_session("secret")
+    meta = externalize_user_meta(blobs, {"prompt": "TOPSECRET " * 200}, [])
+    store.append_message(secret.id, {"role": "user", "content": "TOPSECRET hi", "meta": meta})
+    kept = store.create_session("kept")
+    shared = externalize_user_meta(blobs, {"prompt": "SHARED " * 200}, [])
+    store.append_message(kept.id, {"role": "user", "content": "hello", "meta": shared})
+    store.append_message(secret.id, {"role": "user", "content": "again", "meta": shared})
+
+    assert store.delete_session(secret.id)
+    assert store.get_session(secret.id) is None
+    store._background_tick()  # purge_after=0: the purge pass is due at once
+
+    assert _files_containing(str(tmp_path), b"TOPSECRET") == []
+    assert _files_containing(str(tmp_path / "blobs"), b"SHARED")
+    assert store.get_session(kept.id).messages[0]["meta"] == shared
+
+
+def test_blob_references_follow_appends_and_pops(store, blobs):
+    sess = store.create_session("t")
+    image = base64.b64encode(b"PNG").decode()
+    one = externalize_user_meta(blobs, {"prompt": "long " * 300}, [image])
+    two = externalize_user_meta(blobs, {}, [image])
+    store.append_message(sess.id, {"role": "user", "content": "a", "meta": one})
+    store.append_message(sess.id, {"role": "user", "content": "b", "meta": two})
+    (image_digest,) = two["images"]
+    assert store._blob_references() == {one["prompt_blob"]: 1, image_digest: 2}
+    store.pop_message(sess.id)
+    assert store._blob_references() == {one["prompt_blob"]: 1, image_digest: 1}
+    store.delete_session(sess.id)
+    assert store._blob_references() == {}
+
+
+def test_import_replace_releases_the_blobs_of_replaced_sessions(tmp_path, store, blobs):
+    old = store.create_session("old")
+    meta = externalize_user_meta(blobs, {"prompt": "OLDPROMPT " * 200}, [])
+    store.append_message(old.id, {"role": "user", "content": "hi", "meta": meta})
+    store.import_all([{"id": "new", "title": "new", "messages": []}], mode="replace")
+    store._background_tick()
+    assert _files_containing(str(tmp_path), b"OLDPROMPT") == []
+
+
+def test_export_inlines_images_and_import_stores_them_again(tmp_path, engine):
+    image = base64.b64encode(b"\x89PNG image").decode()
+    src_blobs = BlobStore(str(tmp_path / "a" / "blobs"), grace=0)
+    src = open_store(str(tmp_path / "a"), engine, blobs=src_blobs)
+    sess = src.create_session("t")
+    meta = externalize_user_meta(src_blobs, {"prompt": "p " * 600, "has_images": True}, [image])
+    src.append_message(sess.id, {"role": "user", "content": "[Image]", "meta": meta})
+    backup = list(src.iter_export_ndjson())
+    src.close()
+    exported = codec.loads(backup[1])["messages"][0]["meta"]
+    assert exported["images_b64"] == [image] and exported["prompt"] == "p " * 600
+
+    dst_blobs = BlobStore(str(tmp_path / "b" / "blobs"), grace=0)
+    dst = open_store(str(tmp_path / "b"), engine, blobs=dst_blobs)
+    dst.import_all(iter_ndjson(backup[1:]))
+    restored = dst.get_session(sess.id).messages[0]["meta"]
+    assert restored == meta  # hashes again, and the blobs are there
+    assert resolve_images(dst_blobs, restored) == [image]
+    dst.close()
+
+
+def test_invalid_base64_image_is_rejected(blobs):
+    with pytest.raises(ValueError):
+        externalize_user_meta(blobs, {}, ["not base64!"])
+
+
+def test_sqlite_counts_the_blob_references_of_older_databases(tmp_path, blobs):
+    st = open_store(str(tmp_path), "sqlite", blobs=blobs)
+    sess = st.create_session("t")
+    meta = externalize_user_meta(blobs, {"prompt": "long " * 300}, [])
+    st.append_message(sess.id, {"role": "user", "content": "a", "meta": meta})
+    with st._tx():  # as written before the reference table existed
+        st._conn.execute("DELETE FROM blob_refs")
+        st._conn.execute("DELETE FROM meta WHERE key = 'blob_refs'")
+    st.close()
+    st = open_store(str(tmp_path), "sqlite", blobs=blobs)
+    assert st._blob_references() == {meta["prompt_blob"]: 1}
+    st.close()
+
+
+# ---- listing ----
+
+
+def test_session_list_filter(store):
+    for i in range(6):
+        store.create_session(f"Über {i}" if i % 2 else f"chat {i}", group="Work" if i == 4 else "default")
+    page = store.list_sessions_page(limit=2, q="ÜBER")
+    assert [x["title"] for x in page["items"]] == ["Über 5", "Über 3"]
+    rest = store.list_sessions_page(limit=2, q="über", cursor=page["next_cursor"])
+    assert [x["title"] for x in rest["items"]] == ["Über 1"] and rest["next_cursor"] is None
+    assert [x["title"] for x in store.list_sessions_page(q="work")["items"]] == ["chat 4"]
+
+
+def test_legacy_deleted_rows_do_not_shorten_a_page(store):
+    live = [store.create_session(f"live {i}") for i in range(2)]
+    for _ in range(3):
+        store.create_session("__deleted__")  # soft deletes of older versions, newest first
+    page = store.list_sessions_page(limit=2)
+    assert [x["id"] for x in page["items"]] == [s.id for s in reversed(live)]
+    assert page["next_cursor"] is None
+
+
+# ---- log writer ----
+
+
+@pytest.mark.parametrize("policy,fsyncs", [("none", 0), ("interval", 1), ("always", 2)])
+def test_fsync_policy(tmp_path, policy, fsyncs):
+    writer = _LogWriter(str(tmp_path / "log"), fsync=policy, fsync_interval=0.05)
+    writer.wait(writer.submit(b"a\n", 0))
+    writer.wait(writer.submit(b"b\n", 2))
+    time.sleep(0.2)  # interval: one timed fsync covers both lines, without a new write
+    stats = writer.stats()
+    writer.close()
+    assert (stats["records"], stats["fsyncs"], stats["errors"]) == (2, fsyncs, 0)
+    with open(tmp_path / "log", "rb") as f:
+        assert f.read() == b"a\nb\n"
+
+
+def test_interval_writer_idles_when_the_log_is_gone(tmp_path):
+    writer = _LogWriter(str(tmp_path / "log"), fsync="interval", fsync_interval=0.05)
+    batches = []
+    write_batch = writer._write_batch
+    writer._write_batch = lambda *args: (batches.append(args[0]), write_batch(*args))
+    writer.wait(writer.submit(b"a\n", 0))  # written, its fsync is due later
+    os.remove(tmp_path / "log")
+    time.sleep(0.3)
+    writer.close()
+    assert len(batches) <= 2  # the write, then one timed fsync that finds nothing to sync
+
+
+# ---- JSONL delta log ----
+
+
+def test_jsonl_deltas_replay_on_reopen(tmp_path):
+    st = SessionStore(str(tmp_path))
+    sess = st.create_session("first")
+    for i in range(3):
+        st.append_message(sess.id, {"role": "user", "content": f"m{i}", "meta": {"i": i}})
+    st.pop_message(sess.id)
+    st.rename_session(sess.id, "renamed")
+    st.set_session_group(sess.id, "work")
+    before = st.get_session(sess.id)
+    st.close()
+
+    st = SessionStore(str(tmp_path))
+    after = st.get_session(sess.id)
+    assert [m["content"] for m in after.messages] == ["m0", "m1"]
+    assert after.messages[1]["meta"] == {"i": 1}
+    assert (after.title, after.group, after.version) == ("renamed", "work", before.version)
+    assert st.get_session_meta(sess.id)["message_count"] == 2
+    st.close()
+
+
+def test_jsonl_compaction_folds_deltas(tmp_path):
+    st = SessionStore(str(tmp_path))
+    sess = st.create_session("t")
+    for i in range(20):
+        st.append_message(sess.id, {"role": "user", "content": f"m{i}"})
+    version = st.get_session(sess.id).version
+
+    stats = st.compact()
+    assert stats["after"] == 1 and stats["saved"] == 20
+    with open(os.path.join(str(tmp_path), "sessions.jsonl"), "rb") as f:
+        assert len(f.read().splitlines()) == 1
+
+    st.append_message(sess.id, {"role": "assistant", "content": "after"})
+    st.close()
+    st = SessionStore(str(tmp_path))
+    reopened = st.get_session(sess.id)
+    assert len(reopened.messages) == 21 and reopened.messages[-1]["content"] == "after"
+    assert reopened.version == version + 1
+    st.close()
+
+
+def test_background_compacts_once_dead_snapshots_dominate(tmp_path):
+    st = SessionStore(str(tmp_path), compact_min_bytes=0, compact_live_ratio=0.5)
+    sess = st.create_session("t")
+    st._background_tick()
+    assert st.stats()["compaction"]["auto_runs"] == 0  # every record is live
+
+    for i in range(4):
+        sess.title = f"t{i}"
+        st.save_session(sess)  # each full snapshot supersedes the one before
+    assert st.stats()["live_ratio"] == 0.2
+    st._background_tick()
+    stats = st.stats()
+    assert (stats["compaction"]["auto_runs"], stats["total_records"], stats["live_ratio"]) == (1, 1, 1.0)
+    assert st.get_session(sess.id).title == "t3"
+    st.close()
+
+
+# ---- backups ----
+
+
+def test_ndjson_backup_round_trip(tmp_path, store):
+    a = store.create_session("a", group="work")
+    store.append_message(a.id, {"role": "user", "content": "hi", "meta": {"k": 1}})
+    b = store.create_session("b")
+    lines = list(store.iter_export_ndjson())
+    assert codec.loads(lines[0])["count"] == 2  # header
+
+    other = open_store(str(tmp_path / "other"), "sqlite" if isinstance(store, SessionStore) else "jsonl")
+    stats = other.import_all(iter_ndjson([*lines, "not json\n", "\n"]))
+    assert stats == {"imported": 2, "skipped": 1, "total": 2}
+    copy = other.get_session(a.id)
+    assert (copy.title, copy.group, copy.messages) == ("a", "work", [{"role": "user", "content": "hi", "meta": {"k": 1}}])
+
+    store.rename_session(b.id, "newer")
+    assert other.import_all(iter_ndjson(store.iter_export_ndjson()))["imported"] == 2
+    assert other.get_session(b.id).title == "newer"
+    assert other.import_all(iter_ndjson(lines))["skipped"] == 1  # the older backup of b loses
+    assert other.get_session(b.id).title == "newer"
+
+    only = codec.dumps({"id": "x", "title": "x", "messages": []})
+    assert other.import_all(iter_ndjson([only]), mode="replace")["total"] == 1
+    assert [row["id"] for row in other.list_sessions()] == ["x"]
+    other.close()
+
+
+# ---- several processes ----
+
+
+def _append_many(data_dir, engine, session_id, worker, n):
+    st = open_store(data_dir, engine)
+    for i in range(n):
+        st.append_message(session_id, {"role": "user", "content": f"{worker}-{i}"})
+    st.close()
+
+
+def _compact_often(data_dir, engine, n):
+    st = open_store(data_dir, engine)
+    for _ in range(n):
+        st.compact()
+        time.sleep(0.01)
+    st.close()
+
+
+def test_worker_processes_share_the_store(tmp_path, engine):
+    data_dir = str(tmp_path)
+    st = open_store(data_dir, engine)
+    sess = st.create_session("shared")
+    st.flush()
+
+    ctx = multiprocessing.get_context("spawn")
+    procs = [ctx.Process(target=_append_many, args=(data_dir, engine, sess.id, w, 40)) for w in range(3)]
+    procs.append(ctx.Process(target=_compact_often, args=(data_dir, engine, 10)))
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(timeout=60)
+    assert [p.exitcode for p in procs] == [0, 0, 0, 0]
+
+    # the store opened before sees every append, across the rewrites
+    contents = [m["content"] for m in st.get_session(sess.id).messages]
+    for w in range(3):
+        assert [c for c in contents if c.startswith(f"{w}-")] == [f"{w}-{i}" for i in range(40)]
+    assert len(contents) == 120
+    st.close()
+
+
+# ---- purge ----
+
+
+def test_delete_hides_at_once_and_purges_when_due(tmp_path, engine):
+    st = open_store(str(tmp_path), engine, purge_after=3600)
+    gone = st.create_session("gone")
+    st.append_message(gone.id, {"role": "user", "content": "SECRETWORD"})
+    kept = st.create_session("kept")
+    st.flush()
+
+    assert st.delete_session(gone.id) and not st.delete_session(gone.id)
+    assert st.get_session(gone.id) is None
+    assert [row["id"] for row in st.list_sessions()] == [kept.id]
+    st._background_tick()  # not due yet
+    assert st.get_session(kept.id) is not None
+
+    st.purge_after = 0
+    st._background_tick()
+    st.close()
+    assert _files_containing(str(tmp_path), b"SECRETWORD") == []
+    st = open_store(str(tmp_path), engine)
+    assert st.get_session(gone.id) is None and st.get_session(kept.id).title == "kept"
+    st.close()
+
+
+def test_jsonl_tombstone_survives_reopen_before_the_purge(tmp_path):
+    st = SessionStore(str(tmp_path), purge_after=3600)
+    sess = st.create_session("t")
+    st.delete_session(sess.id)
+    st._writer.drain()
+    assert _files_containing(str(tmp_path), sess.id.encode())  # still in the log
+    st._writer.close()  # crash: no purge on close
+
+    st = SessionStore(str(tmp_path), purge_after=3600)
+    assert st.get_session(sess.id) is None and st.stats()["tombstones"] == 1
+    st.close()
+
+
+# ---- bulk ----
+
+
+def test_bulk_selection_and_archive(store):
+    old = [store.create_session(f"old {i}", group="g") for i in range(2)]
+    cutoff = time.time()
+    time.sleep(0.01)
+    new = store.create_session("new", group="g")
+    assert store.select_sessions(["b", "a", "b"]) == ["b", "a"]
+    assert set(store.select_sessions(group="g", updated_before=cutoff)) == {s.id for s in old}
+    with pytest.raises(ValueError):
+        store.select_sessions()
+
+    out = store.archive_sessions([old[0].id, "nope", old[1].id])
+    assert out["nope"] is None and {out[s.id]["session_id"] for s in old} == {s.id for s in old}
+    assert [row["id"] for row in store.list_sessions()] == [new.id]
+    assert {a["session_id"] for a in store.list_archives()} == {s.id for s in old}
+    assert store.set_sessions_group([new.id, "nope"], "h") == {new.id: True, "nope": False}
+    assert store.get_session(new.id).group == "h"
+
+
+# ---- archives ----
+
+
+@pytest.mark.parametrize("compression", ["gzip", "none"])
+def test_archive_is_written_under_its_month(tmp_path, engine, compression):
+    st = open_store(str(tmp_path), engine, archive_compression=compression)
+    sess = st.create_session("kept")
+    st.append_message(sess.id, {"role": "user", "content": "hello archive"})
+    row = st.archive_session(sess.id)
+    assert row["partition"] == archive_partition(row["archived_at"])
+    assert os.path.dirname(row["file_path"]) == os.path.join(st.archives_dir, row["partition"])
+    assert row["file_name"].endswith(".txt.gz" if compression == "gzip" else ".txt")
+    assert row["file_bytes"] == os.path.getsize(row["file_path"])
+    assert "hello archive" in st.get_archive(row["archive_id"])["content"]
+    st.close()
+
+
+def test_archives_stay_readable_across_compression_settings(tmp_path, engine):
+    st = open_store(str(tmp_path), engine, archive_compression="none")
+    plain = st.archive_session(st.create_session("plain").id)
+    st.close()
+    st = open_store(str(tmp_path), engine, archive_compression="gzip")
+    packed = st.archive_session(st.create_session("packed").id)
+    assert st.get_archive(plain["archive_id"])["content"].startswith("# plain")
+    assert st.get_archive(packed["archive_id"])["content"].startswith("# packed")
+
+    assert st.delete_archive(plain["archive_id"]) and not os.path.exists(plain["file_path"])
+    assert st.get_archive(plain["archive_id"]) is None and not st.delete_archive(plain["archive_id"])
+    assert [a["archive_id"] for a in st.list_archives()] == [packed["archive_id"]]
+    st.close()
+
+
+def test_archive_index_cache_follows_other_writers(tmp_path):
+    a, b = SessionStore(str(tmp_path)), SessionStore(str(tmp_path))
+    first = a.archive_session(a.create_session("one").id)
+    assert [x["archive_id"] for x in b.list_archives()] == [first["archive_id"]]
+    time.sleep(0.01)
+    second = a.archive_session(a.create_session("two").id)  # appended past b's cached end
+    assert [x["archive_id"] for x in b.list_archives()] == [second["archive_id"], first["archive_id"]]
+    assert b.get_archive(second["archive_id"])["title"] == "two"
+
+    a.delete_archive(first["archive_id"])  # the file is replaced, b reads it again
+    assert [x["archive_id"] for x in b.list_archives()] == [second["archive_id"]]
+    a.close()
+    b.close()
+
+
+def _archive_in_months(st, months):
+    # one archive per "YYYY-MM", written as if on the 15th of that month
+    rows = []
+    for month in months:
+        at = time.mktime(time.strptime(f"{month}-15", "%Y-%m-%d"))
+        with pytest.MonkeyPatch.context() as mp:
+            mp.setattr(time, "time", lambda: at)
+            rows.append(st.archive_session(st.create_session(month).id))
+    return rows
+
+
+def test_retention_evicts_whole_months_oldest_first(store):
+    rows = _archive_in_months(store, ["2024-01", "2024-01", "2024-02", "2024-03"])
+    assert [row["partition"] for row in rows] == ["2024-01", "2024-01", "2024-02", "2024-03"]
+
+    store.archive_retention = ArchiveRetention(max_count=3)
+    out = store.enforce_archive_retention()
+    assert out["evicted_partitions"] == ["2024-01"] and out["evicted_archives"] == 2
+    assert not os.path.exists(os.path.join(store.archives_dir, "2024-01"))
+    assert not os.path.exists(rows[0]["file_path"])
+    assert {a["partition"] for a in store.list_archives()} == {"2024-02", "2024-03"}
+    assert store.retention_stats()["evicted_archives"] == 2
+
+    store.archive_retention = ArchiveRetention(max_count=1)
+    assert store.enforce_archive_retention()["evicted_partitions"] == ["2024-02"]
+    store.archive_retention = ArchiveRetention(max_bytes=1)
+    assert store.enforce_archive_retention()["evicted_partitions"] == []  # the newest month stays
+    assert [a["partition"] for a in store.list_archives()] == ["2024-03"]
+
+
+def test_retention_by_age_and_bytes(store):
+    rows = _archive_in_months(store, ["2024-01", "2024-02", "2024-03"])
+    now = rows[-1]["archived_at"]
+
+    store.archive_retention = ArchiveRetention(max_age=40 * 86400)
+    assert store.enforce_archive_retention(now)["evicted_partitions"] == ["2024-01"]  # 2024-02 is 29 days old
+
+    store.archive_retention = ArchiveRetention(max_bytes=rows[-1]["file_bytes"])
+    out = store.enforce_archive_retention(now)
+    assert out["evicted_partitions"] == ["2024-02"] and out["archive_bytes"] == rows[-1]["file_bytes"]
+    assert store.enforce_archive_retention(now)["evicted_partitions"] == []